@@ -0,0 +1,253 @@
+"""
+Downloads a file from a local server with injected faults across engines, thread counts and sizes,
+and writes the throughput, cpu time per GB, syscalls and peak memory of every run as JSON
+
+    python benchmarks/bench_download.py --size 64 256 --threads 1 4 8 --out results.json
+
+every download runs in a process of its own so its resource usage is measured apart from the server's.
+The syscalls are counted with `strace -c` when `--strace` is passed, otherwise only the file reads and writes
+of /proc/self/io (linux) are, along with the context switches.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from itertools import product
+from os.path import dirname, getsize, isfile, join, realpath
+from shutil import which
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time, time
+
+sys.path.insert(0, dirname(dirname(realpath(__file__))))
+
+from dl.writer import PARTS, WRITE_MODES
+
+# server options of every scenario, see `server.serve`
+SCENARIOS = {
+    "fast": {},
+    "latency": {"latency": 0.05},
+    "capped": {"rate": 20 * 1024 * 1024},
+    "drops": {"drop": 0.2},
+    "no-ranges": {"ranges": False},
+}
+ENGINES = ("threads", "async")
+
+
+def _syscalls() -> dict:
+    """read and write syscalls of this process so far, linux only"""
+    try:
+        with open("/proc/self/io") as f:
+            io = dict(i.split(": ") for i in f.read().splitlines())
+    except OSError:
+        return {}
+    return {"read": int(io["syscr"]), "write": int(io["syscw"])}
+
+
+def parse_strace_summary(text: str) -> dict:
+    """syscall -> calls from the table of `strace -c`"""
+    res = {}
+    end = None
+    for line in text.splitlines():
+        if "calls" in line and "syscall" in line:
+            # the numbers are right aligned with the column titles
+            end = line.index("calls") + len("calls")
+            continue
+        if end is None or line.startswith("-") or not line.strip():
+            continue
+        name = line.split()[-1]
+        calls = line[:end].split()
+        if calls and calls[-1].isdigit():
+            res[name] = int(calls[-1])
+    return res
+
+
+def child(spec: dict) -> dict:
+    """one download, in the child process"""
+    from dl import AsyncDownloader, Downloader
+    from dl.report import set_quiet
+
+    set_quiet()
+    before = _syscalls()
+    start, cpu = perf_counter(), process_time()
+    options = {"f": "out.bin", "d": spec["dir"], "write_mode": spec["write_mode"]}
+    if spec["engine"] == "async":
+        d = AsyncDownloader(spec["url"], **options)
+        asyncio.run(d.start(spec["threads"]))
+    else:
+        d = Downloader(spec["url"], **options)
+        d.start(spec["threads"])
+    wall, cpu = perf_counter() - start, process_time() - cpu
+    after = _syscalls()
+    return {
+        "wall": wall,
+        # without the start up of the interpreter
+        "cpu": cpu,
+        "size": getsize(join(spec["dir"], "out.bin")),
+        "syscalls": {k: after[k] - before[k] for k in after} if after else None,
+    }
+
+
+def run_case(
+    url: str, engine: str, write_mode: str, threads: int, strace: bool = False
+) -> dict:
+    """download `url` in a child process
+
+    Returns:
+        dict: what `child` measured, with the cpu time, context switches and peak memory of the whole process
+    """
+    with TemporaryDirectory() as d, open(join(d, "stderr"), "w+b") as err:
+        spec = {
+            "url": url,
+            "engine": engine,
+            "write_mode": write_mode,
+            "threads": threads,
+            "dir": d,
+        }
+        cmd = [sys.executable, realpath(__file__), "--child", json.dumps(spec)]
+        trace = join(d, "strace")
+        if strace:
+            cmd = ["strace", "-f", "-c", "-o", trace] + cmd
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+        out = p.stdout.read()
+        # the usage of this child alone, `RUSAGE_CHILDREN` would add up all of them
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        error = err.read().decode(errors="replace").strip()
+        if isfile(trace):
+            with open(trace) as f:
+                calls = parse_strace_summary(f.read())
+        else:
+            calls = None
+    if p.returncode:
+        return {"ok": False, "error": error[-500:]}
+    res = json.loads(out)
+    if calls is not None:
+        res["syscalls"] = {"total": calls.pop("total", sum(calls.values())), **calls}
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "ok": True,
+        **res,
+        "process_cpu": usage.ru_utime + usage.ru_stime,
+        "context_switches": usage.ru_nvcsw + usage.ru_nivcsw,
+        "peak_rss": rss,
+    }
+
+
+def bench(
+    sizes, threads, engines, scenarios, write_modes, repeat: int = 1, strace=False
+) -> list:
+    """run every combination, the server of a scenario serves every size"""
+    from server import serve
+
+    results = []
+    run = 0
+    for scenario in scenarios:
+        for size in sizes:
+            server = serve(bytes(size * 1024 * 1024), **SCENARIOS[scenario])
+            cases = product(engines, write_modes, threads, range(repeat))
+            for engine, mode, t, _ in cases:
+                run += 1
+                # a new url every run, nothing is resumed or read from the probe cache
+                url = f"http://127.0.0.1:{server.server_port}/{run}/file.bin"
+                res = run_case(url, engine, mode, t, strace)
+                res.update(scenario=scenario, engine=engine, write_mode=mode, threads=t)
+                if res["ok"]:
+                    res["ok"] = res["size"] == len(server.payload)
+                res["size"] = len(server.payload)
+                if res["ok"]:
+                    res["throughput"] = res["size"] / res["wall"]
+                    res["cpu_per_gb"] = res["cpu"] / (res["size"] / 1024**3)
+                results.append(res)
+                _print(res)
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+def _print(res: dict) -> None:
+    case = (
+        f"{res['scenario']:<10} {res['size'] // (1024 * 1024):>5} MB {res['engine']:<7} "
+        f"{res['write_mode']:<8} t={res['threads']:<3}"
+    )
+    if not res["ok"]:
+        print(f"{case} FAILED {res.get('error', 'size mismatch')}")
+        return
+    calls = res["syscalls"]
+    calls = calls.get("total", sum(calls.values())) if calls else "-"
+    print(
+        f"{case} {res['throughput'] / (1024 * 1024):>8.1f} MB/s  cpu/GB: {res['cpu_per_gb']:.2f}s  "
+        f"syscalls: {calls}  ctx switches: {res['context_switches']}  rss: {res['peak_rss'] // (1024 * 1024)} MB"
+    )
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=dirname(realpath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Benchmark whole downloads against a local server"
+    )
+    parser.add_argument("--child", help=("internal, runs one download"))
+    parser.add_argument(
+        "--size", type=int, nargs="+", default=[64], help="file sizes in MB"
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--engine", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument(
+        "--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--write-mode", nargs="+", choices=WRITE_MODES, default=[PARTS])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--strace", action="store_true", help="count every syscall with strace -c"
+    )
+    parser.add_argument(
+        "--out", default="bench_download.json", help="JSON results file"
+    )
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(json.loads(args.child))))
+        raise SystemExit(0)
+    if args.strace and not which("strace"):
+        parser.error("strace is not installed")
+    started = time()
+    results = bench(
+        args.size,
+        args.threads,
+        args.engine,
+        args.scenario,
+        args.write_mode,
+        args.repeat,
+        args.strace,
+    )
+    with open(args.out, "w") as f:
+        json.dump(
+            {
+                "started": started,
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"results written to {args.out}")
+    raise SystemExit(0 if all(i["ok"] for i in results) else 1)
@@ -0,0 +1,123 @@
+"""
+Measures how long the interpreter takes to start up with `dl` with `python -X importtime`,
+for `import dl`, `download.py --help` and a download that fails on an existing file
+
+    python benchmarks/bench_startup.py --repeat 10 --out startup.json
+
+every case is run in a fresh interpreter, the medians of the wall time and of the time spent importing
+(without `site`, which is the same for any script) are reported along with the slowest imports.
+`--max-import-ms` fails the run if a case imports for longer than that.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+from compileall import compile_dir
+from os.path import dirname, join, realpath
+from statistics import median
+from tempfile import NamedTemporaryFile
+from time import perf_counter, time
+
+ROOT = dirname(dirname(realpath(__file__)))
+SCRIPT = join(ROOT, "download.py")
+# imported by a download, but not needed just to start up
+HEAVY = ("requests", "urllib3", "asyncio", "ssl", "sqlite3", "http.client")
+
+
+def parse_importtime(text: str) -> list:
+    """(module, self µs, cumulative µs, nesting level) for every line of `-X importtime`"""
+    res = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented by two spaces per level
+        level = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        res.append((name.strip(), int(own), int(cumulative), level))
+    return res
+
+
+def run_case(args: list) -> dict:
+    """one interpreter running `args` with `-X importtime`"""
+    start = perf_counter()
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall = perf_counter() - start
+    imports = parse_importtime(p.stderr)
+    return {
+        "wall": wall,
+        "returncode": p.returncode,
+        "import_us": sum(c for m, _, c, level in imports if level == 0 and m != "site"),
+        "modules": {m: own for m, own, _, _ in imports},
+        "heavy": [m for m in HEAVY if any(i[0] == m for i in imports)],
+    }
+
+
+def bench(cases: dict, repeat: int, top: int) -> list:
+    results = []
+    for name, args in cases.items():
+        runs = [run_case(args) for _ in range(repeat)]
+        modules = runs[-1]["modules"]
+        res = {
+            "case": name,
+            "args": args,
+            "returncode": runs[-1]["returncode"],
+            "wall": median(r["wall"] for r in runs),
+            "import_ms": median(r["import_us"] for r in runs) / 1000,
+            "heavy": runs[-1]["heavy"],
+            "slowest": sorted(modules.items(), key=lambda i: -i[1])[:top],
+        }
+        results.append(res)
+        print(
+            f"{name:<14} wall: {res['wall'] * 1000:>7.1f} ms  imports: {res['import_ms']:>7.1f} ms  "
+            f"exit: {res['returncode']}  heavy: {', '.join(res['heavy']) or '-'}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark the start up time of download.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to keep")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--out", default="bench_startup.json", help="JSON results file")
+    args = parser.parse_args()
+    # with PYTHONDONTWRITEBYTECODE every run would compile the package again
+    compile_dir(join(ROOT, "dl"), quiet=1)
+    with NamedTemporaryFile(suffix=".bin") as existing:
+        cases = {
+            "python": ["-c", "pass"],
+            "import dl": ["-c", "import dl"],
+            "--help": [SCRIPT, "--help"],
+            # fails before any request is made
+            "existing file": [SCRIPT, "http://127.0.0.1:9/f.bin", "-f", existing.name],
+        }
+        started = time()
+        results = bench(cases, args.repeat, args.top)
+    with open(args.out, "w") as f:
+        json.dump(
+            {
+                "started": started,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"results written to {args.out}")
+    slow = [
+        r["case"]
+        for r in results
+        if args.max_import_ms is not None and r["import_ms"] > args.max_import_ms
+    ]
+    if slow:
+        print(f"imports took longer than {args.max_import_ms} ms: {', '.join(slow)}")
+    raise SystemExit(1 if slow else 0)
@@ -0,0 +1,63 @@
+"""
+Compares the old 2KB `iter_content` loop with `dl.stream.stream_response`
+against a local server
+
+    python benchmarks/bench_stream.py --size 256
+"""
+
+import sys
+from os import devnull
+from os.path import dirname, realpath
+from time import perf_counter, process_time
+
+sys.path.insert(0, dirname(dirname(realpath(__file__))))
+
+import requests
+from dl.stream import stream_response
+from server import serve
+
+
+def iter_content_2k(r, f):
+    for c in r.iter_content(chunk_size=2048):
+        if c:
+            f.write(c)
+
+
+def iter_content_1m(r, f):
+    for c in r.iter_content(chunk_size=1024 * 1024):
+        if c:
+            f.write(c)
+
+
+def readinto_adaptive(r, f):
+    stream_response(r, f.write)
+
+
+def run(url: str, fn, repeat: int):
+    best = None
+    with requests.Session() as s, open(devnull, "wb", buffering=0) as f:
+        for _ in range(repeat):
+            wall, cpu = perf_counter(), process_time()
+            with s.get(url, stream=True) as r:
+                fn(r, f)
+            res = (perf_counter() - wall, process_time() - cpu)
+            best = res if best is None or res[0] < best[0] else best
+    return best
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark the response streaming loops")
+    parser.add_argument("--size", type=int, default=128, help="payload size in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    size = args.size * 1024 * 1024
+    server = serve(bytes(size))
+    url = f"http://127.0.0.1:{server.server_port}/"
+    for fn in (iter_content_2k, iter_content_1m, readinto_adaptive):
+        wall, cpu = run(url, fn, args.repeat)
+        print(
+            f"{fn.__name__:<20} {size / wall / (1024 * 1024):>8.1f} MB/s  cpu: {cpu:.2f}s"
+        )
+    server.shutdown()
@@ -0,0 +1,122 @@
+"""
+A small local HTTP server that supports range requests, used by the benchmarks
+"""
+
+import re
+import socket
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Thread
+from time import monotonic, sleep
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """serves `server.payload` (bytes) for every path,
+    with the faults set on the server (see `serve`) injected into the responses"""
+
+    protocol_version = "HTTP/1.1"
+    block_size = 64 * 1024
+    # responses this small are metadata probes, they are never dropped
+    probe_size = 64 * 1024
+
+    def log_message(self, *args):
+        pass
+
+    def _get_range(self, size: int):
+        if not self.server.ranges:
+            return None
+        m = _RANGE_RE.match(self.headers.get("range", ""))
+        if not m:
+            return None
+        start, end = m.groups()
+        if not start:
+            return size - int(end), size - 1
+        return int(start), min(int(end), size - 1) if end else size - 1
+
+    def _send_headers(self):
+        payload = self.server.payload
+        size = len(payload)
+        rng = self._get_range(size)
+        start, end = rng or (0, size - 1)
+        if self.server.latency:
+            sleep(self.server.latency)
+        self.send_response(206 if rng else 200)
+        if self.server.ranges:
+            self.send_header("accept-ranges", "bytes")
+        self.send_header("content-type", "application/octet-stream")
+        self.send_header("content-length", str(end - start + 1))
+        if rng:
+            self.send_header("content-range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        start, end = self._send_headers()
+        server = self.server
+        stop = end + 1
+        if end - start >= self.probe_size and server.rng.random() < server.drop:
+            stop = server.rng.randint(start, end)
+        view = memoryview(server.payload)
+        began = monotonic()
+        for i in range(start, stop, self.block_size):
+            self.wfile.write(view[i : min(i + self.block_size, stop)])
+            if server.rate:
+                # sleep until the bytes sent so far fit the rate
+                ahead = (i - start + self.block_size) / server.rate - (
+                    monotonic() - began
+                )
+                if ahead > 0:
+                    sleep(ahead)
+        if stop != end + 1:
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients close connections they have read enough of, i.e. the probe of a server without ranges
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(
+    payload: bytes,
+    handler=RangeRequestHandler,
+    latency: float = 0,
+    rate: float = 0,
+    drop: float = 0,
+    ranges: bool = True,
+    seed: int = 0,
+) -> ThreadingHTTPServer:
+    """starts a server on a random local port in a daemon thread
+
+    Args:
+        payload (bytes): the file to serve
+        handler (optional): request handler class. Defaults to RangeRequestHandler.
+        latency (float, optional): seconds every response waits before its headers. Defaults to 0.
+        rate (float, optional): bytes per second of every connection, unlimited when 0. Defaults to 0.
+        drop (float, optional): chance that a response is cut off at a random byte. Defaults to 0.
+        ranges (bool, optional): whether range requests are supported. Defaults to True.
+        seed (int, optional): seed of the dropped responses. Defaults to 0.
+
+    Returns:
+        ThreadingHTTPServer: the running server, its url is `http://127.0.0.1:{server.server_port}/`
+    """
+    server = _Server(("127.0.0.1", 0), handler)
+    server.payload = payload
+    server.latency = latency
+    server.rate = rate
+    server.drop = drop
+    server.ranges = ranges
+    server.rng = Random(seed)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,4 +1,14 @@
 from .util import *
 from .url import URL
+from .pool import SessionPool, default_pool, get_session, stats as pool_stats
+from .probe import ProbeCache, probe_cache
 
-__all__ = ["URL"]
+__all__ = [
+    "URL",
+    "SessionPool",
+    "default_pool",
+    "get_session",
+    "pool_stats",
+    "ProbeCache",
+    "probe_cache",
+]
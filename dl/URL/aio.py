@@ -0,0 +1,224 @@
+"""
+Minimal asyncio HTTP/1.1 client, just enough for HEAD and (range) GET requests
+without adding a dependency
+"""
+
+import asyncio
+import ssl
+from typing import Optional
+from urllib.parse import urljoin, urlparse, urlunparse
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+_ssl_context = None
+
+
+class HTTPStatusError(IOError):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class AsyncResponse(object):
+    """a response whose body has not been read yet
+
+    Attributes:
+        url (str): final url after redirects
+        status_code (int): http status code
+        reason (str): http reason phrase
+        headers (dict): response headers with lower case keys
+    """
+
+    def __init__(
+        self,
+        url: str,
+        method: str,
+        status_code: int,
+        reason: str,
+        headers: dict,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.url = url
+        # seconds every read of the body may take, set by `fetch`
+        self.read_timeout = None
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self._chunk_left = 0
+        self._eof = False
+        self._remaining = None
+        if method == "HEAD" or status_code in (204, 304) or status_code < 200:
+            self._remaining = 0
+        elif not self._chunked and "content-length" in headers:
+            self._remaining = int(headers["content-length"])
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise HTTPStatusError(
+                f"{self.status_code} {self.reason} for url: {self.url}",
+                self.status_code,
+            )
+
+    async def _recv(self, n: int) -> bytes:
+        if not self.read_timeout:
+            return await self._reader.read(n)
+        try:
+            return await asyncio.wait_for(self._reader.read(n), self.read_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No data for {self.read_timeout}s from {self.url}")
+
+    async def _read_chunked(self, n: int) -> bytes:
+        if not self._chunk_left:
+            line = await self._reader.readline()
+            size = int(line.split(b";")[0].strip() or b"0", 16)
+            if not size:
+                # skip the trailers
+                while (await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                self._eof = True
+                return b""
+            self._chunk_left = size
+        data = await self._recv(min(n, self._chunk_left))
+        if not data:
+            raise ConnectionError("Connection closed in the middle of a chunk")
+        self._chunk_left -= len(data)
+        if not self._chunk_left:
+            await self._reader.readexactly(2)
+        return data
+
+    async def read(self, n: int = 64 * 1024) -> bytes:
+        """read up to `n` bytes of the body
+
+        Returns:
+            bytes: the data, empty once the body has been read
+        """
+        if self._eof:
+            return b""
+        if self._chunked:
+            return await self._read_chunked(n)
+        if self._remaining is None:
+            data = await self._recv(n)
+        elif not self._remaining:
+            data = b""
+        else:
+            data = await self._recv(min(n, self._remaining))
+            if not data:
+                raise ConnectionError(
+                    f"Connection closed with {self._remaining} bytes left to read"
+                )
+            self._remaining -= len(data)
+        if not data:
+            self._eof = True
+        return data
+
+    def close(self) -> None:
+        self._writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+
+async def _send(url: str, method: str, headers: dict, read_limit: int):
+    p = urlparse(url)
+    is_https = p.scheme == "https"
+    reader, writer = await asyncio.open_connection(
+        p.hostname,
+        p.port or (443 if is_https else 80),
+        ssl=_get_ssl_context() if is_https else None,
+        limit=read_limit,
+    )
+    path = urlunparse(("", "", p.path or "/", p.params, p.query, ""))
+    host = p.hostname + (f":{p.port}" if p.port else "")
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}"]
+    for k, v in headers.items():
+        if k.lower() not in ("host", "connection", "accept-encoding"):
+            lines.append(f"{k}: {v}")
+    # bodies are written to disk as they are, so ask for them unencoded
+    lines.extend(("Accept-Encoding: identity", "Connection: close", "", ""))
+    writer.write("\r\n".join(lines).encode("latin-1"))
+    await writer.drain()
+    status_line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        writer.close()
+        raise ConnectionError(f"Invalid status line: {status_line!r}")
+    res_headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if not line:
+            break
+        k, _, v = line.partition(":")
+        k, v = k.strip().lower(), v.strip()
+        res_headers[k] = f"{res_headers[k]}, {v}" if k in res_headers else v
+    return AsyncResponse(
+        url,
+        method,
+        int(parts[1]),
+        parts[2] if len(parts) > 2 else "",
+        res_headers,
+        reader,
+        writer,
+    )
+
+
+async def fetch(
+    url: str,
+    method: str = "GET",
+    headers: dict = None,
+    max_redirects: int = 10,
+    read_limit: int = 1024 * 1024,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+) -> AsyncResponse:
+    """send a request and read the response headers, following redirects
+
+    Args:
+        url (str): the url
+        method (str, optional): "GET" or "HEAD". Defaults to "GET".
+        headers (dict, optional): request headers. Defaults to None.
+        max_redirects (int, optional): Defaults to 10.
+        read_limit (int, optional): size of the connection's read buffer. Defaults to 1MB.
+        connect_timeout (Optional[float], optional): seconds to wait for the connection and the response headers. Defaults to None.
+        read_timeout (Optional[float], optional): seconds to wait for every read of the body. Defaults to None.
+
+    Raises:
+        ConnectionError: too many redirects or a malformed response
+        TimeoutError: the server took longer than the timeouts
+
+    Returns:
+        AsyncResponse: the response, its body has to be read with `read` and it has to be closed
+    """
+    method = method.upper()
+    for _ in range(max_redirects + 1):
+        try:
+            res = await asyncio.wait_for(
+                _send(url, method, headers or {}, read_limit), connect_timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response from {url} in {connect_timeout}s")
+        res.read_timeout = read_timeout
+        location = res.headers.get("location")
+        if res.status_code not in _REDIRECT_CODES or not location:
+            return res
+        res.close()
+        url = urljoin(url, location)
+        if res.status_code == 303 and method != "HEAD":
+            method = "GET"
+    raise ConnectionError(f"Exceeded {max_redirects} redirects")
@@ -1,3 +1,6 @@
+from warnings import warn
+
+
 def warn_requests():
     return warn(
         "[Warning] No requests package found!\n \
@@ -8,7 +11,7 @@ all URL methods that require requests library will throw exceptions \
 
 
 def warn_refetch(url):
-    return print(
+    return warn(
         f"[Warning]The URL \"{str(url)[:50]}\" \
 has already been refetched, if it was intentional, \
 pass refetch=True or use 'URL.refetch'\n\
@@ -18,13 +21,13 @@ network requests in case of erroneous loops"
 
 
 def warn_first_fetch(url):
-    return print(
-        '[Warning]Thr url "{str(url)[:50]}" \
+    return warn(
+        f'[Warning]Thr url "{str(url)[:50]}" \
 has never veen fetched before..did you mean to fetch it?'
     )
 
 
 def warn_no_hash(hash_method):
-    return print(
+    return warn(
         f"[Warning] hashlib does not support the method {hash_method}...falling back to sha256"
     )
@@ -0,0 +1,162 @@
+"""
+Process wide connection pool shared by URL objects, so that keep-alive
+connections are reused across requests, threads and downloads
+"""
+
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+# requests.adapters.DEFAULT_POOLSIZE, requests and urllib3 are only imported with the first session
+DEFAULT_POOLSIZE = 10
+
+
+class PoolStats(object):
+    """counts requests and the connections opened for them
+
+    Attributes:
+        requests (int): connections checked out of a pool (one per request)
+        new_connections (int): sockets that had to be connected
+        tls_handshakes (int): new connections that were https
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def _add(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    @property
+    def reused(self) -> int:
+        return max(0, self.requests - self.new_connections)
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused": self.reused,
+            "tls_handshakes": self.tls_handshakes,
+        }
+
+
+stats = PoolStats()
+
+
+_adapter_class = None
+
+
+def _counting_adapter_class():
+    """the `HTTPAdapter` whose pools count into `stats`, defined on first use"""
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    # a pooled connection object that was dropped reconnects lazily,
+    # so the sockets are counted in connect() rather than when the pool creates the object
+    class _CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            stats._add("new_connections")
+            return super().connect()
+
+    class _CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            stats._add("new_connections")
+            stats._add("tls_handshakes")
+            return super().connect()
+
+    class _CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _CountingHTTPConnection
+
+        def _get_conn(self, timeout=None):
+            stats._add("requests")
+            return super()._get_conn(timeout)
+
+    class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _CountingHTTPSConnection
+
+        def _get_conn(self, timeout=None):
+            stats._add("requests")
+            return super()._get_conn(timeout)
+
+    class _CountingAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPConnectionPool,
+                "https": _CountingHTTPSConnectionPool,
+            }
+
+    _adapter_class = _CountingAdapter
+    return _adapter_class
+
+
+class SessionPool(object):
+    """owns a `requests.Session` whose adapters keep `pool_maxsize` connections per host
+
+    Args:
+        pool_connections (int, optional): number of hosts to keep pools for. Defaults to DEFAULT_POOLSIZE.
+        pool_maxsize (int, optional): connections kept alive per host. Defaults to DEFAULT_POOLSIZE.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOLSIZE,
+        pool_maxsize: int = DEFAULT_POOLSIZE,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._lock = Lock()
+
+    def _mount(self, session: "requests.Session") -> None:
+        adapter = _counting_adapter_class()
+        for prefix in ("http://", "https://"):
+            session.mount(
+                prefix,
+                adapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                ),
+            )
+
+    @property
+    def session(self) -> "requests.Session":
+        with self._lock:
+            if self._session is None:
+                import requests
+
+                self._session = requests.Session()
+                self._mount(self._session)
+            return self._session
+
+    def configure(self, pool_connections: int = None, pool_maxsize: int = None):
+        """change the pool sizes, idle connections of the old pools are dropped"""
+        with self._lock:
+            self.pool_connections = pool_connections or self.pool_connections
+            self.pool_maxsize = pool_maxsize or self.pool_maxsize
+            if self._session is not None:
+                self._mount(self._session)
+
+    def ensure_pool_size(self, n: int) -> None:
+        """grow the per host pool to at least `n` connections, i.e. the number of threads using it"""
+        if n > self.pool_maxsize:
+            self.configure(pool_maxsize=n)
+
+
+default_pool = SessionPool()
+
+
+def get_session() -> "requests.Session":
+    return default_pool.session
@@ -0,0 +1,114 @@
+"""
+Probing a url with a single `Range: bytes=0-N` request and remembering where it redirects to
+"""
+
+import os
+from json import dump as _dump, load as _load
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+
+PROBE_SIZE = 64 * 1024
+
+
+def range_probe_headers(status_code: int, headers) -> dict:
+    """turns the headers of a response to `Range: bytes=0-N` into the headers of the whole resource
+
+    Args:
+        status_code (int): 206 if the server honoured the range
+        headers (Mapping): response headers
+
+    Returns:
+        dict: headers with lower case keys, `content-length` is the size of the whole resource
+    """
+    h = {k.lower(): v for k, v in headers.items()}
+    if status_code != 206:
+        return h
+    total = h.pop("content-range", "").rpartition("/")[2].strip()
+    if total.isdigit():
+        h["content-length"] = total
+    else:
+        h.pop("content-length", None)
+    h["accept-ranges"] = "bytes"
+    return h
+
+
+class ProbeCache(object):
+    """remembers the final url a url redirects to for `ttl` seconds, so the next probe skips the redirects.
+    The size and validators are never cached, every download takes them from a probe of its own
+
+    Args:
+        ttl (float, optional): seconds an entry stays valid. Defaults to 300.
+        path (str, optional): json file to persist the cache in, in memory only when None. Defaults to None.
+    """
+
+    def __init__(self, ttl: float = 300, path: str = None):
+        self.ttl = ttl
+        self.path = path
+        self._lock = Lock()
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if self.path:
+                try:
+                    with open(self.path) as f:
+                        self._entries = _load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._entries
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        now = time()
+        entries = {k: v for k, v in self._entries.items() if v["expires"] > now}
+        # a temp file of its own, other processes save the same cache
+        fd, tmp = mkstemp(
+            prefix=f"{os.path.basename(self.path)}.",
+            suffix=".tmp",
+            dir=os.path.dirname(self.path) or ".",
+        )
+        try:
+            with open(fd, "w") as f:
+                _dump(entries, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            os.remove(tmp)
+            raise
+
+    def get(self, url: str):
+        """
+        Returns:
+            Optional[str]: final url if there is a fresh entry
+        """
+        if not self.ttl:
+            return None
+        with self._lock:
+            entry = self._load().get(url)
+            if entry is None or entry["expires"] < time():
+                return None
+            return entry["url"]
+
+    def set(self, url: str, final_url: str) -> None:
+        if not self.ttl or final_url == url:
+            # nothing to skip
+            return
+        with self._lock:
+            self._load()[url] = {"url": final_url, "expires": time() + self.ttl}
+            try:
+                self._save()
+            except OSError:
+                pass
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            if self._load().pop(url, None) is not None:
+                try:
+                    self._save()
+                except OSError:
+                    pass
+
+
+probe_cache = ProbeCache()
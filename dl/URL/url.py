@@ -9,21 +9,22 @@ from urllib.parse import (
 )
 from os.path import splitext
 from hashlib import new as new_hash_fn
+from importlib.util import find_spec
 from typing import Callable, Tuple, Union
 from secrets import token_urlsafe
 from .err import warn_requests, warn_refetch, warn_first_fetch, warn_no_hash
 from .util import (
     basic_headers,
     _normalise_url,
-    _abort_request_after,
     remove_quotes,
-    mime_types,
+    get_mime_types,
     int_or_none,
 )
+from .pool import get_session
+from .probe import PROBE_SIZE, probe_cache, range_probe_headers
 
-try:
-    import requests as req
-except ImportError:
+# requests itself is imported with the first request
+if find_spec("requests") is None:
     warn_requests()
 
 
@@ -35,6 +36,10 @@ class URL:
 
     has_meta_data: bool = False
     request = None
+    _session = None
+    # first bytes of the resource, read by the metadata probe when the server supports ranges
+    probe_data: bytes = None
+    probe_size: int = PROBE_SIZE
     _readonlyattrs: Tuple[str] = (
         "scheme",
         "netloc",
@@ -169,8 +174,8 @@ class URL:
     def get_url_hash(self) -> str:
         return self.s_get_url_hash(self)
 
-    def __init__(self, _u: str):
-        self.session = req.Session()
+    def __init__(self, _u: str, session=None):
+        self.session = session
         if not _u:
             raise ValueError("Cannot generate URL from a falsey value")
         u: str = self.attempt_url_fix(_u)
@@ -179,6 +184,15 @@ class URL:
     def __str__(self):
         return _unparse(self._parsed)
 
+    @property
+    def session(self):
+        # every URL shares the process wide connection pool unless given its own session
+        return self._session or get_session()
+
+    @session.setter
+    def session(self, session) -> None:
+        self._session = session
+
     def change_url_attr(self, _k: str, v) -> None:
         """used to change any readonly url attribute    
         
@@ -231,6 +245,8 @@ class URL:
         """
         if self.request and not refetch:
             warn_refetch(self)
+        import requests as req
+
         method = _method.lower()
         if not hasattr(req, method):
             raise AttributeError(f"Requests library does not support method {method}")
@@ -245,20 +261,49 @@ class URL:
         self.request = res
         return res
 
-    def update_url_meta_data(self) -> None:
-        """Get general meta data about the url
-        
+    def update_url_meta_data(self, use_cache: bool = True) -> None:
+        """Get general meta data about the url with a single `Range: bytes=0-N` GET request,
+        a 206 response confirms range support and its body is kept in `probe_data`
+
+        Args:
+            use_cache (bool, optional): probe the final url a recent probe was redirected to (see `probe.probe_cache`). Defaults to True.
+
         Returns:
             None
         """
-        headers: dict
-        url: str
-        try:
-            ret = req.head(str(self), headers=basic_headers, allow_redirects=True)
-            ret.raise_for_status()
-            headers, url = ret.headers, ret.url
-        except:
-            headers, url = _abort_request_after(str(self), 1500)
+        key = str(self)
+        target = (probe_cache.get(key) if use_cache else None) or key
+        ret, headers, url = self._range_probe(target)
+        if target != key and not ret.ok:
+            # the redirect leads elsewhere by now (i.e. an expired signed url)
+            probe_cache.invalidate(key)
+            ret, headers, url = self._range_probe(key)
+        if ret.ok:
+            probe_cache.set(key, url)
+        self.set_meta_data(headers, url)
+
+    def _range_probe(self, target: str):
+        headers = {
+            **basic_headers,
+            "Accept-Encoding": "identity",
+            "range": f"bytes=0-{self.probe_size - 1}",
+        }
+        with self.session.get(
+            target, headers=headers, allow_redirects=True, stream=True
+        ) as ret:
+            headers = range_probe_headers(ret.status_code, ret.headers)
+            self.probe_data = (
+                ret.raw.read(self.probe_size) if ret.status_code == 206 else None
+            )
+        return ret, headers, ret.url
+
+    def set_meta_data(self, headers: dict, url: str) -> None:
+        """use the headers of a response that was made elsewhere (i.e. an async request) as the url's meta data
+
+        Args:
+            headers (dict): response headers, lookups are done with lower case keys
+            url (str): final url after redirects
+        """
         self.has_meta_data = True
         self._m_headers = headers
         self._parsed = _parse(url)
@@ -309,12 +354,62 @@ class URL:
         if not self.has_meta_data:
             return ".bin"
         ct = self._m_headers.get("content-type", "").lower().split(";")[0].strip()
-        return mime_types.get(ct, ".bin")
+        return get_mime_types().get(ct, ".bin")
 
     @property
     def file_size(self):
+        if not self.has_meta_data:
+            self.update_url_meta_data()
         return int_or_none(self._m_headers.get("content-length", 0))
 
+    def read_ranges(self, ranges: list, threads: int = 4) -> list:
+        """download only some byte ranges of the url into memory, see `dl.sparse.RangeFetcher`
+
+        Args:
+            ranges (list): (start, end) pairs with the end included, (start, None) is the rest of the file
+                and (-n, None) its last n bytes
+            threads (int, optional): requests at once. Defaults to 4.
+
+        Returns:
+            list: the bytes of every range
+        Example:
+        >>> header, tail = URL("https://example.com/a.zip").read_ranges([(0, 29), (-65536, None)])
+        """
+        from ..sparse import RangeFetcher, read_ranges
+
+        return read_ranges(RangeFetcher(self, threads), ranges)
+
+    def fetch_ranges(self, ranges: list, path: str, threads: int = 4):
+        """download only some byte ranges of the url into the sparse file `path`,
+        the blocks that are already there are not downloaded again, see `dl.sparse.SparseFile`
+
+        Args:
+            ranges (list): see `read_ranges`
+            path (str): the local file
+            threads (int, optional): requests at once. Defaults to 4.
+
+        Returns:
+            SparseFile: the file, `read` downloads more of it
+        """
+        from ..sparse import RangeFetcher, SparseFile
+
+        f = SparseFile(RangeFetcher(self, threads), path)
+        f.fetch(ranges)
+        return f
+
+    def open(self, **kwargs):
+        """a read only, seekable file object of the url that downloads the blocks it reads, see `dl.remote.RemoteFile`
+
+        Returns:
+            RemoteFile: the file, takes the kwargs of `RemoteFile`
+        Example:
+        >>> with URL("https://example.com/a.zip").open() as f, zipfile.ZipFile(f) as z:
+        ...     names = z.namelist()
+        """
+        from ..remote import RemoteFile
+
+        return RemoteFile(self, **kwargs)
+
     def follow_redirects(self):
         self.update_url_meta_data()
         return str(self)
@@ -334,7 +429,7 @@ class URL:
         https://google.com/search?q=python
 
         """
-        return URL(_urljoin(str(self), rel))
+        return URL(_urljoin(str(self), rel), self.session)
 
     def refetch(self, *args, **kwargs):
         if not self.request:
@@ -1,6 +1,5 @@
 from urllib.parse import ParseResult
 from os.path import realpath, dirname, join as _path_join
-import requests
 from json import load as json_load
 
 script_loc = realpath(__file__)
@@ -8,9 +7,23 @@ script_dir = dirname(script_loc)
 del dirname
 del realpath
 
-mime_types: dict
-with open(_path_join(script_dir, "mimes.json")) as f:
-    mime_types = json_load(f)
+_mime_types: dict = None
+
+
+def get_mime_types() -> dict:
+    """content type -> file extension, mimes.json is only read when a file name has to be guessed"""
+    global _mime_types
+    if _mime_types is None:
+        with open(_path_join(script_dir, "mimes.json")) as f:
+            _mime_types = json_load(f)
+    return _mime_types
+
+
+def __getattr__(name: str):
+    # `mime_types` used to be loaded with the module
+    if name == "mime_types":
+        return get_mime_types()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 UA_m = "Mozilla/5.0 (Linux; Android 8.1.0; Pixel Build/OPM2.171019.029; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/68.0.3325.109 Mobile Safari/537.36"
@@ -25,8 +38,10 @@ basic_headers = {
 }
 
 
-def _abort_request_after(url: str, byte_len: int = 1024):
-    with requests.get(
+def _abort_request_after(url: str, byte_len: int = 1024, session=None):
+    import requests
+
+    with (session or requests).get(
         url, headers=basic_headers, allow_redirects=True, stream=True
     ) as chunk:
         for _ in chunk.iter_content(byte_len):
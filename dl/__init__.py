@@ -1,3 +1,27 @@
 from .downloader import Downloader
+from ._cache import DownloadCache, set_cache_dir
 
-__all__ = ["Downloader"]
+# asyncio is only imported when the asyncio based downloaders are used
+_LAZY = {
+    "AsyncDownloader": ".async_downloader",
+    "BatchDownloader": ".batch",
+    "RemoteFile": ".remote",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        from importlib import import_module
+
+        return getattr(import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "Downloader",
+    "AsyncDownloader",
+    "BatchDownloader",
+    "RemoteFile",
+    "DownloadCache",
+    "set_cache_dir",
+]
@@ -2,13 +2,35 @@
 Stuff for cached and temp files
 """
 
-from os import mkdir as _i_mkdir
+import os
+import shutil
+import sys
+from collections import namedtuple
+from os import environ as _environ, makedirs as _makedirs
 from os.path import join as _join, isfile as _isfile, isdir as _isdir
+from threading import Lock
+from time import time
+from typing import Optional
+from .digest import file_digest
+from .report import err_to_screen
 from .util import script_dir, MetaError
-from json import load as _load, dump as _dump
+from json import load as _load, dumps as _dumps
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
 
-cached_dir = _join(script_dir, ".cache")
+# shared by every download of the process, and between processes that use the same directory
+cached_dir = _environ.get("DL_CACHE_DIR") or _join(script_dir, ".cache")
+
+
+def set_cache_dir(path: str) -> None:
+    """keep the metadata, intermediate files and locks in `path` (`DL_CACHE_DIR` by default),
+    it has to be set before the first download starts
+    """
+    global cached_dir
+    cached_dir = path
 
 
 def get_cachedir(f: str):
@@ -17,15 +39,24 @@ def get_cachedir(f: str):
     return g
 
 
-def make_cached_file(fn: str, data: dict, cd=cached_dir):
+def make_cached_file(fn: str, data: dict, cd=None):
+    cd = cd or cached_dir
     _path = _join(cd, fn)
     file = f"{_path}.data.json"
     mkdir(cd)
-    with open(file, "w") as f:
-        _dump(data, f)
+    # serialized in one go, the download threads keep updating `data` while it is saved
+    s = _dumps(data)
+    # a crash while writing leaves the previous version in place
+    tmp = f"{file}.tmp"
+    with open(tmp, "w") as f:
+        f.write(s)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, file)
 
 
-def get_cached_file(fn, cd=cached_dir):
+def get_cached_file(fn, cd=None):
+    cd = cd or cached_dir
     file = f"{_join(cd,fn)}.data.json"
     if not _isfile(file):
         return None
@@ -33,12 +64,205 @@ def get_cached_file(fn, cd=cached_dir):
         try:
             return _load(f)
         except Exception as e:
-            print(e)
+            err_to_screen(f"[Warning] {fn}: {e!r}\n")
             return None
 
 
 def mkdir(x: str):
     if _isdir(x):
         return False
-    _i_mkdir(x)
+    _makedirs(x, exist_ok=True)
     return True
+
+
+# ioctl that makes a file share the blocks of another (btrfs, xfs)
+_FICLONE = 0x40049409
+
+
+def clone_file(src: str, dst: str, hardlink: bool = False) -> str:
+    """make `dst` a copy of `src` that shares its data when the file system allows it
+
+    Args:
+        src (str): the file to copy
+        dst (str): the copy, replaced if it exists
+        hardlink (bool, optional): try a hard link first, changes to one of the files then show in the other. Defaults to False.
+
+    Returns:
+        str: how it was copied, "hardlink", "reflink" or "copy"
+    """
+    if hardlink:
+        try:
+            if _isfile(dst):
+                os.remove(dst)
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    if fcntl and sys.platform.startswith("linux"):
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+# a file in the cache, `hash` is the sha256 it is stored under
+CacheEntry = namedtuple(
+    "CacheEntry", ["url", "etag", "last_modified", "size", "hash", "path"]
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, size INTEGER, last_used REAL);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, size INTEGER, hash TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_hash ON urls (hash);
+"""
+
+
+class DownloadCache(object):
+    """
+    Finished downloads, stored once per content (by sha256) and found by url or by digest.
+    The index is an sqlite database, so lookups stay fast with many entries and several processes
+    can share the cache. The files that were used least recently are evicted above `max_size`.
+
+    Args:
+        path (Optional[str], optional): directory of the cache. Defaults to "store" in the cache directory.
+        max_size (int, optional): bytes the cache may hold. Defaults to 10 GB.
+        hardlink (bool, optional): hard link the files in and out of the cache instead of copying them,
+            a downloaded file must then not be changed in place. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_size: int = 10 * 1024**3,
+        hardlink: bool = False,
+    ):
+        self.path = path or _join(cached_dir, "store")
+        self.max_size = max_size
+        self.hardlink = hardlink
+        mkdir(self.path)
+        self._lock = Lock()
+        import sqlite3
+
+        self._db = sqlite3.connect(
+            _join(self.path, "index.sqlite"),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def object_path(self, sha256: str) -> str:
+        # spread over subdirectories, large directories are slow to look up in
+        return _join(self.path, sha256[:2], sha256)
+
+    def _entry(self, row) -> Optional[CacheEntry]:
+        if row is None:
+            return None
+        entry = CacheEntry(*row, self.object_path(row[4]))
+        return entry if _isfile(entry.path) else None
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """the cached file of `url`, it still has to be revalidated with the server"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, etag, last_modified, size, hash FROM urls WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return self._entry(row)
+
+    def lookup_digest(self, sha256: str) -> Optional[CacheEntry]:
+        """a cached file with the sha256 `sha256`, whatever url it came from"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM objects WHERE hash = ?", (sha256,)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._entry((None, None, None, row[0], sha256))
+
+    def get(self, entry: CacheEntry, dst: str) -> bool:
+        """copy the file of `entry` to `dst` and mark it as used
+
+        Returns:
+            bool: False if it was evicted in the meantime
+        """
+        try:
+            clone_file(entry.path, dst, self.hardlink)
+        except OSError:
+            return False
+        with self._lock:
+            self._db.execute(
+                "UPDATE objects SET last_used = ? WHERE hash = ?", (time(), entry.hash)
+            )
+        return True
+
+    def put(
+        self,
+        url: str,
+        path: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> Optional[CacheEntry]:
+        """store the downloaded file `path` of `url`
+
+        Args:
+            sha256 (Optional[str], optional): digest of the file if it is known, it is hashed otherwise. Defaults to None.
+
+        Returns:
+            Optional[CacheEntry]: the entry, None if the file is larger than the cache
+        """
+        size = os.path.getsize(path)
+        if size > self.max_size:
+            return None
+        sha256 = sha256 or file_digest(path, "sha256")
+        obj = self.object_path(sha256)
+        if not _isfile(obj):
+            mkdir(os.path.dirname(obj))
+            tmp = f"{obj}.{os.getpid()}.tmp"
+            clone_file(path, tmp, self.hardlink)
+            os.replace(tmp, obj)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                (sha256, size, time()),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, size, sha256),
+            )
+        self.evict()
+        return CacheEntry(url, etag, last_modified, size, sha256, obj)
+
+    def evict(self) -> None:
+        """remove the least recently used files until the cache fits in `max_size`"""
+        with self._lock:
+            total = self._db.execute("SELECT SUM(size) FROM objects").fetchone()[0]
+            if not total or total <= self.max_size:
+                return
+            rows = self._db.execute(
+                "SELECT hash, size FROM objects ORDER BY last_used"
+            ).fetchall()
+            for sha256, size in rows:
+                if total <= self.max_size:
+                    break
+                self._db.execute("DELETE FROM objects WHERE hash = ?", (sha256,))
+                self._db.execute("DELETE FROM urls WHERE hash = ?", (sha256,))
+                try:
+                    os.remove(self.object_path(sha256))
+                except OSError:
+                    pass
+                total -= size
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,426 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from time import time
+from typing import AsyncIterator, Callable, List, Optional, Union
+
+from ._cache import DownloadCache
+from .downloader import Downloader, _RetireWorker, retryable_errors
+from .events import PROBED, SEGMENT_STARTED, DownloadEvent
+from .locking import DownloadLock
+from .mirrors import Mirror
+from .report import err_to_screen, to_screen
+from .segments import SegmentScheduler, remaining
+from .digest import StreamHasher
+from .stream import MIN_CHUNK, stream_response_async
+from .URL import URL, basic_headers, probe_cache
+from .URL.aio import fetch
+from .URL.probe import range_probe_headers
+from .util import DownloadLockedError, RemoteFileChangedError
+
+
+class AsyncDownloader(Downloader):
+    """
+    asyncio based Downloader, the segments of the file are downloaded by tasks on the
+    running event loop instead of threads, so one loop can download many files at once.
+    It uses the same metadata as `Downloader`, either of them can resume a download started by the other.
+
+    Unlike `Downloader`, nothing is fetched until `start` is awaited.
+        Args: same as `Downloader`
+    Example:
+        >>> async def download_all(urls):
+        ...     await asyncio.gather(*(AsyncDownloader(u, t=4).start() for u in urls))
+    """
+
+    # shared connection budget (see `batch.ConnectionLimiter`), every request waits for a slot
+    limiter = None
+    # the threads that wait on the reorder buffer of a stream, the event loop must not
+    _stream_executor: Optional[ThreadPoolExecutor] = None
+
+    def __init__(
+        self,
+        url: Union[URL, str],
+        ua: Optional[str] = None,
+        f: Optional[str] = None,
+        d: Optional[str] = None,
+        intermediate_fn: Optional[str] = None,
+        is_cli: Optional[bool] = False,
+        t: Optional[Union[int, str]] = 3,
+        v: Optional[bool] = False,
+        write_mode: Optional[str] = None,
+        digest: Optional[str] = None,
+        rate_limit: Optional[float] = None,
+        mirrors: Optional[List[Union[URL, str]]] = None,
+        listeners: Optional[List[Callable[[DownloadEvent], None]]] = None,
+        cache: Optional[DownloadCache] = None,
+        decompress: Optional[str] = None,
+    ):
+        self._init_options(
+            url,
+            ua,
+            is_cli,
+            t,
+            v,
+            write_mode,
+            digest,
+            rate_limit,
+            listeners,
+            cache,
+            decompress,
+        )
+        self._file_options = (f, d, intermediate_fn)
+        self._mirror_urls = mirrors
+
+    @asynccontextmanager
+    async def _connection(self, host: Optional[str] = None):
+        if self.limiter is None:
+            yield
+            return
+        async with self.limiter.connection(host or self.url.host):
+            yield
+
+    async def _fetch(self, headers: dict, url: Optional[str] = None):
+        return await fetch(
+            url or str(self.url),
+            "GET",
+            headers,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+    async def _range_probe(self, target: str):
+        size = self.url.probe_size
+        headers = {**basic_headers, "range": f"bytes=0-{size - 1}"}
+        self.url.probe_data = None
+        async with self._connection():
+            async with await self._fetch(headers, target) as r:
+                h = range_probe_headers(r.status_code, r.headers)
+                if r.status_code == 206:
+                    data = bytearray()
+                    while len(data) < size:
+                        chunk = await r.read(size - len(data))
+                        if not chunk:
+                            break
+                        data += chunk
+                    self.url.probe_data = bytes(data)
+        return r, h
+
+    async def _probe(self):
+        """async version of `URL.update_url_meta_data`"""
+        key = str(self.url)
+        target = probe_cache.get(key) or key
+        r, h = await self._range_probe(target)
+        if target != key and not r.ok:
+            # the redirect leads elsewhere by now (i.e. an expired signed url)
+            probe_cache.invalidate(key)
+            r, h = await self._range_probe(key)
+        if r.ok:
+            probe_cache.set(key, r.url)
+        self.url.set_meta_data(h, r.url)
+        self._verbose_logger("URL-REDIR", str(self.url))
+        self._init_file(*self._file_options)
+        # a few blocking probes, once per download
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._init_mirrors, self._mirror_urls
+        )
+        self._emit(PROBED, total=self.filesize)
+
+    async def _download_handler(
+        self, h: dict, req: dict, mirror: Optional[Mirror] = None
+    ):
+        """file download handler, to be run as a task
+
+        Args:
+            h (dict): Headers for the request
+            req (dict): the range being downloaded, its `completed` count is updated as data arrives
+            mirror (Optional[Mirror], optional): where to download it from. Defaults to the url.
+        """
+        url = mirror.url if mirror else self.url
+        f = self._get_writer(req)
+        write, on_read, limit, unwritten = self._segment_callbacks(req, f)
+        try:
+            async with self._connection(url.host):
+                async with await self._fetch(h, str(url)) as r:
+                    self._check_range_response(r.status_code, h)
+                    await stream_response_async(
+                        r,
+                        self._off_loop_writer(write),
+                        on_read,
+                        self.chunk_size,
+                        self.buffer_size,
+                        limit,
+                        self._bucket,
+                    )
+            if remaining(req) > 0:
+                raise ConnectionError(
+                    f"Connection closed with {remaining(req)} bytes of {h['range']} left"
+                )
+        finally:
+            await self._off_loop(f.close)
+            self._progress.add(-unwritten())
+            await self._off_loop(self._checkpoint, True)
+
+    async def _off_loop(self, fn, *args):
+        """runs the blocking `fn` in the default executor, disk io on the loop would stall every download on it"""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _off_loop_writer(self, write):
+        """the write callback of `stream_response_async` for the blocking `write`"""
+
+        async def write_async(b):
+            await self._off_loop(write, b)
+
+        return write_async
+
+    async def _simple_fetch(self):
+        to_screen("Only reporting size downloaded\n")
+        async with self._connection():
+            with open(self.save_path, "wb") as f:
+                async with await self._fetch(basic_headers) as r:
+                    r.raise_for_status()
+                    await stream_response_async(
+                        r,
+                        self._off_loop_writer(self._simple_writer(f)),
+                        self._progress.add,
+                        self.chunk_size,
+                        self.buffer_size,
+                        throttle=self._bucket,
+                    )
+        await self._off_loop(self._check_simple_digest)
+
+    async def _worker(self, hdr: dict):
+        while not self._fatal_error:
+            seg = self._scheduler.next()
+            if seg is None:
+                return
+            await self._off_loop(self._checkpoint, True)
+            self._segment_event(SEGMENT_STARTED, seg)
+            try:
+                await self._download_segment(hdr, seg)
+            except _RetireWorker:
+                return
+            finally:
+                self._segment_finished(seg)
+
+    async def _download_segment(self, hdr: dict, seg: dict):
+        failed_on = None
+        while not self._fatal_error and remaining(seg) > 0:
+            # the whole segment has to fit in the reorder buffer of a stream before it starts,
+            # so the reads never wait for the consumer on the event loop
+            if self._reorder and not await self._in_stream_executor(
+                self._reorder.reserve, seg["to"], 1
+            ):
+                raise _RetireWorker()
+            before, started = seg["completed"], time()
+            mirror = self.mirrors.acquire(failed_on)
+            ok = False
+            try:
+                await self._download_handler(
+                    self._range_headers(hdr, seg, mirror), seg, mirror
+                )
+                ok = True
+            except RemoteFileChangedError as e:
+                self._file_changed(mirror, e)
+                failed_on = mirror
+            except _RetireWorker:
+                ok = True
+                raise
+            except retryable_errors() as e:
+                failed_on = mirror
+                delay = self._retry_delay(seg, e, seg["completed"] > before)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+            except Exception as e:
+                self._give_up(seg, e)
+                return
+            finally:
+                self.mirrors.release(
+                    mirror, seg["completed"] - before, time() - started, ok
+                )
+
+    async def _spawn_downloaders(self, h: dict):
+        self._scheduler = SegmentScheduler(h["reqs"], self._lock, self.min_segment_size)
+        tasks = []
+
+        def spawn(n):
+            for _ in range(n):
+                tasks.append(asyncio.ensure_future(self._worker(h["headers"])))
+
+        spawn(self.threads)
+        while self._tuner and not all(i.done() for i in tasks):
+            await asyncio.sleep(self.tune_interval)
+            spawn(self._retune(sum(not i.done() for i in tasks)))
+        res = await asyncio.gather(*tasks, return_exceptions=True)
+        # like a thread, a failed worker only stops itself, its segment is picked up by the others
+        for e in res:
+            if isinstance(e, Exception):
+                err_to_screen(f"\n[Error] {e!r}\n")
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._emit_progress()
+
+    @asynccontextmanager
+    async def _progress_reporter(self):
+        if not self.report and not self.listeners:
+            yield
+            return
+        task = asyncio.ensure_future(self._report_progress())
+        try:
+            yield
+        finally:
+            task.cancel()
+            self._emit_progress()
+
+    async def start(self, thread_count: Union[int, str] = None):
+        """Start the file download
+
+        Args:
+            thread_count (Union[int, str], optional): number of segments to download at once, or "auto". Defaults to None.
+
+        Raises:
+            FileExistsError: the file has already been downloaded
+        """
+        if not self.url.has_meta_data:
+            await self._probe()
+        self._check_save_path(self.save_path)
+        self._prepare_start(thread_count)
+        lock = DownloadLock(self._meta_file_name)
+        loop = asyncio.get_running_loop()
+        with self._outcome():
+            waited = await self._wait_for_lock(lock)
+            with self._claimed(lock, waited) as prev, self._decompressing():
+                # copying the files and the revalidation are blocking io
+                done = prev and await loop.run_in_executor(
+                    None, self._reuse_download, prev
+                )
+                if not done and self.cache:
+                    done = await loop.run_in_executor(None, self._from_cache)
+                if not done:
+                    await self._download()
+                    if self.cache:
+                        await loop.run_in_executor(None, self._cache_download)
+                await loop.run_in_executor(None, self._finish_decompression)
+
+    async def iter_bytes(
+        self, thread_count: Union[int, str] = None
+    ) -> AsyncIterator[bytes]:
+        """`Downloader.iter_bytes` as an async generator, the segments are tasks on the running loop
+        and a segment only starts once all of it fits in the reorder buffer
+
+        Example:
+            >>> async for data in AsyncDownloader(url).iter_bytes():
+            ...     await send(data)
+        """
+        if not self.url.has_meta_data:
+            await self._probe()
+        self._prepare_start(thread_count)
+        self._hasher = None
+        hasher = StreamHasher(self.digest[0]) if self.digest else None
+        stream = self._stream_segments() if self.is_resumable else self._stream_simple()
+        with self._outcome():
+            try:
+                async for data in stream:
+                    if hasher:
+                        hasher.feed(hasher.position, data)
+                    yield data
+            finally:
+                await stream.aclose()
+            self._hasher = hasher
+            self._check_digest()
+
+    async def stream_to(self, fileobj, thread_count: Union[int, str] = None) -> int:
+        """`Downloader.stream_to`, `fileobj.write` is called on the event loop and may return a coroutine"""
+        total = 0
+        async for data in self.iter_bytes(thread_count):
+            res = fileobj.write(data)
+            if asyncio.iscoroutine(res):
+                await res
+            total += len(data)
+        return total
+
+    async def _in_stream_executor(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._stream_executor, fn, *args
+        )
+
+    async def _stream_segments(self) -> AsyncIterator[bytes]:
+        h = self._stream_layout()
+        connections = self.max_connections if self._tuner else self.threads
+        # a thread for every connection waiting for room and one for the consumer
+        self._stream_executor = ThreadPoolExecutor(connections + 1)
+        producer = asyncio.ensure_future(self._produce(h))
+        try:
+            async with self._progress_reporter():
+                while True:
+                    data = await self._in_stream_executor(self._reorder.read)
+                    if not data:
+                        return
+                    yield data
+        finally:
+            # stops the tasks if the consumer stopped early
+            self._reorder.close()
+            await producer
+            self._stream_executor.shutdown()
+            self._stream_executor = None
+            self._reorder = None
+
+    async def _produce(self, h: dict) -> None:
+        error = None
+        try:
+            with self._throttling():
+                await self._spawn_downloaders(h)
+            self._save_tuning()
+            error = self._fatal_error
+        except BaseException as e:
+            error = e
+        self._reorder.close(error)
+
+    async def _stream_simple(self) -> AsyncIterator[bytes]:
+        async with self._progress_reporter():
+            with self._throttling():
+                async with self._connection():
+                    async with await self._fetch(basic_headers) as r:
+                        r.raise_for_status()
+                        while True:
+                            data = await r.read(self.chunk_size or MIN_CHUNK)
+                            if not data:
+                                return
+                            self._progress.add(len(data))
+                            yield data
+                            wait = self._bucket.take(len(data))
+                            if wait:
+                                await asyncio.sleep(wait)
+
+    async def _wait_for_lock(self, lock: DownloadLock) -> bool:
+        """`Downloader._wait_for_lock` without blocking the event loop"""
+        if lock.try_acquire():
+            return False
+        to_screen("Waiting for another process that downloads this url\n")
+        deadline = None if self.lock_timeout is None else time() + self.lock_timeout
+        while not lock.try_acquire():
+            if deadline is not None and time() >= deadline:
+                raise DownloadLockedError(
+                    f"{self.url} is being downloaded by another process"
+                )
+            await asyncio.sleep(lock.poll_interval)
+        return True
+
+    async def _download(self):
+        if self.is_resumable:
+            with self._mapped():
+                # reads the journal and checks the saved segments against their checksums
+                h = await self._off_loop(self._load_headers)
+                with self._hashing(), self._throttling():
+                    async with self._progress_reporter():
+                        await self._spawn_downloaders(h)
+            self._save_tuning()
+            # merging the part files is blocking disk io
+            await asyncio.get_running_loop().run_in_executor(None, self._make_file)
+        else:
+            to_screen(f"Server at {self.url.host} does not support multi threading\n")
+            with self._throttling():
+                async with self._progress_reporter():
+                    await self._simple_fetch()
@@ -0,0 +1,163 @@
+"""
+Bandwidth limiting with token buckets, per download and across downloads
+"""
+
+from threading import Lock
+from time import monotonic
+from typing import List, Optional
+
+MIN_READ = 16 * 1024
+
+_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_rate(rate: str) -> float:
+    """bytes per second from a string like `"500K"` or `"2.5M"`
+
+    Raises:
+        ValueError: not a rate
+    """
+    s = rate.strip().lower().rstrip("b")
+    unit = s[-1:] if s[-1:] in _UNITS else ""
+    return float(s[: len(s) - len(unit)]) * _UNITS[unit]
+
+
+class TokenBucket(object):
+    """
+    Token bucket with `rate` tokens (bytes) per second, holding up to `burst` seconds worth of them.
+    The bytes are taken after they were read and the reader sleeps off the debt,
+    so concurrent readers are served in the order they read and the rate holds for all of them together.
+
+    Args:
+        rate (Optional[float], optional): bytes per second, unlimited when None. Defaults to None.
+        burst (float, optional): seconds of unused bandwidth that can be saved up. Defaults to 0.25.
+    """
+
+    # a read should take about this long at the rate, so the data flows instead of arriving in bursts
+    read_time: float = 0.1
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 0.25):
+        self.burst = burst
+        self._lock = Lock()
+        self._rate = rate or None
+        self._tokens = self._capacity
+        self._stamp = monotonic()
+        # see `Bandwidth`
+        self.limit = None
+
+    @property
+    def _capacity(self) -> float:
+        return (self._rate or 0) * self.burst
+
+    def _refill(self, now: float) -> None:
+        if self._rate:
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._stamp) * self._rate
+            )
+        self._stamp = now
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: Optional[float]) -> None:
+        """can be changed while readers are using the bucket"""
+        with self._lock:
+            self._refill(monotonic())
+            self._rate = rate or None
+            if not self._rate:
+                self._tokens = 0
+            elif self._tokens > self._capacity:
+                self._tokens = self._capacity
+
+    @property
+    def read_size(self) -> Optional[int]:
+        """largest read that fits the rate, None when unlimited"""
+        rate = self._rate
+        return max(MIN_READ, int(rate * self.read_time)) if rate else None
+
+    def take(self, n: int) -> float:
+        """take `n` tokens for bytes that were just read
+
+        Returns:
+            float: seconds the reader has to wait before it reads again
+        """
+        with self._lock:
+            if not self._rate:
+                return 0
+            self._refill(monotonic())
+            self._tokens -= n
+            return -self._tokens / self._rate if self._tokens < 0 else 0
+
+
+class Bandwidth(object):
+    """
+    Bandwidth shared by all the downloads that `join` it, the rate is split between them
+    so that every download gets the same share unless its own limit is lower,
+    what it does not use goes to the others.
+
+    Args:
+        rate (Optional[float], optional): bytes per second for all the downloads together, unlimited when None. Defaults to None.
+    """
+
+    def __init__(self, rate: Optional[float] = None):
+        self._rate = rate or None
+        self._buckets: List[TokenBucket] = []
+        self._lock = Lock()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: Optional[float]) -> None:
+        with self._lock:
+            self._rate = rate or None
+            self._rebalance()
+
+    def _rebalance(self) -> None:
+        if not self._rate:
+            for b in self._buckets:
+                b.rate = b.limit
+            return
+        left = self._rate
+        # the downloads with the lowest limits are served first, the rest share what is left
+        ordered = sorted(self._buckets, key=lambda b: b.limit or float("inf"))
+        for i, b in enumerate(ordered):
+            share = left / (len(ordered) - i)
+            b.rate = min(b.limit, share) if b.limit else share
+            left -= b.rate
+
+    def join(self, limit: Optional[float] = None) -> TokenBucket:
+        """bucket for a download that is starting
+
+        Args:
+            limit (Optional[float], optional): limit of the download itself in bytes per second. Defaults to None.
+        """
+        b = TokenBucket()
+        b.limit = limit or None
+        with self._lock:
+            self._buckets.append(b)
+            self._rebalance()
+        return b
+
+    def leave(self, bucket: TokenBucket) -> None:
+        """the download is done, its share goes to the others"""
+        with self._lock:
+            if bucket in self._buckets:
+                self._buckets.remove(bucket)
+                self._rebalance()
+
+    def set_limit(self, bucket: TokenBucket, limit: Optional[float]) -> None:
+        """change the limit of a download that is running"""
+        with self._lock:
+            bucket.limit = limit or None
+            if bucket in self._buckets:
+                self._rebalance()
+            else:
+                bucket.rate = bucket.limit
+
+
+# process wide bandwidth used by every Downloader unless it is given one of its own
+global_bandwidth = Bandwidth()
@@ -0,0 +1,233 @@
+"""
+Downloading many urls at once on one event loop with a shared connection budget
+"""
+
+import asyncio
+from collections import defaultdict, namedtuple
+from contextlib import asynccontextmanager
+from time import time
+from typing import Callable, Iterable, List, Optional, Union
+
+from ._cache import DownloadCache
+from .async_downloader import AsyncDownloader
+from .bandwidth import Bandwidth
+from .events import DownloadEvent
+from .report import err_to_screen, to_screen
+from .tuning import AUTO, learned_connections
+from .util import force_round, to_MB
+
+BatchResult = namedtuple(
+    "BatchResult", ["url", "save_path", "ok", "error", "size", "elapsed"]
+)
+
+
+def read_url_file(path: str) -> List[str]:
+    """reads one url per line, empty lines and lines starting with # are skipped"""
+    with open(path) as f:
+        lines = (i.strip() for i in f)
+        return [i for i in lines if i and not i.startswith("#")]
+
+
+class ConnectionLimiter(object):
+    """limits the number of open connections, in total and to every host
+
+    Args:
+        max_connections (int, optional): Defaults to 16.
+        per_host (int, optional): Defaults to 4.
+    """
+
+    def __init__(self, max_connections: int = 16, per_host: int = 4):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self._total = asyncio.Semaphore(max_connections)
+        self._hosts = defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    @asynccontextmanager
+    async def connection(self, host: str):
+        async with self._hosts[host]:
+            async with self._total:
+                yield
+
+
+class BatchDownloader(object):
+    """
+    Downloads a list of urls concurrently with `AsyncDownloader`s sharing one connection budget,
+    a failed download is recorded in the results and does not stop the others
+        Args:
+            urls (Iterable[str]): the urls to download
+            d (Optional[str], optional): Directory to save the files in. Defaults to None.
+            t (Optional[Union[int, str]], optional): Maximum number of connections per file,
+                "auto" uses the count learnt for the host by earlier downloads. Defaults to 3.
+            max_connections (Optional[int], optional): Connections open at once across all files. Defaults to 16.
+            per_host (Optional[int], optional): Connections open at once to a single host. Defaults to 4.
+            max_files (Optional[int], optional): Files downloaded at once. Defaults to max_connections.
+            ua (Optional[str], optional): User Agent to pass in the headers. Defaults to None.
+            v (Optional[bool], optional): Verbosity. Defaults to False.
+            write_mode (Optional[str], optional): see `Downloader`. Defaults to None.
+            rate_limit (Optional[float], optional): bandwidth of the whole batch in bytes per second,
+                split evenly between the files that are running. Defaults to None.
+            listeners (Optional[List[Callable[[DownloadEvent], None]]], optional): called with every event of every file,
+                the events tell the files apart by their `url`. Defaults to None.
+            cache (Optional[DownloadCache], optional): download cache of all the files, see `Downloader`. Defaults to None.
+            decompress (Optional[str], optional): see `Downloader`. Defaults to None.
+    """
+
+    report: bool = True
+    progress_interval: float = 0.5
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        d: Optional[str] = None,
+        t: Optional[Union[int, str]] = 3,
+        max_connections: Optional[int] = 16,
+        per_host: Optional[int] = 4,
+        max_files: Optional[int] = None,
+        ua: Optional[str] = None,
+        v: Optional[bool] = False,
+        write_mode: Optional[str] = None,
+        rate_limit: Optional[float] = None,
+        listeners: Optional[List[Callable[[DownloadEvent], None]]] = None,
+        cache: Optional[DownloadCache] = None,
+        decompress: Optional[str] = None,
+    ):
+        self.urls = list(urls)
+        self.d = d
+        self.t = t or 3
+        self.max_connections = max_connections or 16
+        self.per_host = per_host or 4
+        self.max_files = max_files or self.max_connections
+        self.user_agent = ua
+        self._verb = v
+        self.write_mode = write_mode
+        self.bandwidth = Bandwidth(rate_limit)
+        self.listeners = listeners
+        self.cache = cache
+        self.decompress = decompress
+        self.results: List[BatchResult] = []
+        self._downloaders = []
+        self._active = 0
+        self.start_time = 0
+
+    @property
+    def _downloaded_size(self) -> int:
+        return sum(i._downloaded_size - i._continued_size for i in self._downloaders)
+
+    def _progress_callback(self, done: int, total: int, size: float, speed: float):
+        """Called every `progress_interval` seconds with the aggregate progress of the batch
+
+        Args:
+            done (int): files that are finished (successfully or not)
+            total (int): number of files in the batch
+            size (float): bytes downloaded so far
+            speed (float): aggregate speed in MB/s
+        """
+        to_screen(
+            f"\rFiles: {done}/{total} Size: {to_MB(size)} MB -- Speed: {speed} MB/s  "
+        )
+
+    def _emit_progress(self):
+        size = self._downloaded_size
+        elapsed = time() - self.start_time
+        speed = force_round((size / (1024 * 1024)) / elapsed if elapsed else 0, 2)
+        self._progress_callback(len(self.results), len(self.urls), size, speed)
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._emit_progress()
+
+    def _get_downloader(self, url: str) -> AsyncDownloader:
+        d = AsyncDownloader(
+            url,
+            ua=self.user_agent,
+            d=self.d,
+            t=self.t,
+            v=self._verb,
+            write_mode=self.write_mode,
+            listeners=self.listeners,
+            cache=self.cache,
+            decompress=self.decompress,
+        )
+        d.report = False
+        d.limiter = self._limiter
+        d.bandwidth = self.bandwidth
+        # files with the same name get a suffix instead of overwriting each other
+        d.taken_paths = self._save_paths
+        return d
+
+    async def _download(self, url: str, files: asyncio.Semaphore) -> BatchResult:
+        async with files:
+            start = time()
+            d = None
+            self._active += 1
+            try:
+                d = self._get_downloader(url)
+                self._downloaders.append(d)
+                t = self.t
+                if t == AUTO:
+                    t = learned_connections(d.url.host) or d.auto_start
+                # split the connection budget between the files that are running
+                threads = self.max_connections // self._active
+                await d.start(max(1, min(t, self.per_host, threads)))
+                res = BatchResult(
+                    url, d.save_path, True, None, d._downloaded_size, time() - start
+                )
+            except Exception as e:
+                res = BatchResult(
+                    url,
+                    getattr(d, "save_path", None),
+                    False,
+                    e,
+                    d._downloaded_size if d else 0,
+                    time() - start,
+                )
+            finally:
+                self._active -= 1
+            self.results.append(res)
+            return res
+
+    async def run(self) -> List[BatchResult]:
+        """download every url
+
+        Returns:
+            List[BatchResult]: one result per url, in the order of the urls
+        """
+        self._limiter = ConnectionLimiter(self.max_connections, self.per_host)
+        self._save_paths = set()
+        self.start_time = time()
+        self.results = []
+        self._downloaders = []
+        files = asyncio.Semaphore(self.max_files)
+        reporter = (
+            asyncio.ensure_future(self._report_progress()) if self.report else None
+        )
+        try:
+            res = await asyncio.gather(*(self._download(u, files) for u in self.urls))
+        finally:
+            if reporter:
+                reporter.cancel()
+                self._emit_progress()
+        return list(res)
+
+    def start(self) -> List[BatchResult]:
+        """run the batch on a new event loop"""
+        return asyncio.run(self.run())
+
+    def report_results(self, results: List[BatchResult]) -> None:
+        """print the outcome of every download and the aggregate throughput"""
+        to_screen("\n")
+        for i in results:
+            if i.ok:
+                to_screen(
+                    f"[Done] {i.url} -> {i.save_path} ({to_MB(i.size)} MB in {force_round(i.elapsed, 2)}s)\n"
+                )
+            else:
+                err_to_screen(f"[Failed] {i.url}: {i.error!r}\n")
+        elapsed = time() - self.start_time
+        size = self._downloaded_size
+        ok = sum(1 for i in results if i.ok)
+        to_screen(
+            f"{ok}/{len(results)} files downloaded, {to_MB(size)} MB in {force_round(elapsed, 2)}s "
+            f"({force_round((size / (1024 * 1024)) / elapsed if elapsed else 0, 2)} MB/s)\n"
+        )
@@ -0,0 +1,195 @@
+"""
+Decompressing a download (gzip, xz, zstd) in file order while its segments arrive,
+so a compressed file comes out extracted without reading it again
+"""
+
+import lzma
+import os
+import zlib
+from typing import Callable, Optional, Tuple
+
+from .digest import READ_BLOCK, OrderedStream
+from .util import DecompressionError
+
+AUTO = "auto"
+GZIP = "gzip"
+XZ = "xz"
+ZSTD = "zstd"
+
+# first bytes of the formats
+_MAGIC = ((b"\x1f\x8b", GZIP), (b"\xfd7zXZ\x00", XZ), (b"\x28\xb5\x2f\xfd", ZSTD))
+# extension -> extension of the decompressed file
+_EXTENSIONS = {
+    ".gz": ("", GZIP),
+    ".tgz": (".tar", GZIP),
+    ".xz": ("", XZ),
+    ".txz": (".tar", XZ),
+    ".zst": ("", ZSTD),
+    ".tzst": (".tar", ZSTD),
+}
+# most bytes one call of a decompressor returns, a block of a highly compressed file
+# would be decompressed into memory in one piece otherwise
+OUT_BLOCK = 1024 * 1024
+
+
+def _zstd_decompressor():
+    try:
+        # python 3.14
+        from compression.zstd import ZstdDecompressor
+
+        return ZstdDecompressor()
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd needs python 3.14 or the zstandard package")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+_DECOMPRESSORS = {
+    # 16 + MAX_WBITS: a gzip header and trailer
+    GZIP: lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    XZ: lzma.LZMADecompressor,
+    ZSTD: _zstd_decompressor,
+}
+METHODS = tuple(_DECOMPRESSORS)
+
+
+def detect_method(head: Optional[bytes], path: str) -> Optional[str]:
+    """the compression of a file from its first bytes, or from its name when they are not known
+
+    Returns:
+        Optional[str]: one of `METHODS`, None if it does not look compressed
+    """
+    if head:
+        for magic, method in _MAGIC:
+            if head.startswith(magic):
+                return method
+        return None
+    ext = os.path.splitext(path)[1].lower()
+    return _EXTENSIONS[ext][1] if ext in _EXTENSIONS else None
+
+
+def decompressed_path(path: str) -> str:
+    """`archive.tar.gz` -> `archive.tar`, `archive.tgz` -> `archive.tar`"""
+    root, ext = os.path.splitext(path)
+    if ext.lower() in _EXTENSIONS:
+        return root + _EXTENSIONS[ext.lower()][0]
+    return f"{path}.out"
+
+
+class StreamDecompressor(OrderedStream):
+    """
+    Decompresses the file in order into `path` while it downloads, see `OrderedStream`.
+    Concatenated members (gzip) and streams or frames (xz, zstd) are decompressed one after the other,
+    zero bytes after one of them are padding and are skipped.
+    An error stops the decompression, it is raised by `finish` so the download itself is not interrupted.
+
+    Args:
+        method (str): one of `METHODS`
+        path (str): the decompressed file
+        locate (Optional[Callable[[int], Optional[Tuple[str, int, int]]]], optional): see `OrderedStream`. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        locate: Optional[Callable[[int], Optional[Tuple[str, int, int]]]] = None,
+    ):
+        if method not in _DECOMPRESSORS:
+            raise ValueError(f"Unknown compression: {method}")
+        super().__init__(locate)
+        self.method = method
+        self.path = path
+        self.error: Optional[Exception] = None
+        self._new = _DECOMPRESSORS[method]
+        self._decompressor = self._new()
+        # whether the current member has been given any input
+        self._started = False
+        # members decompressed so far
+        self._members = 0
+        self._out = open(path, "wb")
+
+    def _consume(self, data) -> None:
+        if self.error:
+            return
+        try:
+            while data:
+                if not self._started and self._members and not data[0]:
+                    # a member never starts with a zero byte
+                    data = bytes(data).lstrip(b"\0")
+                    if not data:
+                        return
+                self._started = True
+                self._decompress(data)
+                if not getattr(self._decompressor, "eof", False):
+                    return
+                data = self._decompressor.unused_data
+                self._decompressor = self._new()
+                self._started = False
+                self._members += 1
+        except Exception as e:
+            # zlib.error, lzma.LZMAError, zstd errors or a full disk
+            self.error = e
+
+    def _decompress(self, data) -> None:
+        """write out what `data` decompresses to, `OUT_BLOCK` bytes at a time,
+        until the decompressor needs more input or the member ends"""
+        d = self._decompressor
+        if hasattr(d, "unconsumed_tail"):
+            # zlib keeps the input it did not get to
+            while True:
+                out = d.decompress(data, OUT_BLOCK)
+                self._out.write(out)
+                data = d.unconsumed_tail
+                if d.eof or (not data and len(out) < OUT_BLOCK):
+                    return
+        elif hasattr(d, "needs_input"):
+            # lzma and zstd keep it internally
+            while True:
+                self._out.write(d.decompress(data, OUT_BLOCK))
+                data = b""
+                if d.eof or d.needs_input:
+                    return
+        else:
+            # the decompressobj of zstandard has no max_length
+            self._out.write(d.decompress(data))
+
+    def finish(self, source: str) -> str:
+        """decompress the rest of the downloaded file `source`, from where the stream got to
+
+        Raises:
+            DecompressionError: the file is not valid or ends in the middle of a member,
+                the decompressed file is removed
+        Returns:
+            str: the decompressed file
+        """
+        self.stop()
+        with self._lock, open(source, "rb") as f:
+            f.seek(self.position)
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                self._consume(block)
+                self.position += len(block)
+            if not self.error and hasattr(self._decompressor, "flush"):
+                self._out.write(self._decompressor.flush())
+            if not self.error and self._started:
+                self.error = EOFError(
+                    "the compressed data ends in the middle of a member"
+                )
+            self._out.close()
+        if self.error:
+            os.remove(self.path)
+            raise DecompressionError(
+                f"Could not decompress {source} ({self.method}): {self.error!r}"
+            )
+        return self.path
+
+    def close(self) -> None:
+        """stop without finishing, the decompressed file is removed"""
+        self.stop()
+        with self._lock:
+            if not self._out.closed:
+                self._out.close()
+                os.remove(self.path)
@@ -0,0 +1,159 @@
+"""
+Hashing a download in file order while its segments arrive out of order
+"""
+
+from hashlib import new as new_hash_fn
+from threading import Event, Lock, Thread
+from typing import Callable, Optional, Tuple
+
+READ_BLOCK = 4 * 1024 * 1024
+
+
+def parse_digest(digest: str) -> Tuple[str, str]:
+    """splits `"<algorithm>:<hex digest>"`, a bare hex digest is taken to be sha256
+
+    Example:
+        >>> parse_digest("md5:D41D8CD98F00B204E9800998ECF8427E")
+        ('md5', 'd41d8cd98f00b204e9800998ecf8427e')
+    Raises:
+        ValueError: hashlib does not support the algorithm
+    Returns:
+        Tuple[str, str]: the algorithm and the lower case digest
+    """
+    algorithm, _, value = digest.strip().rpartition(":")
+    algorithm = algorithm.lower() or "sha256"
+    try:
+        new_hash_fn(algorithm)
+    except ValueError:
+        raise ValueError(f"hashlib does not support the method {algorithm}")
+    return algorithm, value.lower()
+
+
+def file_digest(path: str, algorithm: str) -> str:
+    """hex digest of a whole file"""
+    h = new_hash_fn(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OrderedStream(object):
+    """
+    Consumes the file in order while its segments are written out of order, without reading it again
+    once the download is done. Bytes written right at the stream's position are consumed as they arrive (`feed`),
+    the rest is read back by `catch_up` once the bytes in front of them are there,
+    while it is still likely to be in the page cache. Subclasses implement `_consume`.
+
+    Args:
+        locate (Optional[Callable[[int], Optional[Tuple[str, int, int]]]], optional): given a file position,
+            returns the file that holds the bytes starting there, the offset of the position in it and
+            how many bytes of it have been written, None if the position has not been written yet.
+            Without it only `feed` can advance the stream. Defaults to None.
+    """
+
+    def __init__(
+        self, locate: Optional[Callable[[int], Optional[Tuple[str, int, int]]]] = None
+    ):
+        self.locate = locate
+        self.position = 0
+        self._lock = Lock()
+        self._catch_up_lock = Lock()
+        self._wake = Event()
+        self._stopped = False
+        self._thread = None
+
+    def _consume(self, data) -> None:
+        raise NotImplementedError
+
+    def feed(self, offset: int, data) -> bool:
+        """consume `data` if it starts at the stream's position
+
+        Returns:
+            bool: whether the data was consumed
+        """
+        if offset != self.position:
+            # not for this writer, no need to wait for the one that is consuming
+            return False
+        with self._lock:
+            if offset != self.position:
+                return False
+            self._consume(data)
+            self.position += len(data)
+            return True
+
+    def catch_up(self) -> None:
+        """consume the bytes that have been written from the stream's position onwards"""
+        if self.locate is None:
+            return
+        with self._catch_up_lock:
+            while True:
+                with self._lock:
+                    start = self.position
+                where = self.locate(start)
+                if not where or where[2] <= 0:
+                    return
+                path, offset, n = where
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(min(n, READ_BLOCK))
+                if not data:
+                    return
+                with self._lock:
+                    # the writer of these bytes could not have fed them, they are behind its position
+                    if self.position != start:
+                        continue
+                    self._consume(data)
+                    self.position += len(data)
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait()
+            self._wake.clear()
+            self.catch_up()
+
+    def start(self) -> None:
+        """catch up in a background thread every time `notify` is called"""
+        self._stopped = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        """a segment is done, the bytes after the hashed position might be there now"""
+        self._wake.set()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+
+class StreamHasher(OrderedStream):
+    """
+    Hashes the file in order while it downloads, see `OrderedStream`
+
+    Args:
+        algorithm (str): any hashlib algorithm
+        locate (Optional[Callable[[int], Optional[Tuple[str, int, int]]]], optional): see `OrderedStream`. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        locate: Optional[Callable[[int], Optional[Tuple[str, int, int]]]] = None,
+    ):
+        super().__init__(locate)
+        self.algorithm = algorithm
+        self._hash = new_hash_fn(algorithm)
+
+    def _consume(self, data) -> None:
+        self._hash.update(data)
+
+    def hexdigest(self) -> str:
+        """catch up with the written bytes and return the digest of everything hashed"""
+        self.catch_up()
+        with self._lock:
+            return self._hash.hexdigest()
@@ -1,18 +1,113 @@
 import shutil
 import sys
-from os import remove
-from os.path import basename, isfile, join, realpath
-from threading import Thread as _Parallel_impl
-from time import time
-from typing import Union, Optional
-from ._cache import get_cached_file, get_cachedir, make_cached_file
-from .report import Report, to_screen
-from .URL import URL, UA_d, basic_headers
-from .util import force_round, make_range_sizes, safe_getsize, to_MB
+from os import getpid, remove, replace, truncate
+from contextlib import closing, contextmanager
+from os.path import basename, getsize, isfile, join, realpath, splitext
+from random import uniform
+from threading import Event, Lock, Thread as _Parallel_impl
+from time import sleep, time
+from typing import Callable, Iterator, List, Union, Optional
+from zlib import crc32
+from ._cache import CacheEntry, DownloadCache, get_cachedir
+from .bandwidth import Bandwidth, TokenBucket, global_bandwidth
+from .decompress import AUTO as AUTO_DECOMPRESS
+from .decompress import METHODS as DECOMPRESS_METHODS
+from .decompress import StreamDecompressor, decompressed_path, detect_method
+from .digest import StreamHasher, file_digest, parse_digest
+from .events import (
+    COMPLETE,
+    DOWNLOAD_FAILED,
+    MERGE,
+    PROBED,
+    PROGRESS,
+    SEGMENT_DONE,
+    SEGMENT_FAILED,
+    SEGMENT_PROGRESS,
+    SEGMENT_RETRY,
+    SEGMENT_STARTED,
+    DownloadEvent,
+    Throughput,
+)
+from .journal import MetaJournal
+from .locking import DownloadLock, prune_locks
+from .mirrors import Mirror, MirrorSet
+from .reorder import STREAM_BUFFER_SIZE, ReorderBuffer, ReorderWriter
+from .report import Report, err_to_screen, to_screen
+from .segments import (
+    DONE,
+    FAILED,
+    MIN_SEGMENT_SIZE,
+    PENDING,
+    SegmentScheduler,
+    SegmentStatus,
+    remaining,
+)
+from .stream import BUFFER_SIZE, MIN_CHUNK, stream_response
+from .tuning import AUTO, ConnectionTuner, learned_connections, save_connections
+from .URL import (
+    URL,
+    UA_d,
+    basic_headers,
+    default_pool,
+    int_or_none,
+    pool_stats,
+)
+from .util import (
+    Counter,
+    DigestMismatchError,
+    DownloadLockedError,
+    IncompleteDownloadError,
+    MetaError,
+    RemoteFileChangedError,
+    StalledError,
+    TransientHTTPError,
+    force_round,
+    make_range_sizes,
+    safe_getsize,
+    to_MB,
+)
+from .writer import (
+    IN_PLACE_MODES,
+    MMAP,
+    PARTS,
+    WRITE_MODES,
+    MappedFile,
+    MmapWriter,
+    PartFileWriter,
+    PreallocWriter,
+    file_crc32,
+    preallocate,
+)
 
 _FILE_HASH_FLAG = object()
 
 
+def retryable_errors() -> tuple:
+    """the errors a segment is retried after, anything else fails it right away.
+    the modules they come from are left to the code that uses them, whatever raised the error has imported them
+    """
+    errors = (OSError,)
+    for module, name in (
+        ("http.client", "HTTPException"),
+        ("urllib3.exceptions", "HTTPError"),
+        ("asyncio", "TimeoutError"),
+    ):
+        if module in sys.modules:
+            errors += (getattr(sys.modules[module], name),)
+    return errors
+
+
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+# answers that mean the server wants fewer connections
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class _RetireWorker(Exception):
+    """raised in a worker that has to stop because there are more connections than the tuner wants"""
+
+    pass
+
+
 class Downloader(object):
     """
     Downloader Class  
@@ -23,8 +118,24 @@ class Downloader(object):
             d (Optional[str], optional): Directory to save the file in. Defaults to None.
             intermediate_fn (Optional[str], optional): Filename for the intermediate files created in the threads. Defaults to None.
             is_cli (Optional[bool], optional): Is CLI. Defaults to False.
-            t (Optional[int], optional): Number of threads to run the download in. Defaults to 3.
+            t (Optional[Union[int, str]], optional): Number of threads to run the download in, "auto" to find the
+                number of connections that is fastest for the host (see `ConnectionTuner`). Defaults to 3.
             v (Optional[bool], optional): Verbosity. Defaults to False.
+            write_mode (Optional[str], optional): "parts" writes every thread into its own intermediate file and merges them at the end,
+                "prealloc" preallocates the output file and every thread writes at its own offset,
+                "mmap" maps the preallocated file into memory and the responses are read straight into it. Defaults to "parts".
+            digest (Optional[str], optional): expected digest of the file as "<hashlib algorithm>:<hex digest>" (sha256 if the algorithm is left out),
+                the file is hashed while it downloads and `DigestMismatchError` is raised if it does not match. Defaults to None.
+            rate_limit (Optional[float], optional): bandwidth limit of the download in bytes per second. Defaults to None.
+            mirrors (Optional[List[Union[URL, str]]], optional): other urls of the same file, the segments are spread over
+                all of them by speed. Mirrors whose size or content does not match `url` are left out. Defaults to None.
+            listeners (Optional[List[Callable[[DownloadEvent], None]]], optional): called with every event of the download,
+                see `add_listener`. Defaults to None.
+            cache (Optional[DownloadCache], optional): finished downloads are kept in it and a cached file
+                the server confirms with a 304 (or that has the expected sha256) is copied instead of downloaded. Defaults to None.
+            decompress (Optional[str], optional): "gzip", "xz" or "zstd" decompresses the file while it downloads
+                (next to it, without the extension, see `decompressed_path`), "auto" tells the compression from the first bytes
+                or the file name and leaves files that are not compressed alone. Defaults to None.
     """
 
     is_resumable: bool = False
@@ -32,6 +143,58 @@ class Downloader(object):
     did_resume: bool = False
     report: bool = True
     _continued_size: int = 0
+    # raised by start() once the threads are done, i.e. RemoteFileChangedError
+    _fatal_error: Optional[Exception] = None
+    _scheduler: Optional[SegmentScheduler] = None
+    _retries: dict = {}
+    _errors: dict = {}
+    _hasher: Optional[StreamHasher] = None
+    # hex digest of the downloaded file, set when an expected digest was given
+    file_digest: Optional[str] = None
+    _decompressor: Optional[StreamDecompressor] = None
+    # the decompressed file, set when the file was decompressed
+    decompressed_path: Optional[str] = None
+    _last_checkpoint: float = 0
+    checkpoint_interval: float = 1
+    progress_interval: float = 0.1
+    # fixed read size for the response bodies, adapts to the throughput when None
+    chunk_size: Optional[int] = None
+    buffer_size: int = BUFFER_SIZE
+    # idle threads split the largest remaining segment down to this size
+    min_segment_size: int = MIN_SEGMENT_SIZE
+    # shared with the other downloads, its rate caps all of them together
+    bandwidth: Bandwidth = global_bandwidth
+    _bucket: Optional[TokenBucket] = None
+    # a segment is given up after failing this many times in a row,
+    # the download stops retrying after `max_retries` failures in total
+    segment_retries: int = 5
+    max_retries: int = 20
+    # the wait before a retry doubles from `retry_backoff` up to `max_backoff` seconds, half of it is random
+    retry_backoff: float = 0.5
+    max_backoff: float = 30
+    connect_timeout: float = 10
+    # a connection that does not send anything for this long is retried
+    read_timeout: float = 30
+    # bytes per second a connection has to average over `stall_window` seconds, not checked when None
+    min_speed: Optional[float] = None
+    stall_window: float = 10
+    # t="auto": connections to start with when nothing was learnt about the host yet, the most it may use
+    # and how often (in seconds) the connection count is reconsidered
+    auto_start: int = 2
+    max_connections: int = 16
+    tune_interval: float = 0.25
+    _tuner: Optional[ConnectionTuner] = None
+    # the output file of the mmap write mode
+    _mapping: Optional[MappedFile] = None
+    # seconds to wait for another process that downloads the same url, forever when None
+    lock_timeout: Optional[float] = None
+    # seconds after which the lock file of a download nobody holds is removed, see `prune_locks`
+    lock_max_age: float = 3600.0
+    # `iter_bytes`: how far the segments may download ahead of the consumer, in bytes
+    stream_buffer_size: int = STREAM_BUFFER_SIZE
+    _reorder: Optional[ReorderBuffer] = None
+    # save paths of the other downloads of a batch, see `_reserve_save_path`
+    taken_paths: Optional[set] = None
 
     def _verbose_logger(self, t: str, *args, **k):
 
@@ -43,33 +206,67 @@ class Downloader(object):
             "URL-REDIR": lambda u: f"After Redirect:{u}",
             "INIT-INFO": lambda ua, is_resumable, s_path, m_file: f"User agent:{ua}\n\
                 [logger]resumable: {is_resumable}\n[logger]save path:{s_path}\n[logger]Meta filename:{m_file}",
+            "POOL-STATS": lambda s: f"Connections: {s}",
+            "TUNE": lambda n: f"Connections: {n}",
+            "MIRROR": lambda u: f"Mirror:{u}",
+            "RETRY": lambda idx, e, delay: f"Chunk number: {idx} failed ({e!r}), retrying in {force_round(delay, 2)}s",
         }
         fn = logger_map.get(t)
         if fn:
-            return print("[logger]", fn(*args, **k) if args else fn(**k))
+            return to_screen(f"[logger] {fn(*args, **k) if args else fn(**k)}\n")
 
     def _make_file(self):
         """
         Internal method that combines all the temporary files into the final file
         Raises:
            ValueError: When the size of the intermediate files does not match the file size in the content-length headers
+           RemoteFileChangedError: When the file changed on the server while it was being downloaded
+           IncompleteDownloadError: When some segments ran out of retries
+           DigestMismatchError: When the file does not have the expected digest, the download is discarded
         """
+        if self._fatal_error:
+            raise self._fatal_error
+        failed = [i for i in self.segment_status if i.status == FAILED]
+        if failed:
+            raise IncompleteDownloadError(
+                f"{len(failed)} chunk(s) could not be downloaded, the download can be resumed: "
+                + ", ".join(f"{i.index} ({i.error!r})" for i in failed),
+                failed,
+            )
         if self._downloaded_size != self.filesize:
             raise ValueError(
                 f"Downloaded filesize ({to_MB(self._downloaded_size)})  does not match expected size of {to_MB(self.filesize)} MB"
             )
-        c = self.threads
-
-        with open(self.save_path, "wb") as wfd:
-            for i in range(c):
-                f = get_cachedir(f"{self.filename}.part.{i}")
+        try:
+            self._check_digest()
+        except DigestMismatchError:
+            self._discard(self._meta)
+            self._journal.remove()
+            raise
+        self._emit(MERGE, completed=self._downloaded_size, total=self.filesize)
+        if self.write_mode in IN_PLACE_MODES:
+            # the data is already in place, nothing to merge
+            replace(self._meta["target"], self.save_path)
+            self._journal.remove()
+            return
+        segments = sorted(self._meta["reqs"], key=lambda i: i["from"])
+        parts = [
+            get_cachedir(f"{self._meta['filename']}.part.{i['file_index']}")
+            for i in segments
+        ]
+        # the file only appears once it is whole, a crash while merging leaves the parts and the metadata alone
+        merged = f"{self.save_path}.part"
+        with open(merged, "wb") as wfd:
+            for f in parts:
                 with open(f, "rb") as fd:
                     shutil.copyfileobj(fd, wfd, 1024 * 1024 * 10)
-                remove(f)
-        remove(get_cachedir(f"{self._meta_file_name}.data.json"))
+        replace(merged, self.save_path)
+        self._journal.remove()
+        for f in parts:
+            remove(f)
 
     def _progress_callback(self, size: float, speed: float, perc: float):
-        """Called Everytime the request receives a chunk of data and updates the screen
+        """Called every `progress_interval` seconds while the download runs and updates the screen
         
         Args:
             size (float): Current downloaded file size
@@ -87,11 +284,120 @@ class Downloader(object):
 
     @property
     def _downloaded_size(self):
-        return sum(
-            safe_getsize(get_cachedir(f"{self.filename}.part.{i}"))
-            for i in range(self.threads)
+        return self._progress.value
+
+    def _emit_progress(self):
+        size = self._downloaded_size
+        if self.listeners:
+            self._progress_events(size)
+        if not self.report:
+            return
+        elapsed = self._elapsed_time
+        perc = force_round((size / self.filesize) * 100, 2) if self.filesize else 0
+        speed = force_round(
+            ((size - self._continued_size) / (1024 * 1024)) / elapsed if elapsed else 0,
+            2,
+        )
+        self._progress_callback(size, speed, perc)
+
+    def add_listener(self, fn: Callable[[DownloadEvent], None]) -> None:
+        """call `fn` with every `events.DownloadEvent` of the download,
+        it runs on the thread (or event loop) the event happens on and should return quickly
+        """
+        self.listeners.append(fn)
+
+    def _emit(self, type: str, **fields) -> None:
+        if not self.listeners:
+            return
+        event = DownloadEvent(type, time(), self._requested_url, **fields)
+        for fn in self.listeners:
+            fn(event)
+
+    def _segment_event(self, type: str, seg: dict, **fields) -> None:
+        self._emit(
+            type,
+            segment=seg["file_index"],
+            completed=seg["completed"],
+            total=seg["to"] - seg["from"] + 1,
+            **fields,
+        )
+
+    def _progress_events(self, size: int) -> None:
+        """the progress of the segments that moved since the last call and of the whole file"""
+        now = time()
+        if self._meta:
+            with self._lock:
+                segments = [dict(i) for i in self._meta["reqs"]]
+            for seg in segments:
+                rate = self._rates.setdefault(seg["file_index"], Throughput())
+                moved = rate.total is not None and rate.total != seg["completed"]
+                speed, avg = rate.update(now, seg["completed"])
+                if moved:
+                    self._segment_event(
+                        SEGMENT_PROGRESS,
+                        seg,
+                        speed=speed,
+                        avg_speed=avg,
+                        eta=rate.eta(remaining(seg)),
+                    )
+        speed, avg = self._rate.update(now, size)
+        self._emit(
+            PROGRESS,
+            completed=size,
+            total=self.filesize,
+            speed=speed,
+            avg_speed=avg,
+            eta=self._rate.eta(self.filesize - size) if self.filesize else None,
+        )
+
+    @contextmanager
+    def _outcome(self):
+        """emit COMPLETE or DOWNLOAD_FAILED when the download is over"""
+        try:
+            yield
+        except BaseException as e:
+            self._emit(
+                DOWNLOAD_FAILED,
+                completed=self._downloaded_size,
+                total=self.filesize,
+                error=e,
+            )
+            raise
+        elapsed = self._elapsed_time
+        speed = (
+            (self._downloaded_size - self._continued_size) / elapsed if elapsed else 0
+        )
+        self._emit(
+            COMPLETE,
+            completed=self._downloaded_size,
+            total=self.filesize,
+            speed=speed,
+            avg_speed=speed,
+            eta=0.0,
         )
 
+    def _report_progress(self, done: Event):
+        while not done.wait(self.progress_interval):
+            self._emit_progress()
+        self._emit_progress()
+
+    @contextmanager
+    def _progress_reporter(self):
+        """Runs `_progress_callback` at a fixed rate in a separate thread
+        so the download threads only have to bump the byte counter
+        """
+        if not self.report and not self.listeners:
+            yield
+            return
+        done = Event()
+        th = _Parallel_impl(target=self._report_progress, args=(done,), daemon=True)
+        th.start()
+        try:
+            yield
+        finally:
+            done.set()
+            th.join()
+
     def __init__(
         self,
         url: Union[URL, str],
@@ -100,34 +406,95 @@ class Downloader(object):
         d: Optional[str] = None,
         intermediate_fn: Optional[str] = None,
         is_cli: Optional[bool] = False,
-        t: Optional[int] = 3,
+        t: Optional[Union[int, str]] = 3,
         v: Optional[bool] = False,
+        write_mode: Optional[str] = None,
+        digest: Optional[str] = None,
+        rate_limit: Optional[float] = None,
+        mirrors: Optional[List[Union[URL, str]]] = None,
+        listeners: Optional[List[Callable[[DownloadEvent], None]]] = None,
+        cache: Optional[DownloadCache] = None,
+        decompress: Optional[str] = None,
     ):
+        self._init_options(
+            url,
+            ua,
+            is_cli,
+            t,
+            v,
+            write_mode,
+            digest,
+            rate_limit,
+            listeners,
+            cache,
+            decompress,
+        )
+        if f and f != "PY_HASH":
+            # fail before any request is made
+            self._check_save_path(self._resolve_save_path(f, d))
+        self.url.follow_redirects()
+        self._verbose_logger("URL-REDIR", str(self.url))
+        self._init_file(f, d, intermediate_fn)
+        self._init_mirrors(mirrors)
+        self._emit(PROBED, total=self.filesize)
 
+    def _init_options(
+        self,
+        url: Union[URL, str],
+        ua: Optional[str],
+        is_cli: Optional[bool],
+        t: Optional[Union[int, str]],
+        v: Optional[bool],
+        write_mode: Optional[str],
+        digest: Optional[str] = None,
+        rate_limit: Optional[float] = None,
+        listeners: Optional[list] = None,
+        cache: Optional[DownloadCache] = None,
+        decompress: Optional[str] = None,
+    ):
+        """set up everything that does not need the url's meta data"""
         self._verb = v
+        self.listeners = list(listeners or ())
+        self.cache = cache
+        self.write_mode = write_mode or PARTS
+        if self.write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode: {self.write_mode}")
+        self.digest = parse_digest(digest) if digest else None
+        if decompress and decompress not in (AUTO_DECOMPRESS,) + DECOMPRESS_METHODS:
+            raise ValueError(f"Unknown compression: {decompress}")
+        self.decompress = decompress
+        self.rate_limit = rate_limit
+        self._meta = None
+        self._lock = Lock()
+        self._progress = Counter()
         self._verbose_logger("INIT")
-        self.__thread_count = t or 3
+        self._thread_count = t or 3
         self.url = URL(url)
+        self._requested_url = str(self.url)
         self._verbose_logger("URL-RECEIVED", str(self.url))
-        self.url.follow_redirects()
-        self._verbose_logger("URL-REDIR", str(self.url))
         self.user_agent = ua or UA_d
         self.is_cli = is_cli
         self.report = Report(is_cli)
         self.report.report_init()
+
+    def _init_file(
+        self, f: Optional[str], d: Optional[str], intermediate_fn: Optional[str]
+    ):
+        """work out the size, resumability and save path once the url's meta data is known"""
         self.filesize = self.url.file_size
         self.is_resumable = (
             self.url._m_headers.get("accept-ranges", "").lower() == "bytes"
             and self.filesize
         )
         self._meta_file_name = self.url.get_filesafe_url()
+        self._journal = MetaJournal(self._meta_file_name)
         self.filename = intermediate_fn or self._meta_file_name
         save_path = (
             self._meta_file_name
             if f == "PY_HASH"
             else (f or (self.url.get_suggested_filename() or self.filename))
         )
-        self.save_path = join(d, basename(save_path)) if d else realpath(save_path)
+        self.save_path = self._reserve_save_path(self._resolve_save_path(save_path, d))
         self._verbose_logger(
             "INIT-INFO",
             self.user_agent,
@@ -135,9 +502,28 @@ class Downloader(object):
             self.save_path,
             self._meta_file_name,
         )
-        if isfile(self.save_path):
-            raise FileExistsError(f"Filename:{self.save_path} already exists")
-        print(f"Filesize: {to_MB(self.filesize)} MB")
+        to_screen(f"Filesize: {to_MB(self.filesize)} MB\n")
+
+    @staticmethod
+    def _resolve_save_path(name: str, d: Optional[str]) -> str:
+        return join(d, basename(name)) if d else realpath(name)
+
+    def _reserve_save_path(self, path: str) -> str:
+        """`path`, or `name.1.ext`, `name.2.ext`... if another download of the batch (`taken_paths`) saves to it"""
+        if self.taken_paths is None:
+            return path
+        root, ext = splitext(path)
+        n = 0
+        while path in self.taken_paths:
+            n += 1
+            path = f"{root}.{n}{ext}"
+        self.taken_paths.add(path)
+        return path
+
+    @staticmethod
+    def _check_save_path(path: str) -> None:
+        if isfile(path):
+            raise FileExistsError(f"Filename:{path} already exists")
 
     def _generate_init_headers(self, thread_count: int) -> dict:
         """Generate initial headers for the download
@@ -149,46 +535,417 @@ class Downloader(object):
             dict: headers for the download
         """
 
-        req = []
-        previous_range = 0
-        range_headers = make_range_sizes(self.filesize, thread_count)
-        for i in range_headers:
-            req.append(
-                {
-                    "range": i["range"],
-                    "from": i["from"],
-                    "to": i["to"],
-                    "file_index": previous_range,
-                    "file_size": i["size"],
-                }
-            )
-            previous_range += 1
-        reqs = {"headers": basic_headers, "filename": self.filename, "reqs": req}
-        make_cached_file(self._meta_file_name, reqs)
+        req = self._make_segments(thread_count)
+        reqs = {
+            "headers": basic_headers,
+            "filename": self.filename,
+            "reqs": req,
+            "mode": self.write_mode,
+            "validators": self._get_validators(),
+        }
+        if self.write_mode in IN_PLACE_MODES:
+            reqs["target"] = f"{self.save_path}.part"
+            preallocate(reqs["target"], self.filesize)
+        self._meta = reqs
+        self._use_probe_data(req[0])
+        self._save_meta()
         return reqs
 
-    def _download_handler(self, h: dict, file: str, idx: int):
+    def _make_segments(self, count: int) -> list:
+        """`count` segments covering the whole file, none of them started"""
+        # no empty segments for a file smaller than the thread count
+        count = max(1, min(count, self.filesize))
+        return [
+            {
+                "range": i["range"],
+                "from": i["from"],
+                "to": i["to"],
+                "file_index": idx,
+                "file_size": i["size"],
+                "completed": 0,
+                "crc": 0,
+            }
+            for idx, i in enumerate(make_range_sizes(self.filesize, count))
+        ]
+
+    def _use_probe_data(self, seg: dict) -> None:
+        """the metadata probe already read the first bytes of the file, they become the start of the first segment"""
+        data = self.url.probe_data
+        self.url.probe_data = None
+        if not data or seg["from"] != 0:
+            return
+        data = data[: seg["file_size"]]
+        f = self._get_writer(seg)
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        seg.update(crc=crc32(data), completed=len(data))
+        self._progress.add(len(data))
+
+    def _get_validators(self) -> dict:
+        h = self.url._m_headers
+        return {
+            "etag": h.get("etag"),
+            "last-modified": h.get("last-modified"),
+            "content-length": self.filesize,
+        }
+
+    def _validators_match(self, data: dict) -> bool:
+        """check that the file on the server is still the one the metadata was made for"""
+        if max(i["to"] for i in data["reqs"]) + 1 != self.filesize:
+            return False
+        # metadata from before validators were saved can only be checked by size
+        return self._same_validators(data.get("validators") or {})
+
+    def _same_validators(self, saved: dict) -> bool:
+        current = self._get_validators()
+        for k, v in saved.items():
+            if v is not None and current.get(k) is not None and v != current[k]:
+                return False
+        return True
+
+    @staticmethod
+    def _pick_if_range(v: dict) -> Optional[str]:
+        etag = v.get("etag")
+        # If-Range needs a strong validator
+        if etag and not etag.startswith("W/"):
+            return etag
+        return v.get("last-modified")
+
+    @property
+    def _if_range(self) -> Optional[str]:
+        return self._pick_if_range(self._meta.get("validators") or {})
+
+    def _init_mirrors(self, urls: Optional[list]) -> None:
+        """check that the mirrors serve the same file as the url, the ones that do not are left out"""
+        mirrors = [Mirror(self.url)]
+        if urls and self.is_resumable:
+            for u in urls:
+                m = self._check_mirror(URL(u))
+                if m:
+                    mirrors.append(m)
+        self.mirrors = MirrorSet(mirrors)
+
+    def _check_mirror(self, url: URL) -> Optional[Mirror]:
+        try:
+            url.update_url_meta_data(use_cache=False)
+        except retryable_errors() as e:
+            err_to_screen(
+                f"[Warning] mirror {url} is not reachable ({e.__class__.__name__}), skipping\n"
+            )
+            return None
+        h = url._m_headers
+        etag = h.get("etag")
+        if h.get("accept-ranges", "").lower() != "bytes":
+            reason = "does not support ranges"
+        elif int_or_none(h.get("content-length")) != self.filesize:
+            reason = f"size is {h.get('content-length')}, expected {self.filesize}"
+        elif (
+            etag
+            and etag == self.url._m_headers.get("etag")
+            and not etag.startswith("W/")
+        ) or (url.probe_data and url.probe_data == self.url.probe_data):
+            self._verbose_logger("MIRROR", str(url))
+            return Mirror(url, self._pick_if_range(h))
+        else:
+            reason = "content differs"
+        err_to_screen(f"[Warning] mirror {url} {reason}, skipping\n")
+        return None
+
+    def _range_headers(
+        self, hdr: dict, seg: dict, mirror: Optional[Mirror] = None
+    ) -> dict:
+        """headers for the request of the remaining bytes of `seg` (from `mirror`)"""
+        h = {
+            **hdr,
+            # the ranges are of the file as it is stored, a server could compress each of them on its own
+            "Accept-Encoding": "identity",
+            "range": f"bytes={seg['from']+seg['completed']}-{seg['to']}",
+        }
+        if_range = mirror.if_range if mirror and mirror.if_range else self._if_range
+        if if_range:
+            # the server sends the whole (new) file instead of the range if it changed
+            h["If-Range"] = if_range
+        return h
+
+    def _check_range_response(self, status_code: int, h: dict) -> None:
+        """
+        Raises:
+            RemoteFileChangedError: the server ignored the range because the If-Range validator does not match anymore
+            TransientHTTPError: the server is busy or failing, the request can be retried
+            MetaError: the server ignored the range
+        """
+        if status_code == 206:
+            return
+        if status_code == 200 and "If-Range" in h:
+            raise RemoteFileChangedError(
+                f"{self.url} changed since the download started, it has to be started over"
+            )
+        if status_code in RETRY_STATUS_CODES:
+            raise TransientHTTPError(
+                f"{status_code} for {h['range']} of {self.url}", status_code
+            )
+        raise MetaError(
+            f"Expected a partial response for {h['range']}, got {status_code}"
+        )
+
+    def _checkpoint(self, force: bool = False) -> None:
+        """Save the progress of every range to the meta file, at most once every `checkpoint_interval` seconds
+
+        Args:
+            force (bool, optional): save regardless of when the last checkpoint was made. Defaults to False.
+        """
+        now = time()
+        if not force and now - self._last_checkpoint < self.checkpoint_interval:
+            return
+        if self._reorder:
+            # a stream is not saved, there is nothing to resume
+            return
+        with self._lock:
+            self._last_checkpoint = now
+            if self._journal.needs_compaction:
+                self._save_meta()
+                return
+            changed = []
+            for seg in self._meta["reqs"]:
+                state = (seg["completed"], seg["crc"], seg["to"])
+                last = self._journaled.get(seg["file_index"])
+                if state == last:
+                    continue
+                # on resume only the bytes written since the previous checkpoint are checked
+                seg["check"] = list(last[:2]) if last else [0, 0]
+                self._journaled[seg["file_index"]] = state
+                changed.append(seg)
+            if changed:
+                self._journal.append(changed)
+
+    def _save_meta(self) -> None:
+        """write a snapshot of the metadata, which compacts the journal of checkpoints"""
+        self._journaled = {
+            i["file_index"]: (i["completed"], i["crc"], i["to"])
+            for i in self._meta["reqs"]
+        }
+        self._journal.save(self._meta)
+
+    def _get_writer(self, r: dict):
+        if self._reorder:
+            return ReorderWriter(self._reorder, r["from"] + r["completed"])
+        if self.write_mode == MMAP:
+            return MmapWriter(self._map_target(), r["from"] + r["completed"])
+        if self.write_mode in IN_PLACE_MODES:
+            return PreallocWriter(self._meta["target"], r["from"] + r["completed"])
+        # a segment that has not been started might have a stale part file from
+        # a split that was never saved
+        return PartFileWriter(self._meta["filename"], r["file_index"], r["completed"])
+
+    def _map_target(self) -> MappedFile:
+        with self._lock:
+            if self._mapping is None:
+                self._mapping = MappedFile(self._meta["target"], self.filesize)
+            return self._mapping
+
+    @contextmanager
+    def _mapped(self):
+        """unmap the output file (see `_map_target`) once the segments are done"""
+        try:
+            yield
+        finally:
+            if self._mapping:
+                self._mapping.close()
+                self._mapping = None
+
+    def _segment_callbacks(self, req: dict, f) -> tuple:
+        """callbacks for `stream_response` that write the segment into `f`
+        and keep its `completed` count and the progress counter up to date
+
+        Returns:
+            tuple: write, on_read, limit and unwritten, which returns how many of the bytes read
+                did not make it to the file (the request failed before they could be written)
+        """
+        start = req["from"] + req["completed"]
+        read = 0
+        window_start, window_read = time(), 0
+
+        def write(b):
+            f.write(b)
+            pos = req["from"] + req["completed"]
+            if self._hasher:
+                self._hasher.feed(pos, b)
+            if self._decompressor:
+                self._decompressor.feed(pos, b)
+            # one update so a checkpoint never sees a checksum that does not match the size
+            req.update(crc=crc32(b, req["crc"]), completed=req["completed"] + len(b))
+            self._checkpoint()
+
+        def on_read(n):
+            nonlocal read, window_start, window_read
+            read += n
+            self._progress.add(n)
+            if not self.min_speed:
+                return
+            window_read += n
+            elapsed = time() - window_start
+            if elapsed >= self.stall_window:
+                if window_read / elapsed < self.min_speed:
+                    raise StalledError(
+                        f"{to_MB(window_read / elapsed)} MB/s for chunk number {req['file_index']}"
+                    )
+                window_start, window_read = time(), 0
+
+        def limit(n):
+            if self._retire and self._take_retirement():
+                raise _RetireWorker()
+            if self._reorder:
+                # wait while the consumer of the stream is too far behind
+                n = self._reorder.reserve(start + read, n)
+                if not n:
+                    # the stream is over
+                    raise _RetireWorker()
+            if self.min_speed:
+                # a read blocks until it is full, a slow one must not outlast the window
+                n = min(n, max(MIN_CHUNK, int(self.min_speed * self.stall_window)))
+            # the end of the segment moves if another thread steals part of it
+            return self._scheduler.reserve(req, start + read, n)
+
+        def unwritten():
+            return read - (req["from"] + req["completed"] - start)
+
+        return write, on_read, limit, unwritten
+
+    def _locate(self, pos: int) -> Optional[tuple]:
+        """where the written bytes starting at `pos` are, see `StreamHasher`"""
+        with self._lock:
+            for seg in self._meta["reqs"]:
+                if seg["from"] <= pos <= seg["to"]:
+                    n = seg["from"] + seg["completed"] - pos
+                    if self.write_mode in IN_PLACE_MODES:
+                        return self._meta["target"], pos, n
+                    path = get_cachedir(
+                        f"{self._meta['filename']}.part.{seg['file_index']}"
+                    )
+                    return path, pos - seg["from"], n
+        return None
+
+    @contextmanager
+    def _hashing(self):
+        """hash (and decompress) the file while the segments download if a digest is expected,
+        the streams catch up in the background until the segments are merged"""
+        if self.digest:
+            self._hasher = StreamHasher(self.digest[0], self._locate)
+        streams = [i for i in (self._hasher, self._decompressor) if i]
+        for s in streams:
+            s.start()
+        try:
+            yield
+        finally:
+            for s in streams:
+                s.stop()
+
+    @contextmanager
+    def _decompressing(self):
+        """decompress the file in order while it downloads if it is to be decompressed,
+        `_finish_decompression` decompresses what is left once it is there"""
+        method = self.decompress
+        if method == AUTO_DECOMPRESS:
+            method = detect_method(self.url.probe_data, self.save_path)
+        if not method:
+            yield
+            return
+        path = decompressed_path(self.save_path)
+        self._check_save_path(path)
+        # started by `_hashing` once the segments are known
+        self._decompressor = StreamDecompressor(method, path, self._locate)
+        try:
+            yield
+        finally:
+            # the decompressed file is removed unless it was finished
+            self._decompressor.close()
+            self._decompressor = None
+
+    def _finish_decompression(self) -> None:
+        """
+        Raises:
+            DecompressionError: the file could not be decompressed, the download is kept
+        """
+        if self._decompressor:
+            self.decompressed_path = self._decompressor.finish(self.save_path)
+
+    @contextmanager
+    def _throttling(self):
+        """take a share of `bandwidth` while the download runs"""
+        self._bucket = self.bandwidth.join(self.rate_limit)
+        try:
+            yield
+        finally:
+            self.bandwidth.leave(self._bucket)
+
+    def set_rate_limit(self, rate: Optional[float]) -> None:
+        """change the bandwidth limit of the download, takes effect right away if it is running
+
+        Args:
+            rate (Optional[float]): bytes per second, None to lift the limit
+        """
+        self.rate_limit = rate
+        if self._bucket:
+            self.bandwidth.set_limit(self._bucket, rate)
+
+    def _check_digest(self) -> None:
+        """
+        Raises:
+            DigestMismatchError: the file does not have the expected digest
+        """
+        if not self._hasher:
+            return
+        self.file_digest = self._hasher.hexdigest()
+        if self._hasher.position != self.filesize:
+            raise DigestMismatchError(
+                f"Only {self._hasher.position} of {self.filesize} bytes could be hashed"
+            )
+        algorithm, expected = self.digest
+        if self.file_digest != expected:
+            raise DigestMismatchError(
+                f"{algorithm} of {self.save_path} is {self.file_digest}, expected {expected}"
+            )
+
+    def _download_handler(self, h: dict, req: dict, mirror: Optional[Mirror] = None):
         """file download handler,to be called in a thread
         
         Args:
             h (dict): Headers for the request
-            file (str): filename for the partial file
-            idx (int): partial file index
-        """
-        n = get_cachedir(f"{file}.part.{idx}")
-        with open(n, "ab") as f:
-            with self.url.fetch(headers=h, stream=True, refetch=True) as r:
-                for c in r.iter_content(chunk_size=2048):
-                    if c:
-                        f.write(c)
-                    if self.report:
-                        elapsed = self._elapsed_time
-                        size = self._downloaded_size
-                        perc = force_round((size / self.filesize) * 100, 2)
-                        speed = force_round(
-                            ((size - self._continued_size) / (1024 * 1024)) / elapsed, 2
-                        )
-                        self._progress_callback(size, speed, perc)
+            req (dict): the range being downloaded, its `completed` count is updated as data arrives
+            mirror (Optional[Mirror], optional): where to download it from. Defaults to the url.
+        """
+        url = mirror.url if mirror else self.url
+        f = self._get_writer(req)
+        write, on_read, limit, unwritten = self._segment_callbacks(req, f)
+        try:
+            with url.fetch(
+                headers=h,
+                stream=True,
+                refetch=True,
+                timeout=(self.connect_timeout, self.read_timeout),
+            ) as r:
+                self._check_range_response(r.status_code, h)
+                stream_response(
+                    r,
+                    write,
+                    on_read,
+                    self.chunk_size,
+                    self.buffer_size,
+                    limit,
+                    self._bucket,
+                    getattr(f, "buffer", None),
+                )
+            if remaining(req) > 0:
+                raise ConnectionError(
+                    f"Connection closed with {remaining(req)} bytes of {h['range']} left"
+                )
+        finally:
+            f.close()
+            # those bytes will be read again
+            self._progress.add(-unwritten())
+            self._checkpoint(True)
 
     def _simple_fetch(self):
         """
@@ -197,10 +954,199 @@ class Downloader(object):
         to_screen("Only reporting size downloaded\n")
         with open(self.save_path, "wb") as f:
             with self.url.fetch(headers=basic_headers, stream=True, refetch=True) as r:
-                for c in r.iter_content(chunk_size=2048):
-                    if c:
-                        f.write(c)
-                        self._progress_callback(safe_getsize(self.save_path), 0, 0)
+                stream_response(
+                    r,
+                    self._simple_writer(f),
+                    self._progress.add,
+                    self.chunk_size,
+                    self.buffer_size,
+                    throttle=self._bucket,
+                )
+        self._check_simple_digest()
+
+    def _simple_writer(self, f):
+        """write callback for a download that arrives in order, hashing it if a digest is expected
+        and decompressing it if it is to be decompressed"""
+        if self.digest:
+            self._hasher = StreamHasher(self.digest[0])
+        streams = [i for i in (self._hasher, self._decompressor) if i]
+        if not streams:
+            return f.write
+
+        def write(b):
+            f.write(b)
+            for s in streams:
+                s.feed(s.position, b)
+
+        return write
+
+    def _check_simple_digest(self) -> None:
+        """like `_check_digest` for `_simple_fetch`, which saves the file directly"""
+        try:
+            self._check_digest()
+        except DigestMismatchError:
+            remove(self.save_path)
+            raise
+
+    def _worker(self, hdr: dict):
+        """keeps pulling segments from the scheduler until the file is done
+
+        Args:
+            hdr (dict): headers for the requests
+        """
+        while not self._fatal_error:
+            seg = self._scheduler.next()
+            if seg is None:
+                return
+            # segments can be split, save the new layout before writing into it
+            self._checkpoint(True)
+            self._segment_event(SEGMENT_STARTED, seg)
+            try:
+                self._download_segment(hdr, seg)
+            except _RetireWorker:
+                return
+            finally:
+                self._segment_finished(seg)
+
+    def _segment_finished(self, seg: dict) -> None:
+        self._scheduler.release(seg)
+        if self._hasher:
+            self._hasher.notify()
+        if self._decompressor:
+            self._decompressor.notify()
+        if remaining(seg) <= 0:
+            self._segment_event(SEGMENT_DONE, seg)
+
+    def _download_segment(self, hdr: dict, seg: dict):
+        """download what is left of `seg`, retrying from the last written byte after transient errors"""
+        failed_on = None
+        while not self._fatal_error and remaining(seg) > 0:
+            # a segment ahead of the consumer of a stream waits for it before opening a connection
+            if self._reorder and not self._reorder.reserve(
+                seg["from"] + seg["completed"], 1
+            ):
+                raise _RetireWorker()
+            before, started = seg["completed"], time()
+            mirror = self.mirrors.acquire(failed_on)
+            ok = False
+            try:
+                self._download_handler(
+                    self._range_headers(hdr, seg, mirror), seg, mirror
+                )
+                ok = True
+            except RemoteFileChangedError as e:
+                self._file_changed(mirror, e)
+                failed_on = mirror
+            except _RetireWorker:
+                ok = True
+                raise
+            except retryable_errors() as e:
+                failed_on = mirror
+                delay = self._retry_delay(seg, e, seg["completed"] > before)
+                if delay is None:
+                    return
+                sleep(delay)
+            except Exception as e:
+                self._give_up(seg, e)
+                return
+            finally:
+                self.mirrors.release(
+                    mirror, seg["completed"] - before, time() - started, ok
+                )
+
+    def _file_changed(self, mirror: Mirror, e: RemoteFileChangedError) -> None:
+        if mirror is self.mirrors.primary:
+            # the other segments are useless as well
+            self._fatal_error = e
+            if self._reorder:
+                self._reorder.close(e)
+            return
+        err_to_screen(
+            f"\n[Warning] the file on mirror {mirror.url} changed, skipping it\n"
+        )
+        self.mirrors.disable(mirror)
+
+    def _retry_delay(
+        self, seg: dict, e: Exception, progressed: bool
+    ) -> Optional[float]:
+        """record a failed attempt at `seg`
+
+        Args:
+            seg (dict): the segment
+            e (Exception): what went wrong
+            progressed (bool): whether the attempt wrote anything, the backoff starts over if it did
+
+        Returns:
+            Optional[float]: seconds to wait before the next attempt, None if the segment is given up
+        """
+        idx = seg["file_index"]
+        with self._lock:
+            if getattr(e, "status_code", None) in THROTTLE_STATUS_CODES:
+                self._throttled += 1
+            failures = 1 if progressed else self._failures.get(idx, 0) + 1
+            self._failures[idx] = failures
+            exhausted = (
+                failures > self.segment_retries
+                or self._total_retries >= self.max_retries
+            )
+            if not exhausted:
+                self._retries[idx] = self._retries.get(idx, 0) + 1
+                self._total_retries += 1
+        if exhausted:
+            self._give_up(seg, e)
+            return None
+        self._segment_event(SEGMENT_RETRY, seg, retries=self._retries[idx], error=e)
+        delay = min(self.max_backoff, self.retry_backoff * 2 ** (failures - 1))
+        # jitter keeps the threads that failed together from retrying together
+        delay = uniform(delay / 2, delay)
+        self._verbose_logger("RETRY", idx, e, delay)
+        return delay
+
+    def _give_up(self, seg: dict, e: Exception) -> None:
+        self._errors[seg["file_index"]] = e
+        self._scheduler.give_up(seg)
+        err_to_screen(f"\n[Error] Chunk number: {seg['file_index']} failed: {e!r}\n")
+        if self._reorder:
+            # a stream can not go on without the segment
+            failed = [i for i in self.segment_status if i.status == FAILED]
+            self._reorder.close(
+                IncompleteDownloadError(
+                    f"Chunk number: {seg['file_index']} could not be downloaded: {e!r}",
+                    failed,
+                )
+            )
+        self._segment_event(
+            SEGMENT_FAILED,
+            seg,
+            retries=self._retries.get(seg["file_index"], 0),
+            error=e,
+        )
+
+    @property
+    def segment_status(self) -> List[SegmentStatus]:
+        """the state of every segment after (or during) `start`, in file order"""
+        if not self._meta:
+            return []
+        failed = self._scheduler.failed if self._scheduler else ()
+        res = []
+        for seg in sorted(self._meta["reqs"], key=lambda i: i["from"]):
+            idx = seg["file_index"]
+            if remaining(seg) <= 0:
+                status = DONE
+            else:
+                status = FAILED if idx in failed else PENDING
+            res.append(
+                SegmentStatus(
+                    idx,
+                    seg["from"],
+                    seg["to"],
+                    seg["completed"],
+                    self._retries.get(idx, 0),
+                    status,
+                    self._errors.get(idx),
+                )
+            )
+        return res
 
     def _spawn_downloaders(self, h: dict):
         """Spawn downloader threads
@@ -208,25 +1154,58 @@ class Downloader(object):
         Args:
             h (dict): range headers and filename
         """
-        hdr = h["headers"]
-        fn = h["filename"]
+        self._scheduler = SegmentScheduler(h["reqs"], self._lock, self.min_segment_size)
         th = []
-        reqs = h["reqs"]
-        for i in reqs:
-            th.append(
-                _Parallel_impl(
-                    target=self._download_handler,
-                    args=({**hdr, "range": i["range"]}, fn, i["file_index"]),
-                )
-            )
-        try:
-            for i in th:
-                i.start()
-            for i in th:
-                i.join()
-            self._is_completed = True
-        except:
-            pass
+
+        def spawn(n):
+            for _ in range(n):
+                th.append(_Parallel_impl(target=self._worker, args=(h["headers"],)))
+                th[-1].start()
+
+        spawn(self.threads)
+        while self._tuner and any(i.is_alive() for i in th):
+            sleep(self.tune_interval)
+            spawn(self._retune(sum(i.is_alive() for i in th)))
+        for i in th:
+            i.join()
+        self._is_completed = True
+
+    def _retune(self, alive: int) -> int:
+        """ask the tuner how many connections to run, extra workers are told to retire
+
+        Args:
+            alive (int): workers that are running
+
+        Returns:
+            int: number of workers to start
+        """
+        n = self._tuner.update(time(), self._progress.value, self._throttled)
+        if n != self.threads:
+            self.threads = n
+            self._verbose_logger("TUNE", n)
+        with self._lock:
+            running = alive - self._retire
+            if n <= running:
+                self._retire += running - n
+                return 0
+            # workers that have not noticed they should retire can keep going instead
+            cancel = min(self._retire, n - running)
+            self._retire -= cancel
+            start = n - running - cancel
+        # the scheduler takes the lock as well
+        return start if start and self._scheduler.has_work() else 0
+
+    def _take_retirement(self) -> bool:
+        with self._lock:
+            if self._retire <= 0:
+                return False
+            self._retire -= 1
+            return True
+
+    def _save_tuning(self) -> None:
+        """remember the best connection count for the host if the tuner got to measure it"""
+        if self._tuner and self._tuner.learned:
+            save_connections(self.url.host, self._tuner.best)
 
     def _alter_headers(self, data: dict) -> dict:
         """Alter headers for continued file downloads
@@ -237,16 +1216,29 @@ class Downloader(object):
         Returns:
             dict: new headers and filename
         """
-        headers = data["headers"]
         previous_file = data["filename"]
         ranges = data["reqs"]
-        ret = []
-        self.threads = len(ranges)
+        # metadata written before write modes existed always used part files
+        mode = data.setdefault("mode", PARTS)
+        if not self._validators_match(data):
+            to_screen("The file on the server has changed, starting over\n")
+            self._discard(data)
+            return self._generate_init_headers(self.threads)
+        self.write_mode = mode
+        has_target = self.write_mode in IN_PLACE_MODES and isfile(data["target"])
         to_screen("Continuing File Download\n")
         for i in ranges:
             idx = i["file_index"]
             size = i["file_size"]
-            completed = safe_getsize(get_cachedir(f"{previous_file}.part.{idx}"))
+            if "crc" in i:
+                completed = self._verify_segment(data, i)
+            elif self.write_mode in IN_PLACE_MODES:
+                completed = i.get("completed", 0) if has_target else 0
+            else:
+                completed = min(
+                    safe_getsize(get_cachedir(f"{previous_file}.part.{idx}")), size
+                )
+            i["completed"] = completed
             self._continued_size += completed
             if completed >= size:
                 to_screen("skipping")
@@ -254,27 +1246,411 @@ class Downloader(object):
             to_screen(
                 f"Chunk number: {idx} \n completed : {to_MB(completed)} of {to_MB(size)} MB\n"
             )
-            ret.append(
-                {"range": f"bytes={i['from']+completed}-{i['to']}", "file_index": idx}
+        if self.write_mode in IN_PLACE_MODES:
+            preallocate(data["target"], self.filesize)
+        self._progress.add(self._continued_size)
+        self._meta = data
+        return data
+
+    def _verify_segment(self, data: dict, seg: dict) -> int:
+        """compare the saved part of a segment with the checksum in the metadata
+
+        Returns:
+            int: number of bytes of the segment that can be kept
+        """
+        completed = seg.get("completed", 0)
+        if data["mode"] in IN_PLACE_MODES:
+            path, offset = data["target"], seg["from"]
+        else:
+            path = get_cachedir(f"{data['filename']}.part.{seg['file_index']}")
+            offset = 0
+        # the checksum up to the previous checkpoint, the bytes before it were written a checkpoint earlier
+        checked, crc = seg.get("check", (0, 0))
+        if 0 < checked < completed and (
+            file_crc32(path, offset + checked, completed - checked, crc=crc)
+            == seg["crc"]
+        ):
+            if data["mode"] == PARTS:
+                truncate(path, completed)
+            return completed
+        if completed and file_crc32(path, offset, completed) == seg["crc"]:
+            if data["mode"] == PARTS:
+                # drop whatever was written after the last checkpoint
+                truncate(path, completed)
+            return completed
+        if completed:
+            to_screen(
+                f"Chunk number: {seg['file_index']} is corrupt, downloading it again\n"
+            )
+        seg.update(crc=0, completed=0)
+        return 0
+
+    def _discard(self, data: dict) -> None:
+        """remove the files of a download that can not be resumed"""
+        if data["mode"] in IN_PLACE_MODES:
+            paths = [data["target"]]
+        else:
+            paths = [
+                get_cachedir(f"{data['filename']}.part.{i['file_index']}")
+                for i in data["reqs"]
+            ]
+        for i in paths:
+            if isfile(i):
+                remove(i)
+
+    def _load_headers(self) -> dict:
+        """headers and segments of a previous attempt at the download if there is one, fresh ones otherwise"""
+        headers_to_fetch = self._journal.load()
+        if headers_to_fetch:
+            data = self._alter_headers(headers_to_fetch)
+            if data is headers_to_fetch:
+                # the verified segments replace the snapshot and the journal
+                self._save_meta()
+            return data
+        return self._generate_init_headers(self.threads)
+
+    def _wait_for_lock(self, lock: DownloadLock) -> bool:
+        """take the url's lock, waiting while another process downloads it
+
+        Raises:
+            DownloadLockedError: it was still locked after `lock_timeout` seconds
+        Returns:
+            bool: whether it had to wait
+        """
+        if lock.try_acquire():
+            return False
+        to_screen("Waiting for another process that downloads this url\n")
+        if not lock.acquire(self.lock_timeout):
+            raise DownloadLockedError(
+                f"{self.url} is being downloaded by another process"
+            )
+        return True
+
+    @contextmanager
+    def _claimed(self, lock: DownloadLock, waited: bool):
+        """hold the url's lock while the file downloads and record the finished file in it
+
+        Yields:
+            dict: the record of the download that was waited for, empty if there was none
+        """
+        try:
+            previous = lock.read_record() if waited else {}
+            lock.write_record(pid=getpid(), save_path=self.save_path, complete=False)
+            yield previous
+            lock.write_record(
+                pid=getpid(),
+                save_path=self.save_path,
+                complete=True,
+                validators=self._get_validators(),
             )
+        finally:
+            lock.release()
+        # one lock file per url would pile up otherwise
+        prune_locks(self.lock_max_age)
 
-        return {"headers": headers, "filename": previous_file, "reqs": ret}
+    def _reuse_download(self, record: dict) -> bool:
+        """copy the file another process finished while this one waited, if it is the file being downloaded
 
-    def start(self, thread_count: int = None):
+        Returns:
+            bool: whether the file was reused
+        """
+        path = record.get("save_path")
+        if (
+            not record.get("complete")
+            or not path
+            or not isfile(path)
+            or getsize(path) != self.filesize
+            or not self._same_validators(record.get("validators") or {})
+        ):
+            return False
+        if self.digest:
+            self.file_digest = file_digest(path, self.digest[0])
+            if self.file_digest != self.digest[1]:
+                return False
+        if realpath(path) != realpath(self.save_path):
+            shutil.copyfile(path, self.save_path)
+        self._skip_download(f"Reused {path}, downloaded by another process")
+        return True
+
+    def _skip_download(self, why: str) -> None:
+        """the file is at `save_path` without downloading it"""
+        to_screen(f"{why}\n")
+        self.filesize = self.filesize or getsize(self.save_path)
+        self._continued_size = self.filesize
+        self._progress = Counter(self.filesize)
+
+    def _revalidate(self, entry: CacheEntry) -> bool:
+        """conditional GET for a cached file
+
+        Returns:
+            bool: whether the server answered 304, the file did not change
+        """
+        h = dict(basic_headers)
+        if entry.etag:
+            h["if-none-match"] = entry.etag
+        elif entry.last_modified:
+            h["if-modified-since"] = entry.last_modified
+        else:
+            return False
+        with URL(self._requested_url).fetch(
+            headers=h,
+            stream=True,
+            refetch=True,
+            timeout=(self.connect_timeout, self.read_timeout),
+        ) as r:
+            # the body of any other answer is left unread
+            return r.status_code == 304
+
+    def _from_cache(self) -> bool:
+        """copy the file from `cache` if it has a current copy of it
+
+        Returns:
+            bool: whether the cached file was used
+        """
+        if not self.cache:
+            return False
+        sha256 = self.digest[1] if self.digest and self.digest[0] == "sha256" else None
+        # the digest vouches for a file from any url
+        entry = self.cache.lookup_digest(sha256) if sha256 else None
+        if entry is None:
+            entry = self.cache.lookup(self._requested_url)
+            if (
+                entry is None
+                or (sha256 and entry.hash != sha256)
+                or (self.filesize and entry.size != self.filesize)
+            ):
+                return False
+            if not self._revalidate(entry):
+                return False
+        if not self.cache.get(entry, self.save_path):
+            return False
+        if self.digest and not sha256:
+            self.file_digest = file_digest(self.save_path, self.digest[0])
+            if self.file_digest != self.digest[1]:
+                remove(self.save_path)
+                return False
+        self.file_digest = self.file_digest or sha256
+        self._skip_download(f"Copied {self._requested_url} from the download cache")
+        return True
+
+    def _cache_download(self) -> None:
+        """keep the finished file in `cache`"""
+        if not self.cache:
+            return
+        v = self._get_validators()
+        sha256 = (
+            self.file_digest if self.digest and self.digest[0] == "sha256" else None
+        )
+        self.cache.put(
+            self._requested_url, self.save_path, v["etag"], v["last-modified"], sha256
+        )
+
+    def _prepare_start(self, thread_count: Optional[Union[int, str]]) -> None:
+        """reset the state of a previous `start`"""
+        self.start_time = time()
+        self.threads = thread_count or self._thread_count
+        self._tuner = None
+        if self.threads == AUTO:
+            start = learned_connections(self.url.host) or self.auto_start
+            self._tuner = ConnectionTuner(start, self.max_connections)
+            self.threads = self._tuner.connections
+        self._progress = Counter()
+        self._fatal_error = None
+        # file_index -> retries, failures in a row and the error a segment was given up after
+        self._retries, self._failures, self._errors = {}, {}, {}
+        self._total_retries = 0
+        # 429 / 503 answers and workers that still have to retire, see `_retune`
+        self._throttled = 0
+        self._retire = 0
+        # file_index -> its throughput, for the progress events
+        self._rates = {}
+        self._rate = Throughput()
+
+    def start(self, thread_count: Union[int, str] = None):
         """Start the file download
         
         Args:
-            thread_count (int, optional): number of threads to download the file in. Defaults to None.
+            thread_count (Union[int, str], optional): number of threads to download the file in, or "auto". Defaults to None.
+
+        Raises:
+            FileExistsError: the file has already been downloaded
         """
-        self.start_time = time()
-        self.threads = thread_count or self.__thread_count
+        # only checked here, a stream does not write the file
+        self._check_save_path(self.save_path)
+        self._prepare_start(thread_count)
+        # every thread should get a kept alive connection of its own
+        default_pool.ensure_pool_size(
+            self.max_connections if self._tuner else self.threads
+        )
+        # a second process asking for the same url waits for the first and reuses its file
+        lock = DownloadLock(self._meta_file_name)
+        with self._outcome(), self._claimed(lock, self._wait_for_lock(lock)) as prev:
+            with self._decompressing():
+                if not (self._reuse_download(prev) or self._from_cache()):
+                    self._download()
+                    self._cache_download()
+                self._finish_decompression()
+        self._verbose_logger("POOL-STATS", pool_stats.as_dict())
+
+    def _download(self):
         if self.is_resumable:
-            headers_to_fetch = get_cached_file(self._meta_file_name)
-            if headers_to_fetch:
-                self._spawn_downloaders(self._alter_headers(headers_to_fetch))
-            else:
-                self._spawn_downloaders(self._generate_init_headers(self.threads))
+            with self._mapped():
+                h = self._load_headers()
+                with self._progress_reporter(), self._hashing(), self._throttling():
+                    self._spawn_downloaders(h)
+            self._save_tuning()
             self._make_file()
         else:
             to_screen(f"Server at {self.url.host} does not support multi threading\n")
-            self._simple_fetch()
+            with self._progress_reporter(), self._throttling():
+                self._simple_fetch()
+
+    def _range_fetcher(self):
+        from .sparse import RangeFetcher
+
+        threads = self._thread_count
+        return RangeFetcher(
+            self.url,
+            threads if isinstance(threads, int) else self.auto_start,
+            timeout=(self.connect_timeout, self.read_timeout),
+        )
+
+    def read_ranges(self, ranges: list) -> List[bytes]:
+        """Download only some byte ranges of the file into memory,
+        close ranges are merged and several of them share a request when the server allows it (see `dl.sparse.RangeFetcher`)
+
+        Args:
+            ranges (list): (start, end) pairs with the end included, (start, None) is the rest of the file
+                and (-n, None) its last n bytes
+
+        Returns:
+            List[bytes]: the bytes of every range, in the order they were given
+        """
+        from .sparse import read_ranges
+
+        return read_ranges(self._range_fetcher(), ranges)
+
+    def fetch_ranges(self, ranges: list, path: Optional[str] = None):
+        """Download only some byte ranges of the file into a sparse file, a bitmap beside it (`<path>.blocks`)
+        keeps track of the blocks that are there so a later call only downloads what is missing, see `dl.sparse.SparseFile`
+
+        Args:
+            ranges (list): see `read_ranges`
+            path (Optional[str], optional): the sparse file. Defaults to the save path.
+
+        Returns:
+            SparseFile: the file, `read` downloads more of it
+        """
+        from .sparse import SparseFile
+
+        f = SparseFile(self._range_fetcher(), path or self.save_path)
+        f.fetch(ranges)
+        return f
+
+    def iter_bytes(self, thread_count: Union[int, str] = None) -> Iterator[bytes]:
+        """Download the file and yield it in order instead of saving it.
+        The segments still download in parallel, the ones that arrive early wait in memory until
+        the bytes in front of them have been yielded. A connection that gets `stream_buffer_size` bytes
+        ahead of the consumer waits for it, so a slow consumer slows the download down instead of filling the memory.
+        Nothing is written to disk, a stream that fails can not be resumed.
+
+        Args:
+            thread_count (Union[int, str], optional): number of threads to download the file in, or "auto". Defaults to None.
+
+        Raises:
+            IncompleteDownloadError: a segment ran out of retries
+            RemoteFileChangedError: the file changed on the server
+            DigestMismatchError: the file does not have the expected digest, raised after its last bytes
+        Yields:
+            bytes: the next bytes of the file
+        """
+        self._prepare_start(thread_count)
+        default_pool.ensure_pool_size(
+            self.max_connections if self._tuner else self.threads
+        )
+        # the threads must not hash what they write, the bytes are hashed in order as they are yielded
+        self._hasher = None
+        hasher = StreamHasher(self.digest[0]) if self.digest else None
+        stream = self._stream_segments() if self.is_resumable else self._stream_simple()
+        with self._outcome(), closing(stream):
+            for data in stream:
+                if hasher:
+                    hasher.feed(hasher.position, data)
+                yield data
+            self._hasher = hasher
+            self._check_digest()
+
+    def stream_to(self, fileobj, thread_count: Union[int, str] = None) -> int:
+        """Download the file into a writable file object (a pipe, a socket, an upload...), see `iter_bytes`
+
+        Args:
+            fileobj: anything with a `write` method that takes bytes
+            thread_count (Union[int, str], optional): number of threads to download the file in, or "auto". Defaults to None.
+
+        Returns:
+            int: number of bytes written
+        """
+        total = 0
+        for data in self.iter_bytes(thread_count):
+            fileobj.write(data)
+            total += len(data)
+        return total
+
+    def _stream_layout(self) -> dict:
+        """segments of a fraction of the reorder buffer for a stream, with the buffer set up"""
+        connections = self.max_connections if self._tuner else self.threads
+        # room for a segment of every connection, whatever `min_segment_size` is
+        capacity = max(
+            self.stream_buffer_size, 2 * self.buffer_size, 2 * self.min_segment_size
+        )
+        size = max(self.min_segment_size, capacity // (2 * connections))
+        h = {
+            "headers": basic_headers,
+            "reqs": self._make_segments(max(1, -(-self.filesize // size))),
+        }
+        self._meta = h
+        self._reorder = ReorderBuffer(self.filesize, capacity)
+        self._use_probe_data(h["reqs"][0])
+        return h
+
+    def _stream_segments(self) -> Iterator[bytes]:
+        """download the segments of `_stream_layout` in file order and yield them reassembled"""
+        h = self._stream_layout()
+        producer = _Parallel_impl(target=self._produce, args=(h,), daemon=True)
+        try:
+            with self._progress_reporter():
+                producer.start()
+                while True:
+                    data = self._reorder.read()
+                    if not data:
+                        return
+                    yield data
+        finally:
+            # stops the threads if the consumer stopped early
+            self._reorder.close()
+            producer.join()
+            self._reorder = None
+
+    def _produce(self, h: dict) -> None:
+        """download the segments into the reorder buffer, closed with the error that stopped them"""
+        error = None
+        try:
+            with self._throttling():
+                self._spawn_downloaders(h)
+            self._save_tuning()
+            error = self._fatal_error
+        except BaseException as e:
+            error = e
+        self._reorder.close(error)
+
+    def _stream_simple(self) -> Iterator[bytes]:
+        """`_stream_segments` for a server without range support, the file is read in order"""
+        with self._progress_reporter(), self._throttling():
+            with self.url.fetch(headers=basic_headers, stream=True, refetch=True) as r:
+                r.raise_for_status()
+                for data in r.iter_content(self.chunk_size or MIN_CHUNK):
+                    self._progress.add(len(data))
+                    yield data
+                    wait = self._bucket.take(len(data))
+                    if wait:
+                        sleep(wait)
@@ -0,0 +1,91 @@
+"""
+Events a download reports while it runs, for programs that watch downloads instead of a terminal
+"""
+
+from collections import namedtuple
+from typing import Optional, Tuple
+
+PROBED = "probed"
+SEGMENT_STARTED = "segment_started"
+SEGMENT_PROGRESS = "segment_progress"
+SEGMENT_RETRY = "segment_retry"
+SEGMENT_DONE = "segment_done"
+SEGMENT_FAILED = "segment_failed"
+PROGRESS = "progress"
+MERGE = "merge"
+COMPLETE = "complete"
+DOWNLOAD_FAILED = "download_failed"
+
+# `segment` is None for the events about the whole file, `completed` and `total` are bytes
+# of the segment or the file, `speed` is bytes per second since the previous progress event,
+# `avg_speed` its moving average and `eta` the seconds left at that average
+DownloadEvent = namedtuple(
+    "DownloadEvent",
+    [
+        "type",
+        "time",
+        "url",
+        "segment",
+        "completed",
+        "total",
+        "speed",
+        "avg_speed",
+        "eta",
+        "retries",
+        "error",
+    ],
+    defaults=(None, 0, 0, 0.0, 0.0, None, 0, None),
+)
+
+
+def event_to_dict(event: DownloadEvent) -> dict:
+    """json serializable form of `event`"""
+    d = event._asdict()
+    if d["error"] is not None:
+        d["error"] = repr(d["error"])
+    return d
+
+
+class Throughput(object):
+    """
+    Instantaneous and exponentially weighted average rate of a byte count that is sampled regularly
+
+    Args:
+        smoothing (float, optional): weight of the newest sample in the average. Defaults to 0.3.
+    """
+
+    def __init__(self, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self.speed = 0.0
+        self.avg_speed = None
+        # the count at the last sample
+        self.total = None
+        self._last = None
+
+    def update(self, now: float, total: int) -> Tuple[float, float]:
+        """sample the count
+
+        Args:
+            now (float): the current time
+            total (int): the count
+
+        Returns:
+            Tuple[float, float]: the speed since the previous sample and the average
+        """
+        if self._last is not None and now > self._last[0]:
+            then, before = self._last
+            self.speed = max(0, total - before) / (now - then)
+            self.avg_speed = (
+                self.speed
+                if self.avg_speed is None
+                else (1 - self.smoothing) * self.avg_speed + self.smoothing * self.speed
+            )
+        self._last = (now, total)
+        self.total = total
+        return self.speed, self.avg_speed or 0.0
+
+    def eta(self, left: int) -> Optional[float]:
+        """seconds until `left` more bytes are done, None until there is a rate to go by"""
+        if left <= 0:
+            return 0.0
+        return left / self.avg_speed if self.avg_speed else None
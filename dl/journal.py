@@ -0,0 +1,128 @@
+"""
+Crash safe metadata of a download: a snapshot that is replaced atomically and a journal of the checkpoints since
+"""
+
+import os
+from json import dumps as _dumps, loads as _loads
+from threading import Lock
+from time import time
+from typing import List, Optional
+
+from ._cache import get_cached_file, get_cachedir, make_cached_file
+
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+class MetaJournal(object):
+    """
+    The metadata of a download is a snapshot (`<name>.data.json`, see `make_cached_file`) and every checkpoint
+    after it is a line appended to `<name>.journal` with the segments that changed since the one before.
+    A checkpoint only costs the size of what changed, `load` replays the journal onto the snapshot
+    and ignores a line that was cut short by a crash. The journal is fsynced at most every `sync_interval` seconds
+    and compacted into a new snapshot once it has `compact_after` lines.
+
+    Every line and the snapshot carry a sequence number, the lines the snapshot already contains are skipped,
+    so a crash between replacing the snapshot and emptying the journal loses nothing.
+
+    Args:
+        name (str): the meta file name of the download (`URL.get_filesafe_url`)
+    """
+
+    sync_interval: float = 5
+    compact_after: int = 512
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = get_cachedir(f"{name}.journal")
+        # sequence number of the last checkpoint
+        self.seq = 0
+        # lines in the journal
+        self.records = 0
+        self._last_sync = 0.0
+        self._lock = Lock()
+
+    def load(self) -> Optional[dict]:
+        """the snapshot with the journal replayed onto it
+
+        Returns:
+            Optional[dict]: the metadata, None if there is no (readable) snapshot
+        """
+        data = get_cached_file(self.name)
+        if not data:
+            return None
+        self.seq = data.get("seq", 0)
+        self.records = 0
+        segments = {i["file_index"]: i for i in data["reqs"]}
+        for seq, reqs in self._read():
+            self.records += 1
+            if seq <= self.seq:
+                continue
+            self.seq = seq
+            for seg in reqs:
+                idx = seg["file_index"]
+                if idx in segments:
+                    segments[idx].update(seg)
+                else:
+                    # split off another segment
+                    segments[idx] = seg
+                    data["reqs"].append(seg)
+        data["seq"] = self.seq
+        return data
+
+    def _read(self) -> List[tuple]:
+        """(seq, segments) of every complete line of the journal, in order"""
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().split(b"\n")
+        except OSError:
+            return []
+        res = []
+        # the last one is either empty or was being written when the process died
+        for line in lines[:-1]:
+            try:
+                record = _loads(line)
+                res.append((record["seq"], record["reqs"]))
+            except (ValueError, KeyError, TypeError):
+                # a torn write, nothing after it can be trusted
+                break
+        return sorted(res, key=lambda i: i[0])
+
+    def save(self, data: dict) -> None:
+        """replace the snapshot with `data` and empty the journal"""
+        with self._lock:
+            data["seq"] = self.seq
+            make_cached_file(self.name, data)
+            with open(self.path, "wb"):
+                pass
+            self.records = 0
+
+    def append(self, segments: List[dict]) -> None:
+        """checkpoint the segments that changed, fsynced if the last sync was `sync_interval` seconds ago"""
+        with self._lock:
+            self.seq += 1
+            line = _dumps({"seq": self.seq, "reqs": segments}).encode() + b"\n"
+            fd = os.open(
+                self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | _O_BINARY, 0o644
+            )
+            try:
+                # one write, a crash can only cut off the end of the line
+                os.write(fd, line)
+                self.records += 1
+                now = time()
+                if now - self._last_sync >= self.sync_interval:
+                    os.fsync(fd)
+                    self._last_sync = now
+            finally:
+                os.close(fd)
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.records >= self.compact_after
+
+    def remove(self) -> None:
+        """remove the snapshot and the journal, the download is over"""
+        with self._lock:
+            for path in (get_cachedir(f"{self.name}.data.json"), self.path):
+                if os.path.isfile(path):
+                    os.remove(path)
+            self.seq = self.records = 0
@@ -0,0 +1,181 @@
+"""
+Locks in the cache directory, so processes that share it do not download the same url at once
+"""
+
+import os
+from json import dumps as _dumps, loads as _loads
+from time import sleep, time
+from typing import Optional
+
+from ._cache import get_cachedir
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock(object):
+    """
+    Exclusive lock on a file, held through an open file descriptor so it goes away with the process
+    that held it. It is not reentrant, two `FileLock`s on the same path exclude each other even in one process.
+
+    Args:
+        path (str): the lock file, created if it does not exist
+    """
+
+    # seconds between attempts while waiting for the lock
+    poll_interval: float = 0.1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """take the lock if nobody holds it
+
+        Returns:
+            bool: whether the lock was taken
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"{self.path} is already locked")
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                os.close(fd)
+                return False
+            if not fcntl or self._is_current(fd):
+                break
+            # `prune_locks` removed the file before this got it, the path has a new lock file
+            os.close(fd)
+        self._fd = fd
+        return True
+
+    def _is_current(self, fd: int) -> bool:
+        """whether `fd` is still the file at `path`"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        fst = os.fstat(fd)
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """wait for the lock
+
+        Args:
+            timeout (Optional[float], optional): seconds to wait at most, forever when None. Defaults to None.
+
+        Returns:
+            bool: whether the lock was taken
+        """
+        deadline = None if timeout is None else time() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time() >= deadline:
+                return False
+            sleep(self.poll_interval)
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if not fcntl:
+                # the locked byte is the first one
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            # closing the descriptor releases the flock
+            os.close(fd)
+
+    def read(self) -> bytes:
+        """contents of the lock file, the lock has to be held"""
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            b = os.read(self._fd, 64 * 1024)
+            if not b:
+                return b"".join(chunks)
+            chunks.append(b)
+
+    def write(self, data: bytes) -> None:
+        """replace the contents of the lock file, the lock has to be held"""
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, data)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class DownloadLock(FileLock):
+    """
+    Lock of one url in the cache directory, keyed on its `URL.get_filesafe_url`.
+    The holder records where it saves the file, so a process that waited for it can reuse the download.
+
+    Args:
+        key (str): `URL.get_filesafe_url()` of the url
+    """
+
+    def __init__(self, key: str):
+        super().__init__(get_cachedir(f"{key}.lock"))
+
+    def read_record(self) -> dict:
+        """what the previous holder recorded, empty if nothing (readable) was"""
+        try:
+            record = _loads(self.read() or b"{}")
+        except ValueError:
+            return {}
+        return record if isinstance(record, dict) else {}
+
+    def write_record(self, **record) -> None:
+        self.write(_dumps(record).encode())
+
+
+def prune_locks(max_age: float) -> int:
+    """remove the lock files in the cache directory that nobody holds and nobody wrote to in `max_age` seconds,
+    the record of a finished download is only read by the processes that waited for it
+
+    Returns:
+        int: number of lock files removed
+    """
+    removed = 0
+    cutoff = time() - max_age
+    for entry in os.scandir(get_cachedir("")):
+        if not entry.name.endswith(".lock"):
+            continue
+        try:
+            if entry.stat().st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        lock = FileLock(entry.path)
+        try:
+            if not lock.try_acquire():
+                continue
+        except OSError:
+            continue
+        try:
+            # a process that opened it before this unlinks it sees that and opens the new one
+            os.unlink(entry.path)
+            removed += 1
+        except OSError:  # windows does not remove open files
+            pass
+        finally:
+            lock.release()
+    return removed
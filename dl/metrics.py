@@ -0,0 +1,136 @@
+"""
+Listeners that export the events of downloads (see `events`) as JSON lines or Prometheus metrics
+"""
+
+from json import dumps as _dumps
+from os import replace as _replace
+from threading import Lock
+from typing import IO, Optional, Union
+
+from .events import (
+    COMPLETE,
+    DOWNLOAD_FAILED,
+    PROBED,
+    PROGRESS,
+    SEGMENT_FAILED,
+    SEGMENT_RETRY,
+    DownloadEvent,
+    event_to_dict,
+)
+
+
+class JSONLinesExporter(object):
+    """
+    Writes every event as a line of JSON
+
+    Args:
+        out (Union[str, IO[str]]): file (or path of the file, it is appended to) the lines are written to
+    """
+
+    def __init__(self, out: Union[str, IO[str]]):
+        self._own = isinstance(out, str)
+        self.out = open(out, "a") if self._own else out
+        self._lock = Lock()
+
+    def __call__(self, event: DownloadEvent) -> None:
+        line = _dumps(event_to_dict(event))
+        with self._lock:
+            self.out.write(f"{line}\n")
+            self.out.flush()
+
+    def close(self) -> None:
+        if self._own:
+            self.out.close()
+
+
+def _label(s: str) -> str:
+    return s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusExporter(object):
+    """
+    Keeps the latest state of every download it sees events of and renders it in the Prometheus text format
+
+    Args:
+        path (Optional[str], optional): file the metrics are written to after every progress event,
+            for the textfile collector of node_exporter. Defaults to None.
+    """
+
+    # name, type, help, key of the state
+    metrics = (
+        ("dl_downloaded_bytes", "gauge", "Bytes downloaded so far", "completed"),
+        ("dl_size_bytes", "gauge", "Size of the file", "total"),
+        (
+            "dl_speed_bytes_per_second",
+            "gauge",
+            "Bytes per second since the last sample",
+            "speed",
+        ),
+        (
+            "dl_avg_speed_bytes_per_second",
+            "gauge",
+            "Moving average of the speed",
+            "avg_speed",
+        ),
+        ("dl_eta_seconds", "gauge", "Seconds left at the average speed", "eta"),
+        ("dl_retries_total", "counter", "Segment requests retried", "retries"),
+        ("dl_failed_segments_total", "counter", "Segments given up", "failed"),
+        ("dl_done", "gauge", "1 once the download completed, -1 if it failed", "done"),
+    )
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._state = {}
+        self._lock = Lock()
+        self._write_lock = Lock()
+
+    def __call__(self, event: DownloadEvent) -> None:
+        with self._lock:
+            s = self._state.setdefault(
+                event.url,
+                {
+                    "completed": 0,
+                    "total": 0,
+                    "speed": 0,
+                    "avg_speed": 0,
+                    "eta": None,
+                    "retries": 0,
+                    "failed": 0,
+                    "done": 0,
+                },
+            )
+            if event.type in (PROBED, PROGRESS, COMPLETE):
+                s.update(
+                    completed=event.completed,
+                    total=event.total,
+                    speed=event.speed,
+                    avg_speed=event.avg_speed,
+                    eta=event.eta,
+                )
+            if event.type == SEGMENT_RETRY:
+                s["retries"] += 1
+            elif event.type == SEGMENT_FAILED:
+                s["failed"] += 1
+            elif event.type in (COMPLETE, DOWNLOAD_FAILED):
+                s["done"] = 1 if event.type == COMPLETE else -1
+        if self.path and event.type in (PROGRESS, COMPLETE, DOWNLOAD_FAILED):
+            self.write(self.path)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, kind, help, key in self.metrics:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for url, s in self._state.items():
+                    if s[key] is not None:
+                        lines.append(f'{name}{{url="{_label(url)}"}} {s[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """write the metrics to `path`, readers never see a partly written file"""
+        tmp = f"{path}.tmp"
+        with self._write_lock:
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            _replace(tmp, path)
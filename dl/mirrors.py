@@ -0,0 +1,109 @@
+"""
+Several urls serving the same file, the segments are spread over them by speed
+"""
+
+from threading import Lock
+from typing import List, Optional
+
+from .URL import URL
+
+
+class Mirror(object):
+    """one source of the file and what was measured about it
+
+    Attributes:
+        url (URL): the url of the file on this mirror
+        if_range (Optional[str]): the validator resumed requests to this mirror are made with
+        speed (Optional[float]): bytes per second of a single connection, None until measured
+        active (int): requests running against the mirror
+        failures (int): requests that failed in a row
+        disabled (bool): no more requests are sent to the mirror
+    """
+
+    # weight of the newest measurement in `speed`
+    smoothing: float = 0.3
+
+    def __init__(self, url: URL, if_range: Optional[str] = None):
+        self.url = url
+        self.if_range = if_range
+        self.speed = None
+        self.active = 0
+        self.failures = 0
+        self.disabled = False
+
+    def __repr__(self) -> str:
+        return f"Mirror({str(self.url)!r})"
+
+    def record(self, n: int, elapsed: float) -> None:
+        """a request read `n` bytes in `elapsed` seconds"""
+        if n <= 0 or elapsed <= 0:
+            return
+        speed = n / elapsed
+        self.speed = (
+            speed
+            if self.speed is None
+            else (1 - self.smoothing) * self.speed + self.smoothing * speed
+        )
+
+
+class MirrorSet(object):
+    """
+    Picks the mirror for every request so that the connections are split between the mirrors
+    in proportion to their measured speed, mirrors that have not been measured yet are tried first.
+    A mirror that fails `max_failures` requests in a row is not used anymore, unless it is the last one.
+
+    Args:
+        mirrors (List[Mirror]): the mirrors, the first one is the url the download was started with
+        max_failures (int, optional): Defaults to 3.
+    """
+
+    def __init__(self, mirrors: List[Mirror], max_failures: int = 3):
+        self.mirrors = mirrors
+        self.max_failures = max_failures
+        self._lock = Lock()
+
+    @property
+    def primary(self) -> Mirror:
+        return self.mirrors[0]
+
+    def _usable(self, avoid: Optional[Mirror]) -> List[Mirror]:
+        usable = [i for i in self.mirrors if not i.disabled] or self.mirrors[:1]
+        # a retry goes somewhere else if there is somewhere else to go
+        return [i for i in usable if i is not avoid] or usable
+
+    def acquire(self, avoid: Optional[Mirror] = None) -> Mirror:
+        """the mirror for the next request, has to be handed back with `release`
+
+        Args:
+            avoid (Optional[Mirror], optional): mirror the previous attempt failed on. Defaults to None.
+        """
+        with self._lock:
+            usable = self._usable(avoid)
+            fastest = max((i.speed or 0 for i in usable), default=0) or 1
+            # the connections a mirror gets per byte per second of its speed
+            best = min(usable, key=lambda i: (i.active + 1) / (i.speed or fastest))
+            best.active += 1
+            return best
+
+    def release(self, mirror: Mirror, n: int, elapsed: float, ok: bool) -> None:
+        """the request is done
+
+        Args:
+            mirror (Mirror): the mirror it was sent to
+            n (int): bytes it read
+            elapsed (float): seconds it took
+            ok (bool): whether it succeeded
+        """
+        with self._lock:
+            mirror.active -= 1
+            mirror.record(n, elapsed)
+            if ok:
+                mirror.failures = 0
+                return
+            mirror.failures += 1
+            if mirror.failures >= self.max_failures:
+                self.disable(mirror)
+
+    def disable(self, mirror: Mirror) -> None:
+        # with every mirror disabled the requests go to the primary url
+        mirror.disabled = True
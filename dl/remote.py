@@ -0,0 +1,238 @@
+"""
+A read only, seekable file object of a remote file, its blocks are downloaded when they are read
+"""
+
+import io
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Union
+
+from .sparse import RangeFetcher
+from .URL import URL
+
+REMOTE_BLOCK_SIZE = 1024 * 1024
+
+
+class RemoteFile(io.RawIOBase):
+    """
+    A file object of a url that supports range requests, for `zipfile`, `tarfile` or anything else
+    that reads a file with `seek` and `read`. Only the `block_size` blocks that are read are downloaded,
+    the last `cache_blocks` of them are kept in memory (least recently used first out).
+    A read of several blocks that are not there is one request, and once the reads go through the file in order
+    the next blocks are fetched ahead of them on `threads` threads, starting with one and doubling up to `readahead`.
+    A url that does not support ranges is downloaded as a single block.
+
+    Args:
+        url (Union[URL, str]): the file
+        block_size (Optional[int], optional): Defaults to REMOTE_BLOCK_SIZE.
+        cache_blocks (Optional[int], optional): blocks kept in memory. Defaults to `RemoteFile.cache_blocks`.
+        readahead (Optional[int], optional): most blocks fetched ahead of a sequential read, 0 to turn it off.
+            Defaults to `RemoteFile.readahead`.
+        threads (int, optional): requests at once. Defaults to 4.
+        headers (Optional[dict], optional): headers of the requests. Defaults to basic_headers.
+        timeout (Optional[tuple], optional): connect and read timeout of the requests. Defaults to None.
+    Example:
+        >>> with RemoteFile("https://example.com/a.zip") as f, zipfile.ZipFile(f) as z:
+        ...     names = z.namelist()
+    """
+
+    cache_blocks: int = 64
+    readahead: int = 8
+
+    def __init__(
+        self,
+        url: Union[URL, str],
+        block_size: Optional[int] = None,
+        cache_blocks: Optional[int] = None,
+        readahead: Optional[int] = None,
+        threads: int = 4,
+        headers: Optional[dict] = None,
+        timeout: Optional[tuple] = None,
+    ):
+        super().__init__()
+        url = url if isinstance(url, URL) else URL(url)
+        self._fetcher = RangeFetcher(url, threads, headers, timeout)
+        self.name = str(url)
+        self.size = self._fetcher.size
+        block_size = block_size or REMOTE_BLOCK_SIZE
+        if not self._fetcher.supports_ranges:
+            # every request would download the file from the start
+            block_size = max(self.size, 1)
+        self.block_size = block_size
+        if cache_blocks is not None:
+            self.cache_blocks = cache_blocks
+        if readahead is not None:
+            self.readahead = readahead
+        self.threads = threads
+        self._pos = 0
+        # block -> bytes, the most recently used last
+        self._cache = OrderedDict()
+        # block -> Future of the blocks being downloaded
+        self._pending = {}
+        self._lock = Lock()
+        self._pool = None
+        # the last block read and the current readahead window
+        self._last_block = -1
+        self._window = 0
+        self.hits = self.misses = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        n = min(len(b), self.size - self._pos)
+        if n <= 0:
+            return 0
+        first = self._pos // self.block_size
+        last = (self._pos + n - 1) // self.block_size
+        blocks = self._get_blocks(first, last)
+        self._prefetch(first, last)
+        view = memoryview(b).cast("B")
+        offset, start = 0, self._pos - first * self.block_size
+        for i in range(first, last + 1):
+            data = blocks[i][start : start + n - offset]
+            view[offset : offset + len(data)] = data
+            offset += len(data)
+            start = 0
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        """read up to `size` bytes, all of the rest of the file if it is negative,
+        with one request for all the blocks that are not there"""
+        if size is None or size < 0:
+            size = max(self.size - self._pos, 0)
+        buf = bytearray(min(size, max(self.size - self._pos, 0)))
+        n = self.readinto(buf)
+        del buf[n:]
+        return bytes(buf)
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def _get_blocks(self, first: int, last: int) -> Dict[int, bytes]:
+        """the blocks `first` to `last`, from the cache, the prefetches or one request for the missing ones"""
+        from concurrent.futures import Future
+
+        res, waiting, missing = {}, {}, []
+        with self._lock:
+            for i in range(first, last + 1):
+                if i in self._cache:
+                    self._cache.move_to_end(i)
+                    res[i] = self._cache[i]
+                elif i in self._pending:
+                    waiting[i] = self._pending[i]
+                else:
+                    missing.append(i)
+                    self._pending[i] = Future()
+            self.hits += len(res) + len(waiting)
+            self.misses += len(missing)
+        if missing:
+            res.update(self._fetch(missing))
+        for i, future in waiting.items():
+            try:
+                res[i] = future.result()
+            except Exception:
+                # a failed prefetch, try again with the error if it persists
+                res.update(self._get_blocks(i, i))
+        return res
+
+    def _fetch(self, blocks: List[int]) -> Dict[int, bytes]:
+        """download `blocks`, whose futures are in `_pending`, and put them in the cache"""
+        bs = self.block_size
+        buffers = {i: bytearray(min(bs, self.size - i * bs)) for i in blocks}
+
+        def write(pos: int, data: bytes) -> None:
+            # the merged ranges can include the gaps between the blocks
+            while data:
+                i, start = divmod(pos, bs)
+                n = min(len(data), bs - start)
+                if i in buffers:
+                    buffers[i][start : start + n] = data[:n]
+                data = data[n:]
+                pos += n
+
+        try:
+            self._fetcher.fetch(
+                [(i * bs, i * bs + len(buffers[i]) - 1) for i in blocks], write
+            )
+        except BaseException as e:
+            with self._lock:
+                for i in blocks:
+                    self._pending.pop(i).set_exception(e)
+            raise
+        res = {i: bytes(buf) for i, buf in buffers.items()}
+        with self._lock:
+            for i, data in res.items():
+                self._cache[i] = data
+                self._pending.pop(i).set_result(data)
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return res
+
+    def _prefetch(self, first: int, last: int) -> None:
+        """fetch the blocks after `last` in the background if the reads are sequential"""
+        if first not in (self._last_block, self._last_block + 1):
+            # a random read, start over
+            self._window = 0
+        elif last > self._last_block:
+            self._window = min(max(self._window * 2, 1), self.readahead)
+        self._last_block = last
+        count = -(-self.size // self.block_size)
+        if not self._window or self.closed:
+            return
+        with self._lock:
+            blocks = [
+                i
+                for i in range(last + 1, min(last + 1 + self._window, count))
+                if i not in self._cache and i not in self._pending
+            ]
+            if not blocks:
+                return
+            from concurrent.futures import Future, ThreadPoolExecutor
+
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.threads)
+            for i in blocks:
+                self._pending[i] = Future()
+        for i in blocks:
+            self._pool.submit(self._fetch_ahead, i)
+
+    def _fetch_ahead(self, block: int) -> None:
+        try:
+            self._fetch([block])
+        except Exception:
+            # the read that needs it fetches it again
+            pass
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        with self._lock:
+            self._cache.clear()
+        super().close()
@@ -0,0 +1,121 @@
+"""
+Reassembling the segments of a download in file order in memory, so it can be streamed to a consumer
+"""
+
+from threading import Condition
+from typing import Optional
+
+STREAM_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+class ReorderBuffer(object):
+    """
+    Keeps the bytes the download threads write out of order until the consumer has read everything before them.
+    Only the `capacity` bytes after the consumer's position can be written (see `reserve`),
+    a thread that gets further ahead waits for the consumer, so the memory used stays bounded.
+
+    Args:
+        size (int): size of the file
+        capacity (int, optional): bytes that can be buffered ahead of the consumer,
+            it has to fit a whole write of every thread. Defaults to STREAM_BUFFER_SIZE.
+    """
+
+    def __init__(self, size: int, capacity: int = STREAM_BUFFER_SIZE):
+        self.size = size
+        self.capacity = capacity
+        # the first byte that has not been read by the consumer
+        self.position = 0
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        # offset -> bytes written there
+        self._chunks = {}
+        self._buffered = 0
+        self._cond = Condition()
+
+    @property
+    def buffered(self) -> int:
+        """bytes waiting for the consumer"""
+        return self._buffered
+
+    def reserve(self, pos: int, n: int) -> int:
+        """wait until the bytes at `pos` are within `capacity` of the consumer
+
+        Returns:
+            int: how many of the `n` bytes starting at `pos` can be written, 0 once the buffer is closed
+        """
+        with self._cond:
+            while not self.closed and pos >= self.position + self.capacity:
+                self._cond.wait()
+            if self.closed:
+                return 0
+            return min(n, self.position + self.capacity - pos)
+
+    def write(self, pos: int, data) -> None:
+        """store a copy of `data`, which starts at `pos` of the file"""
+        data = bytes(data)
+        if not data:
+            return
+        with self._cond:
+            if self.closed or pos + len(data) <= self.position:
+                return
+            self._chunks[pos] = data
+            self._buffered += len(data)
+            if pos == self.position:
+                self._cond.notify_all()
+
+    def read(self) -> bytes:
+        """wait for the bytes at the consumer's position
+
+        Raises:
+            BaseException: the `error` the buffer was closed with before the bytes arrived
+            ConnectionError: the buffer was closed without an error before the end of the file
+        Returns:
+            bytes: everything that is there in order from the consumer's position, empty at the end of the file
+        """
+        with self._cond:
+            while self.position not in self._chunks:
+                if self.position >= self.size:
+                    return b""
+                if self.closed:
+                    if self.error:
+                        raise self.error
+                    raise ConnectionError(
+                        f"the download stopped at {self.position} of {self.size} bytes"
+                    )
+                self._cond.wait()
+            parts = []
+            while self.position in self._chunks:
+                data = self._chunks.pop(self.position)
+                parts.append(data)
+                self.position += len(data)
+                self._buffered -= len(data)
+            # there is room for the threads that were waiting
+            self._cond.notify_all()
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """stop the writers, `read` still returns what is buffered and then raises `error`"""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.error = error
+            self._cond.notify_all()
+
+
+class ReorderWriter(object):
+    """writes a range into a `ReorderBuffer` starting at `offset`"""
+
+    def __init__(self, buffer: ReorderBuffer, offset: int):
+        self._buffer = buffer
+        self.offset = offset
+
+    def write(self, b) -> int:
+        n = len(b)
+        # the reads go into a reused buffer, the reorder buffer keeps a copy
+        self._buffer.write(self.offset, b)
+        self.offset += n
+        return n
+
+    def close(self) -> None:
+        pass
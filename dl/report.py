@@ -1,4 +1,8 @@
 from sys import stdout, stderr
+from warnings import filterwarnings
+
+# no console output at all while set, see `set_quiet`
+quiet = False
 
 
 def coerce_to_str(a):
@@ -6,11 +10,22 @@ def coerce_to_str(a):
 
 
 def to_screen(text: str) -> None:
-    stdout.write(coerce_to_str(text))
+    if not quiet:
+        stdout.write(coerce_to_str(text))
 
 
 def err_to_screen(text: str) -> None:
-    stderr.write(coerce_to_str(text))
+    if not quiet:
+        stderr.write(coerce_to_str(text))
+
+
+def set_quiet(q: bool = True) -> None:
+    """turn off (or back on) everything the downloaders write to the console, progress and errors included,
+    for programs that follow downloads through their events instead"""
+    global quiet
+    quiet = q
+    # the url warnings go through the warnings module
+    filterwarnings("ignore" if q else "default", module=r".*URL\.err")
 
 
 class Report:
@@ -0,0 +1,140 @@
+"""
+Work stealing scheduler for the range segments of a download
+"""
+
+from collections import namedtuple
+from threading import Lock
+from typing import Optional
+
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+
+# what happened to a segment, see `Downloader.segment_status`
+SegmentStatus = namedtuple(
+    "SegmentStatus",
+    ["index", "start", "end", "completed", "retries", "status", "error"],
+)
+
+
+def remaining(seg: dict) -> int:
+    return seg["to"] - seg["from"] - seg["completed"] + 1
+
+
+class SegmentScheduler(object):
+    """Hands out segments (the `reqs` of the meta file) to the download threads.
+    When nothing is pending, an idle thread takes the second half of the segment
+    with the most bytes left, so fast connections keep working until the file is done.
+
+    Args:
+        segments (list): segment dicts with `from`, `to`, `file_index`, `file_size` and `completed`
+        lock (Optional[Lock], optional): lock guarding the segments. Defaults to a new Lock.
+        min_size (int, optional): segments are never split into parts smaller than this. Defaults to MIN_SEGMENT_SIZE.
+    """
+
+    def __init__(
+        self,
+        segments: list,
+        lock: Optional[Lock] = None,
+        min_size: int = MIN_SEGMENT_SIZE,
+    ):
+        self.segments = segments
+        self.lock = lock or Lock()
+        self.min_size = min_size
+        # file_index -> first byte that has not been handed to a read yet
+        self._active = {}
+        # file_index of the segments that ran out of retries
+        self.failed = set()
+
+    def next(self) -> Optional[dict]:
+        """get a segment to download
+
+        Returns:
+            Optional[dict]: the segment, None when there is nothing left to download
+        """
+        with self.lock:
+            seg = self._pending()
+            if seg is not None:
+                self._active[seg["file_index"]] = seg["from"] + seg["completed"]
+                return seg
+            return self._steal()
+
+    def _pending(self) -> Optional[dict]:
+        for seg in self.segments:
+            idx = seg["file_index"]
+            if (
+                idx not in self._active
+                and idx not in self.failed
+                and remaining(seg) > 0
+            ):
+                return seg
+        return None
+
+    def _victim(self) -> tuple:
+        """the active segment with the most bytes left and how many, if it is worth splitting"""
+        victim, left = None, 0
+        for seg in self.segments:
+            pos = self._active.get(seg["file_index"])
+            if pos is not None and seg["to"] - pos + 1 > left:
+                victim, left = seg, seg["to"] - pos + 1
+        if left < 2 * self.min_size:
+            return None, 0
+        return victim, left
+
+    def has_work(self) -> bool:
+        """whether `next` would hand out a segment right now"""
+        with self.lock:
+            return self._pending() is not None or self._victim()[0] is not None
+
+    def _steal(self) -> Optional[dict]:
+        victim, left = self._victim()
+        if victim is None:
+            return None
+        end = victim["to"]
+        mid = self._active[victim["file_index"]] + left // 2
+        self._resize(victim, victim["from"], mid - 1)
+        seg = {
+            "file_index": 1 + max(i["file_index"] for i in self.segments),
+            "completed": 0,
+            "crc": 0,
+        }
+        self._resize(seg, mid, end)
+        self.segments.append(seg)
+        self._active[seg["file_index"]] = mid
+        return seg
+
+    @staticmethod
+    def _resize(seg: dict, start: int, end: int):
+        seg["range"] = f"bytes={start}-{end}"
+        seg["from"] = start
+        seg["to"] = end
+        seg["file_size"] = end - start + 1
+
+    def reserve(self, seg: dict, pos: int, n: int) -> int:
+        """called before every read, claims bytes `pos` to `pos + n - 1` of the segment
+        so that they can not be stolen by another thread
+
+        Args:
+            seg (dict): the segment being read
+            pos (int): offset of the next byte of the response
+            n (int): number of bytes the thread wants to read
+
+        Returns:
+            int: number of bytes the thread may read, 0 once the (possibly shrunk) segment is done
+        """
+        with self.lock:
+            n = max(0, min(n, seg["to"] - pos + 1))
+            self._active[seg["file_index"]] = pos + n
+            return n
+
+    def release(self, seg: dict) -> None:
+        """the thread is done with the segment, anything left in it can be picked up again"""
+        with self.lock:
+            self._active.pop(seg["file_index"], None)
+
+    def give_up(self, seg: dict) -> None:
+        """the segment could not be downloaded, it is not handed out again"""
+        with self.lock:
+            self.failed.add(seg["file_index"])
@@ -0,0 +1,592 @@
+"""
+Downloading only some byte ranges of a file, into memory or into a sparse file
+"""
+
+import os
+from base64 import b64decode, b64encode
+from json import dumps as _dumps, loads as _loads
+from queue import Queue
+from random import uniform
+from threading import Lock, Thread, local as local_data
+from time import sleep
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .downloader import RETRY_STATUS_CODES, Downloader, retryable_errors
+from .URL import URL, basic_headers
+from .URL.util import remove_quotes
+from .util import (
+    MetaError,
+    RemoteFileChangedError,
+    TransientHTTPError,
+    make_range_sizes,
+)
+from .writer import PreallocWriter
+
+# the bitmap of a sparse file has a bit per block
+BLOCK_SIZE = 64 * 1024
+
+# (start, end) with the end included, like the Range header
+Range = Tuple[int, int]
+
+
+def resolve_ranges(
+    ranges: Sequence[Tuple[int, Optional[int]]], size: int
+) -> List[Range]:
+    """turn ranges as they are given to `RangeFetcher.fetch` into ranges of the file
+
+    Args:
+        ranges (Sequence[Tuple[int, Optional[int]]]): (start, end) with the end included,
+            (start, None) is the rest of the file and (-n, None) its last n bytes
+        size (int): size of the file
+
+    Raises:
+        ValueError: a range is empty or starts after the end of the file
+    Returns:
+        List[Range]: the ranges clipped to the file, in the order they were given
+    """
+    res = []
+    for start, end in ranges:
+        if start < 0:
+            start, end = max(0, size + start), size - 1
+        end = size - 1 if end is None else min(end, size - 1)
+        if start > end:
+            raise ValueError(f"Range {start}-{end} is not in the file of {size} bytes")
+        res.append((start, end))
+    return res
+
+
+def merge_ranges(ranges: Sequence[Range], gap: int = 0) -> List[Range]:
+    """sort the ranges and merge the ones that overlap, touch or are less than `gap` bytes apart"""
+    res = []
+    for start, end in sorted(ranges):
+        if res and start <= res[-1][1] + 1 + gap:
+            res[-1] = (res[-1][0], max(res[-1][1], end))
+        else:
+            res.append((start, end))
+    return res
+
+
+def split_range(r: Range, size: int) -> List[Range]:
+    """split a range into parts of about `size` bytes, see `make_range_sizes`"""
+    start, end = r
+    count = -(-(end - start + 1) // size)
+    if count <= 1:
+        return [r]
+    return [
+        (start + i["from"], start + i["to"])
+        for i in make_range_sizes(end - start + 1, count)
+    ]
+
+
+def parse_content_range(value: Optional[str]) -> Range:
+    """`bytes 0-99/1000` -> (0, 99)
+
+    Raises:
+        MetaError: the header is missing or is not a byte range
+    """
+    try:
+        unit, _, spec = value.strip().partition(" ")
+        first, _, last = spec.partition("/")[0].partition("-")
+        if unit.lower() != "bytes":
+            raise ValueError(unit)
+        return int(first), int(last)
+    except (AttributeError, ValueError):
+        raise MetaError(f"Invalid Content-Range: {value}")
+
+
+class BodyReader(object):
+    """buffered reads of a response body, to find the parts of a `multipart/byteranges` response"""
+
+    def __init__(self, raw, block: int = 64 * 1024):
+        self._read = raw.read
+        self.block = block
+        self._buf = b""
+
+    def _fill(self) -> bool:
+        data = self._read(self.block)
+        self._buf += data
+        return bool(data)
+
+    def readline(self) -> bytes:
+        """the next line with its line break, empty at the end of the body"""
+        while True:
+            i = self._buf.find(b"\n")
+            if i >= 0:
+                line, self._buf = self._buf[: i + 1], self._buf[i + 1 :]
+                return line
+            if not self._fill():
+                line, self._buf = self._buf, b""
+                return line
+
+    def iter_read(self, n: int) -> Iterator[bytes]:
+        """the next `n` bytes, in blocks
+
+        Raises:
+            ConnectionError: the body ended before them
+        """
+        while n > 0:
+            if not self._buf and not self._fill():
+                raise ConnectionError(
+                    f"Connection closed with {n} bytes of a part left"
+                )
+            data, self._buf = self._buf[:n], self._buf[n:]
+            n -= len(data)
+            yield data
+
+
+def iter_parts(
+    reader: BodyReader, boundary: bytes
+) -> Iterator[Tuple[Range, Iterator[bytes]]]:
+    """the ranges of a `multipart/byteranges` body and their data,
+    the data of a part has to be read before the next part is asked for
+
+    Raises:
+        MetaError: a part does not have a valid Content-Range
+    """
+    delimiter = b"--" + boundary
+    while True:
+        line = reader.readline()
+        if not line:
+            return
+        line = line.strip()
+        if line == delimiter + b"--":
+            return
+        if line != delimiter:
+            # the preamble or the line break that ends a part
+            continue
+        headers = {}
+        while True:
+            h = reader.readline().strip()
+            if not h:
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        start, end = parse_content_range(headers.get("content-range"))
+        yield (start, end), reader.iter_read(end - start + 1)
+
+
+def _boundary(content_type: str) -> Optional[bytes]:
+    """the boundary of a `multipart/byteranges` content type, None for any other type"""
+    kind, _, params = content_type.partition(";")
+    if kind.strip().lower() != "multipart/byteranges":
+        return None
+    for param in params.split(";"):
+        k, _, v = param.partition("=")
+        if k.strip().lower() == "boundary":
+            return remove_quotes(v.strip()).encode("latin-1")
+    raise MetaError(f"multipart/byteranges without a boundary: {content_type}")
+
+
+def _subtract(ranges: List[Range], done: List[Range]) -> List[Range]:
+    """the parts of `ranges` that are not in `done`"""
+    res = []
+    for start, end in ranges:
+        for d_start, d_end in merge_ranges(done):
+            if d_end < start or d_start > end:
+                continue
+            if d_start > start:
+                res.append((start, d_start - 1))
+            start = d_end + 1
+            if start > end:
+                break
+        if start <= end:
+            res.append((start, end))
+    return res
+
+
+class RangeFetcher(object):
+    """
+    Downloads byte ranges of a url, up to `threads` requests at once.
+    Ranges less than `merge_gap` bytes apart are requested as one (reading the gap costs less than a request),
+    up to `max_ranges` small ranges share a `multipart/byteranges` request and ranges bigger than `split_size`
+    are split among several requests. A server that answers a request for several ranges with only one of them
+    gets a request per range from then on, one that ignores ranges has the ranges picked out of the whole file.
+
+    Args:
+        url (URL): the file, its meta data is fetched if it is not known yet
+        threads (int, optional): requests at once. Defaults to 4.
+        headers (Optional[dict], optional): headers of the requests. Defaults to basic_headers.
+        timeout (Optional[tuple], optional): connect and read timeout of the requests. Defaults to None.
+    """
+
+    merge_gap: int = 64 * 1024
+    # servers limit the ranges of a request, nginx to `max_ranges`
+    max_ranges: int = 16
+    split_size: int = 8 * 1024 * 1024
+    # a request is retried after transient errors, see `Downloader.segment_retries`
+    retries: int = 5
+    retry_backoff: float = 0.5
+
+    def __init__(
+        self,
+        url: URL,
+        threads: int = 4,
+        headers: Optional[dict] = None,
+        timeout: Optional[tuple] = None,
+    ):
+        self.url = url
+        self.threads = threads
+        self.headers = headers or basic_headers
+        self.timeout = timeout
+        # whether the server sends several ranges in one response, None until a request tells
+        self.multirange: Optional[bool] = None
+        self.size = url.file_size
+        h = url._m_headers
+        self.validators = {
+            "etag": h.get("etag"),
+            "last-modified": h.get("last-modified"),
+        }
+        self.supports_ranges = h.get("accept-ranges", "").lower() == "bytes"
+
+    def _batches(self, ranges: List[Range]) -> List[List[Range]]:
+        """group the ranges into requests"""
+        if not self.supports_ranges:
+            # every request would get the whole file
+            return [ranges]
+        parts = []
+        for r in merge_ranges(ranges, self.merge_gap):
+            parts.extend(split_range(r, self.split_size))
+        if self.multirange is False:
+            return [[r] for r in parts]
+        res, size = [], 0
+        for r in parts:
+            n = r[1] - r[0] + 1
+            if not res or len(res[-1]) >= self.max_ranges or size + n > self.split_size:
+                res.append([])
+                size = 0
+            res[-1].append(r)
+            size += n
+        return res
+
+    def fetch(
+        self,
+        ranges: Sequence[Tuple[int, Optional[int]]],
+        write: Callable[[int, bytes], None],
+    ) -> List[Range]:
+        """download `ranges`, see `resolve_ranges` for what they can be
+
+        Args:
+            ranges (Sequence[Tuple[int, Optional[int]]]): the ranges
+            write (Callable[[int, bytes], None]): called with the position and the bytes of every block that arrives,
+                from the request threads at once, every byte is written once. The gaps between ranges that
+                were merged into one request are written as well.
+
+        Raises:
+            RemoteFileChangedError: the file on the server changed
+            TransientHTTPError, MetaError or an OSError: a request failed `retries` times in a row
+        Returns:
+            List[Range]: the ranges that were written, merged
+        """
+        wanted = resolve_ranges(ranges, self.size)
+        queue = Queue()
+        for batch in self._batches(wanted):
+            queue.put((batch, 0))
+        errors = []
+        lock = Lock()
+
+        def worker():
+            while True:
+                item = queue.get()
+                if item is None:
+                    return
+                batch, failures = item
+                try:
+                    if errors:
+                        continue
+                    left = self._fetch_batch(batch, write, lock)
+                    if left:
+                        # the server sent fewer ranges than were asked for
+                        for b in self._batches(left):
+                            queue.put((b, 0))
+                except retryable_errors() as e:
+                    if failures >= self.retries:
+                        errors.append(e)
+                        continue
+                    delay = self.retry_backoff * 2**failures
+                    sleep(uniform(delay / 2, delay))
+                    queue.put((batch, failures + 1))
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    queue.task_done()
+
+        threads = [
+            Thread(target=worker, daemon=True)
+            for _ in range(min(self.threads, queue.qsize()))
+        ]
+        for th in threads:
+            th.start()
+        queue.join()
+        for _ in threads:
+            queue.put(None)
+        for th in threads:
+            th.join()
+        if errors:
+            raise errors[0]
+        # the gaps were only requested (and written) if the server does ranges
+        return merge_ranges(wanted, self.merge_gap if self.supports_ranges else 0)
+
+    def _fetch_batch(
+        self, batch: List[Range], write: Callable[[int, bytes], None], lock: Lock
+    ) -> List[Range]:
+        """one request for the ranges of `batch`
+
+        Returns:
+            List[Range]: the parts of the ranges the server did not send
+        """
+        h = {
+            **self.headers,
+            "Accept-Encoding": "identity",
+            "range": "bytes=" + ",".join(f"{s}-{e}" for s, e in batch),
+        }
+        if_range = Downloader._pick_if_range(self.validators)
+        if if_range:
+            h["If-Range"] = if_range
+        with self.url.fetch(
+            headers=h, stream=True, refetch=True, timeout=self.timeout
+        ) as r:
+            if r.status_code == 200:
+                self._check_unchanged(r.headers)
+                return _subtract(batch, self._pick(r.raw, batch, write))
+            if r.status_code in RETRY_STATUS_CODES:
+                raise TransientHTTPError(
+                    f"{r.status_code} for {h['range']} of {self.url}", r.status_code
+                )
+            if r.status_code != 206:
+                raise MetaError(
+                    f"Expected a partial response for {h['range']}, got {r.status_code}"
+                )
+            boundary = _boundary(r.headers.get("content-type", ""))
+            if boundary is None:
+                # one range, the server may have merged the ones that were asked for
+                rng = parse_content_range(r.headers.get("content-range"))
+                parts = [(rng, r.raw.stream(64 * 1024, decode_content=False))]
+            else:
+                parts = iter_parts(BodyReader(r.raw), boundary)
+            done = []
+            for (start, end), data in parts:
+                pos = start
+                for block in data:
+                    write(pos, block)
+                    pos += len(block)
+                if pos != end + 1:
+                    raise ConnectionError(
+                        f"Connection closed with {end + 1 - pos} bytes of {start}-{end} left"
+                    )
+                done.append((start, end))
+        if len(batch) > 1:
+            with lock:
+                self.multirange = boundary is not None
+        return _subtract(batch, done)
+
+    def _check_unchanged(self, headers) -> None:
+        """a 200 answer to If-Range means the file changed, unless the server does not do ranges (or several at once)
+
+        Raises:
+            RemoteFileChangedError: the validators of the response are not the ones of the file
+        """
+        for k, v in self.validators.items():
+            if v is not None and headers.get(k) not in (None, v):
+                raise RemoteFileChangedError(f"{self.url} changed")
+
+    @staticmethod
+    def _pick(
+        raw, batch: List[Range], write: Callable[[int, bytes], None]
+    ) -> List[Range]:
+        """write the ranges of `batch` from the whole file, reading it up to the end of the last one"""
+        last = max(e for _, e in batch)
+        pos = 0
+        for block in raw.stream(64 * 1024, decode_content=False):
+            end = pos + len(block) - 1
+            for s, e in batch:
+                if s <= end and e >= pos:
+                    lo, hi = max(s, pos), min(e, end)
+                    write(lo, block[lo - pos : hi - pos + 1])
+            pos = end + 1
+            if pos > last:
+                break
+        return [(s, min(e, pos - 1)) for s, e in batch if s < pos]
+
+
+class BlockMap(object):
+    """
+    Which blocks of a file are there, a bit per `block_size` bytes
+
+    Args:
+        size (int): size of the file
+        block_size (int, optional): Defaults to BLOCK_SIZE.
+        bits (Optional[bytes], optional): the bitmap of `to_dict`. Defaults to none of the blocks.
+    """
+
+    def __init__(
+        self, size: int, block_size: int = BLOCK_SIZE, bits: Optional[bytes] = None
+    ):
+        self.size = size
+        self.block_size = block_size
+        count = -(-size // block_size)
+        self.bits = bytearray(bits) if bits else bytearray(-(-count // 8))
+        self.count = count
+
+    def __contains__(self, block: int) -> bool:
+        return bool(self.bits[block >> 3] & (1 << (block & 7)))
+
+    def _blocks(self, r: Range) -> range:
+        return range(r[0] // self.block_size, r[1] // self.block_size + 1)
+
+    def missing(self, ranges: Sequence[Range]) -> List[Range]:
+        """the blocks of `ranges` that are not there, as ranges of the file"""
+        res = []
+        for r in merge_ranges(ranges):
+            for block in self._blocks(r):
+                if block in self:
+                    continue
+                start = block * self.block_size
+                end = min(start + self.block_size, self.size) - 1
+                if res and res[-1][1] + 1 == start:
+                    res[-1] = (res[-1][0], end)
+                else:
+                    res.append((start, end))
+        return res
+
+    def add(self, r: Range) -> None:
+        """mark the blocks that `r` covers as a whole"""
+        first = -(-r[0] // self.block_size)
+        # the last block is shorter
+        last = (
+            self.count - 1
+            if r[1] + 1 >= self.size
+            else (r[1] + 1) // self.block_size - 1
+        )
+        for block in range(first, last + 1):
+            self.bits[block >> 3] |= 1 << (block & 7)
+
+    @property
+    def complete(self) -> bool:
+        return all(i in self for i in range(self.count))
+
+    def to_dict(self) -> dict:
+        return {
+            "size": self.size,
+            "block_size": self.block_size,
+            "bits": b64encode(bytes(self.bits)).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "BlockMap":
+        return cls(d["size"], d["block_size"], b64decode(d["bits"]))
+
+
+class SparseFile(object):
+    """
+    A local copy of some ranges of a remote file, the rest of it is a hole (on file systems that have them).
+    Which blocks are there is kept in `<path>.blocks` beside it, so every block is downloaded once
+    as long as the file on the server stays the same. The blocks are whole `block_size` blocks of the file.
+
+    Args:
+        fetcher (RangeFetcher): downloads the ranges
+        path (str): the local file
+        block_size (int, optional): Defaults to BLOCK_SIZE.
+    """
+
+    def __init__(self, fetcher: RangeFetcher, path: str, block_size: int = BLOCK_SIZE):
+        self.fetcher = fetcher
+        self.path = path
+        self.blocks_path = f"{path}.blocks"
+        self.blocks = self._load(block_size)
+
+    def _load(self, block_size: int) -> BlockMap:
+        size = self.fetcher.size
+        try:
+            with open(self.blocks_path) as f:
+                saved = _loads(f.read())
+            blocks = BlockMap.from_dict(saved)
+            if (
+                os.path.isfile(self.path)
+                and blocks.size == size
+                and saved.get("validators") == self.fetcher.validators
+            ):
+                return blocks
+        except (OSError, ValueError, KeyError):
+            pass
+        # a new file, or the one on the server changed
+        with open(self.path, "wb") as f:
+            f.truncate(size)
+        return BlockMap(size, block_size)
+
+    def _save(self) -> None:
+        tmp = f"{self.blocks_path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(
+                _dumps({**self.blocks.to_dict(), "validators": self.fetcher.validators})
+            )
+        os.replace(tmp, self.blocks_path)
+
+    def fetch(self, ranges: Sequence[Tuple[int, Optional[int]]]) -> List[Range]:
+        """download the blocks of `ranges` that are not there yet, see `resolve_ranges` for what they can be
+
+        Returns:
+            List[Range]: the ranges that were downloaded
+        """
+        missing = self.blocks.missing(resolve_ranges(ranges, self.blocks.size))
+        if not missing:
+            return []
+        local = local_data()
+        # the writers that are still open
+        opened = set()
+
+        def write(pos: int, data: bytes) -> None:
+            # a descriptor per thread, reopened where every part starts
+            w = getattr(local, "writer", None)
+            if w is None or w.offset != pos:
+                if w:
+                    w.close()
+                    opened.discard(w)
+                w = local.writer = PreallocWriter(self.path, pos)
+                opened.add(w)
+            w.write(data)
+
+        try:
+            fetched = self.fetcher.fetch(missing, write)
+        finally:
+            for w in opened:
+                w.close()
+        for r in fetched:
+            self.blocks.add(r)
+        self._save()
+        return fetched
+
+    def read(self, start: int, end: Optional[int] = None) -> bytes:
+        """the bytes `start` to `end` (included, see `resolve_ranges`), downloaded if they are not there yet"""
+        ((start, end),) = resolve_ranges([(start, end)], self.blocks.size)
+        self.fetch([(start, end)])
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+
+def read_ranges(
+    fetcher: RangeFetcher, ranges: Sequence[Tuple[int, Optional[int]]]
+) -> List[bytes]:
+    """download `ranges` into memory, see `resolve_ranges` for what they can be
+
+    Returns:
+        List[bytes]: the bytes of every range, in the order they were given
+    """
+    wanted = resolve_ranges(ranges, fetcher.size)
+    spans = merge_ranges(wanted, fetcher.merge_gap)
+    buffers = [bytearray(e - s + 1) for s, e in spans]
+
+    def write(pos: int, data: bytes) -> None:
+        # the spans do not overlap, the threads write into different places
+        for (s, e), buf in zip(spans, buffers):
+            if s <= pos <= e:
+                buf[pos - s : pos - s + len(data)] = data
+                return
+
+    fetcher.fetch(wanted, write)
+    res = []
+    for start, end in wanted:
+        i = next(i for i, (s, e) in enumerate(spans) if s <= start and end <= e)
+        s = spans[i][0]
+        res.append(bytes(buffers[i][start - s : end - s + 1]))
+    return res
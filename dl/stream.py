@@ -0,0 +1,207 @@
+"""
+Reading response bodies in large blocks
+"""
+
+from time import sleep, time
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from .bandwidth import TokenBucket
+
+if TYPE_CHECKING:
+    from http.client import HTTPResponse
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class ChunkSizer(object):
+    """Picks a read size (a power of two between `min_size` and `max_size`)
+    that takes roughly `target` seconds at the measured throughput
+    """
+
+    def __init__(
+        self,
+        min_size: int = MIN_CHUNK,
+        max_size: int = MAX_CHUNK,
+        target: float = 0.05,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target = target
+        self.size = min_size
+        self.rate = 0.0
+
+    def update(self, n: int, elapsed: float) -> int:
+        """record a read of `n` bytes that took `elapsed` seconds
+
+        Returns:
+            int: the next read size
+        """
+        if elapsed <= 0:
+            # read was served from a buffer, we can afford more
+            self.size = min(self.size * 2, self.max_size)
+            return self.size
+        rate = n / elapsed
+        self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+        want = self.rate * self.target
+        size = self.size
+        while size < want and size < self.max_size:
+            size *= 2
+        while size > 2 * want and size > self.min_size:
+            size //= 2
+        self.size = size
+        return size
+
+
+def _direct_reader(raw) -> Optional["HTTPResponse"]:
+    """the http.client response under a urllib3 one if its body can be read without decoding,
+    urllib3's `readinto` reads into a new bytes object and copies that"""
+    from http.client import HTTPResponse
+
+    fp = getattr(raw, "_fp", None)
+    encoding = raw.headers.get("content-encoding", "identity").lower()
+    return fp if isinstance(fp, HTTPResponse) and encoding == "identity" else None
+
+
+def _read_in_place(readinto, target: memoryview, write: Callable[[memoryview], None]):
+    """read into memory that already is the destination, `write` only has to account for the bytes"""
+    with target:
+        n = readinto(target)
+        if n:
+            with target[:n] as chunk:
+                write(chunk)
+    return n
+
+
+def stream_response(
+    r,
+    write: Callable[[memoryview], None],
+    on_read: Optional[Callable[[int], None]] = None,
+    chunk_size: Optional[int] = None,
+    buffer_size: int = BUFFER_SIZE,
+    limit: Optional[Callable[[int], int]] = None,
+    throttle: Optional[TokenBucket] = None,
+    buffer: Optional[Callable[[int], memoryview]] = None,
+) -> int:
+    """reads the body of a streamed response into a reusable buffer with `readinto`
+    and hands it to `write` in blocks of up to `buffer_size` bytes
+
+    Args:
+        r (requests.Response): response opened with stream=True
+        write (Callable[[memoryview], None]): called with the filled part of the buffer, must not keep a reference to it
+        on_read (Optional[Callable[[int], None]], optional): called with the size of every read. Defaults to None.
+        chunk_size (Optional[int], optional): fixed read size, adapts to the throughput when None. Defaults to None.
+        buffer_size (int, optional): size of the write buffer. Defaults to BUFFER_SIZE.
+        limit (Optional[Callable[[int], int]], optional): called with the read size before every read,
+            returns how many bytes may actually be read, reading stops when it returns 0. Defaults to None.
+        throttle (Optional[TokenBucket], optional): bucket the reads are paced by. Defaults to None.
+        buffer (Optional[Callable[[int], memoryview]], optional): called with the read size, returns the memory
+            the read goes to instead of the reusable buffer (see `writer.MmapWriter`),
+            every read is then handed to `write` right away. Defaults to None.
+
+    Returns:
+        int: number of bytes read
+    """
+    raw = r.raw
+    raw.decode_content = True
+    direct = _direct_reader(raw)
+    readinto = direct.readinto if direct else raw.readinto
+    sizer = None if chunk_size else ChunkSizer(max_size=buffer_size)
+    size = chunk_size or sizer.size
+    view = None if buffer else memoryview(bytearray(max(buffer_size, size)))
+    filled = 0
+    total = 0
+    try:
+        while True:
+            want = size
+            if throttle and throttle.read_size:
+                want = min(want, throttle.read_size)
+            want = limit(want) if limit else want
+            if not want:
+                break
+            t = time()
+            if buffer:
+                n = _read_in_place(readinto, buffer(want), write)
+            else:
+                if filled + want > len(view):
+                    write(view[:filled])
+                    filled = 0
+                n = readinto(view[filled : filled + want])
+                filled += n
+            if not n:
+                break
+            if sizer:
+                size = sizer.update(n, time() - t)
+            total += n
+            if on_read:
+                on_read(n)
+            wait = throttle.take(n) if throttle else 0
+            if wait:
+                sleep(wait)
+    finally:
+        if filled:
+            write(view[:filled])
+        if view is not None:
+            view.release()
+        if direct and direct.isclosed():
+            # urllib3 did not see the body end, the connection can still be reused
+            raw.release_conn()
+    return total
+
+
+async def stream_response_async(
+    r,
+    write: Callable[[memoryview], Awaitable[None]],
+    on_read: Optional[Callable[[int], None]] = None,
+    chunk_size: Optional[int] = None,
+    buffer_size: int = BUFFER_SIZE,
+    limit: Optional[Callable[[int], int]] = None,
+    throttle: Optional[TokenBucket] = None,
+) -> int:
+    """`stream_response` for an `AsyncResponse`, the data is copied into
+    the reusable buffer and written out in blocks of up to `buffer_size` bytes,
+    `write` is awaited so it can do its disk io off the event loop
+
+    Returns:
+        int: number of bytes read
+    """
+    import asyncio
+
+    sizer = None if chunk_size else ChunkSizer(max_size=buffer_size)
+    size = chunk_size or sizer.size
+    buf = bytearray(max(buffer_size, size))
+    view = memoryview(buf)
+    filled = 0
+    total = 0
+    try:
+        while True:
+            want = size
+            if throttle and throttle.read_size:
+                want = min(want, throttle.read_size)
+            want = limit(want) if limit else want
+            if not want:
+                break
+            if filled + want > len(buf):
+                await write(view[:filled])
+                filled = 0
+            t = time()
+            data = await r.read(want)
+            n = len(data)
+            if not n:
+                break
+            view[filled : filled + n] = data
+            if sizer:
+                size = sizer.update(n, time() - t)
+            filled += n
+            total += n
+            if on_read:
+                on_read(n)
+            wait = throttle.take(n) if throttle else 0
+            if wait:
+                await asyncio.sleep(wait)
+    finally:
+        if filled:
+            await write(view[:filled])
+        # not released, a cancelled write can still be using a slice of it in its thread
+    return total
@@ -0,0 +1,131 @@
+"""
+Finding the number of connections a host serves a download fastest with
+"""
+
+from json import dump as _dump, load as _load
+from os import replace as _replace
+from threading import Lock
+from time import time
+from typing import Optional
+
+from ._cache import get_cachedir
+
+AUTO = "auto"
+
+_store_lock = Lock()
+
+
+def _store_path() -> str:
+    return get_cachedir("connections.json")
+
+
+def _load_store() -> dict:
+    try:
+        with open(_store_path()) as f:
+            return _load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def learned_connections(host: str) -> Optional[int]:
+    """the connection count saved for `host` by an earlier download, if any"""
+    with _store_lock:
+        entry = _load_store().get(host)
+    return entry["connections"] if entry else None
+
+
+def save_connections(host: str, n: int) -> None:
+    with _store_lock:
+        store = _load_store()
+        store[host] = {"connections": n, "updated": time()}
+        path = _store_path()
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                _dump(store, f)
+            _replace(tmp, path)
+        except OSError:
+            pass
+
+
+class ConnectionTuner(object):
+    """
+    Hill climbing on the number of connections: it grows while every step up raises the
+    aggregate throughput by at least `min_gain`, goes back to the best count once it levels off
+    and drops a quarter of the connections (at least one) when the server starts answering 429 / 503.
+
+    Args:
+        start (int): connections to start with
+        max_connections (int, optional): Defaults to 16.
+        min_gain (float, optional): relative throughput gain a step up has to bring. Defaults to 0.1.
+    """
+
+    # seconds a new count runs before its throughput is measured, so the new connections can ramp up
+    settle_time: float = 0.5
+    # seconds the throughput is measured over
+    sample_time: float = 1
+
+    def __init__(self, start: int, max_connections: int = 16, min_gain: float = 0.1):
+        self.max_connections = max_connections
+        self.min_gain = min_gain
+        self.connections = max(1, min(start, max_connections))
+        self.best = self.connections
+        self.best_rate = 0.0
+        self.growing = True
+        # whether `best` is based on anything, a download that finishes too soon says nothing about the host
+        self.learned = False
+        self._ceiling = max_connections
+        self._changed_at = None
+        self._sample = None
+        self._throttled = 0
+
+    def update(self, now: float, total: int, throttled: int) -> int:
+        """called regularly while the download runs
+
+        Args:
+            now (float): the current time
+            total (int): bytes downloaded so far
+            throttled (int): 429 and 503 answers so far
+
+        Returns:
+            int: the number of connections to run now
+        """
+        if self._changed_at is None:
+            self._changed_at = now
+            self._throttled = throttled
+        if throttled > self._throttled:
+            self._throttled = throttled
+            n = self.connections - max(1, self.connections // 4)
+            return self._set(max(1, n), now, ceiling=True)
+        if now - self._changed_at < self.settle_time:
+            return self.connections
+        if self._sample is None:
+            self._sample = (now, total)
+            return self.connections
+        started, start_total = self._sample
+        if now - started < self.sample_time or not self.growing:
+            return self.connections
+        rate = (total - start_total) / (now - started)
+        self.learned = True
+        if rate > self.best_rate * (1 + self.min_gain):
+            self.best, self.best_rate = self.connections, rate
+            if self.connections < self._ceiling:
+                return self._set(
+                    min(
+                        self._ceiling, self.connections + max(1, self.connections // 2)
+                    ),
+                    now,
+                )
+        # levelled off, the last step up did not pay for itself
+        self.growing = False
+        return self._set(self.best, now)
+
+    def _set(self, n: int, now: float, ceiling: bool = False) -> int:
+        if ceiling:
+            # the server pushed back, do not grow past this again
+            self._ceiling = self.best = n
+            self.learned = True
+        self.connections = n
+        self._changed_at = now
+        self._sample = None
+        return n
@@ -1,4 +1,5 @@
 from os.path import realpath, dirname, isfile, getsize
+from threading import Lock
 
 script_loc = realpath(__file__)
 script_dir = dirname(script_loc)
@@ -8,6 +9,69 @@ class MetaError(Exception):
     pass
 
 
+class RemoteFileChangedError(MetaError):
+    """the file on the server is not the one a resumed download started with"""
+
+    pass
+
+
+class StalledError(IOError):
+    """the connection is slower than the minimum speed"""
+
+    pass
+
+
+class TransientHTTPError(IOError):
+    """the server answered with a status that is worth retrying (408, 429 and 5xx)"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IncompleteDownloadError(ValueError):
+    """some segments ran out of retries, the download can be resumed later
+
+    Attributes:
+        segments (list): `SegmentStatus` of the failed segments
+    """
+
+    def __init__(self, message: str, segments: list):
+        super().__init__(message)
+        self.segments = segments
+
+
+class DownloadLockedError(TimeoutError):
+    """another process kept downloading the same url for longer than `Downloader.lock_timeout`"""
+
+    pass
+
+
+class DecompressionError(ValueError):
+    """the downloaded file could not be decompressed, it is kept as it was downloaded"""
+
+    pass
+
+
+class DigestMismatchError(ValueError):
+    """the downloaded file does not have the digest it was expected to have"""
+
+    pass
+
+
+class Counter(object):
+    """thread safe counter, used to keep track of the downloaded bytes in memory"""
+
+    def __init__(self, value: int = 0):
+        self.value = value
+        self._lock = Lock()
+
+    def add(self, n: int) -> int:
+        with self._lock:
+            self.value += n
+            return self.value
+
+
 def make_range_sizes(_size, rc: int = 3) -> list:
     """this abomination generates range request 
     headers depending on number of chunks we download
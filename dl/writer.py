@@ -0,0 +1,189 @@
+"""
+Output writers used by the download threads
+"""
+
+import mmap
+import os
+from zlib import crc32
+from ._cache import get_cachedir
+
+PARTS = "parts"
+PREALLOC = "prealloc"
+MMAP = "mmap"
+
+WRITE_MODES = (PARTS, PREALLOC, MMAP)
+# modes that write into the preallocated output file instead of part files
+IN_PLACE_MODES = (PREALLOC, MMAP)
+
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def preallocate(path: str, size: int) -> None:
+    """creates (or grows) `path` to `size` bytes so that the threads can write at their own offsets
+
+    Args:
+        path (str): file to preallocate
+        size (int): final size of the file
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | _O_BINARY, 0o644)
+    try:
+        current = os.fstat(fd).st_size
+        if current > size:
+            # left over from a bigger version of the file
+            os.ftruncate(fd, size)
+        if current >= size:
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            # windows or a filesystem without fallocate support
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def file_crc32(
+    path: str, offset: int, length: int, block: int = 4 * 1024 * 1024, crc: int = 0
+) -> int:
+    """crc32 of `length` bytes of `path` starting at `offset`
+
+    Args:
+        crc (int, optional): checksum of the bytes before `offset`, to continue it. Defaults to 0.
+    Returns:
+        int: the checksum, -1 if the file is shorter than that or does not exist
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while length:
+                data = f.read(min(block, length))
+                if not data:
+                    return -1
+                crc = crc32(data, crc)
+                length -= len(data)
+    except OSError:
+        return -1
+    return crc
+
+
+class PartFileWriter(object):
+    """appends a range to its own `.part.<i>` file in the cache directory,
+    the parts are merged into the final file once all threads are done.
+    Anything after the first `offset` bytes of the file is dropped, i.e. what a failed request
+    wrote after the last byte that was counted as completed.
+    """
+
+    def __init__(self, filename: str, idx: int, offset: int = 0):
+        # unbuffered, the bytes counted as completed have to be readable from the file
+        self._f = open(get_cachedir(f"{filename}.part.{idx}"), "ab", 0)
+        self._f.truncate(offset)
+
+    def write(self, b) -> int:
+        view = memoryview(b)
+        total = len(view)
+        while view:
+            view = view[self._f.write(view) :]
+        return total
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class PreallocWriter(object):
+    """writes a range directly into the preallocated output file starting at `offset`"""
+
+    def __init__(self, path: str, offset: int):
+        self._fd = os.open(path, os.O_WRONLY | _O_BINARY)
+        self.offset = offset
+        if not hasattr(os, "pwrite"):
+            os.lseek(self._fd, offset, os.SEEK_SET)
+
+    def write(self, b) -> int:
+        view = memoryview(b)
+        total = len(view)
+        while view:
+            if hasattr(os, "pwrite"):
+                n = os.pwrite(self._fd, view, self.offset)
+            else:  # every thread owns its descriptor so the file position is ours
+                n = os.write(self._fd, view)
+            self.offset += n
+            view = view[n:]
+        return total
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class MappedFile(object):
+    """the preallocated output file mapped into memory, shared by the `MmapWriter`s of a download"""
+
+    def __init__(self, path: str, size: int):
+        self._fd = os.open(path, os.O_RDWR | _O_BINARY)
+        self.mm = mmap.mmap(self._fd, size)
+        self.view = memoryview(self.mm)
+
+    def release(self, start: int, end: int) -> None:
+        """the bytes from `start` to `end` are complete, unmap them and start writing them back
+        so that neither the process nor the page cache fill up with the whole file"""
+        # only the pages that are entirely in the range, the ones at the edges can belong to other segments
+        page = mmap.ALLOCATIONGRANULARITY
+        start = -(-start // page) * page
+        n = end // page * page - start
+        if n <= 0:
+            return
+        if hasattr(self.mm, "madvise"):
+            # the pages stay in the page cache, a shared mapping does not lose what was written to them
+            self.mm.madvise(mmap.MADV_DONTNEED, start, n)
+        if hasattr(os, "posix_fadvise"):
+            # starts the write back of the dirty pages without waiting for it, the clean ones are dropped
+            os.posix_fadvise(self._fd, start, n, os.POSIX_FADV_DONTNEED)
+        else:
+            self.mm.flush(start, n)
+
+    def close(self) -> None:
+        self.mm.flush()
+        try:
+            self.view.release()
+            self.mm.close()
+        except BufferError:
+            # a thread is still reading into the file (the download was interrupted), it is unmapped when it is done
+            return
+        os.close(self._fd)
+
+
+class MmapWriter(object):
+    """writes a range into a `MappedFile` starting at `offset`.
+    `buffer` hands out the mapped memory itself so a response can be read straight into the file,
+    writing a view returned by it only counts the bytes instead of copying them.
+    """
+
+    # the completed bytes are written back and dropped from memory every this many bytes
+    release_size = 8 * 1024 * 1024
+
+    def __init__(self, mapping: MappedFile, offset: int):
+        self._map = mapping
+        self.offset = offset
+        self._start = offset
+        self._released = offset
+
+    def buffer(self, n: int) -> memoryview:
+        """the next `n` bytes of the range in the file, the view has to be released after use"""
+        return self._map.view[self.offset : self.offset + n]
+
+    def write(self, b) -> int:
+        n = len(b)
+        if not (isinstance(b, memoryview) and b.obj is self._map.mm):
+            self._map.view[self.offset : self.offset + n] = b
+        self.offset += n
+        if self.offset - self._released >= self.release_size:
+            self._release()
+        return n
+
+    def _release(self) -> None:
+        # a fault maps the whole folio of the page cache, which can reach back into the part released last time
+        start = max(self._start, self._released - self.release_size)
+        self._map.release(start, self.offset)
+        self._released = self.offset
+
+    def close(self) -> None:
+        self._release()
@@ -1,21 +1,158 @@
 from dl import Downloader
 
-
 if __name__ == "__main__":
     from argparse import ArgumentParser
 
     parser = ArgumentParser(description="Download Files in Multiple threads")
-    parser.add_argument("url", metavar="URL", type=str, nargs="+")
+    parser.add_argument("url", metavar="URL", type=str, nargs="*")
+    parser.add_argument(
+        "-i",
+        "--input-file",
+        metavar="file with one url per line, downloads every url",
+    )
     parser.add_argument("--ua", metavar="User Agent")
     parser.add_argument(
         "-f",
         metavar="Output  Filename, pass PY_RANDOM for random string and PY_HASH for hash of the url(sha256)",
     )
     parser.add_argument("-d", metavar="Output directory")
-    parser.add_argument("-t", type=int, metavar="thread count")
+    parser.add_argument(
+        "-t",
+        type=lambda t: t if t == "auto" else int(t),
+        metavar="thread count, or auto to find the fastest count for the host",
+    )
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--write-mode",
+        choices=("parts", "prealloc", "mmap"),
+        help="parts: merge per-thread files at the end, prealloc: write in place, mmap: read into the mapped file",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="batch mode: connections open at once across all files",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        help="batch mode: connections open at once to a single host",
+    )
+    parser.add_argument(
+        "--digest",
+        metavar="expected digest as <algorithm>:<hex>, i.e. sha256:9f86d0...",
+    )
+    parser.add_argument(
+        "--limit-rate",
+        metavar="bandwidth limit in bytes per second, i.e. 500K or 2M, for all the files in batch mode",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="no console output at all"
+    )
+    parser.add_argument(
+        "--events",
+        metavar="file the download events are appended to as JSON lines",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="file the progress is written to in the Prometheus text format",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="directory for the metadata and intermediate files, DL_CACHE_DIR by default",
+    )
+    parser.add_argument(
+        "--download-cache",
+        nargs="?",
+        const="10G",
+        metavar="MAX_SIZE",
+        help="keep finished downloads and copy them instead of downloading them again, up to MAX_SIZE (10G)",
+    )
+    parser.add_argument(
+        "--decompress",
+        nargs="?",
+        const="auto",
+        choices=("auto", "gzip", "xz", "zstd"),
+        help="decompress the file while it downloads, auto tells the compression from the file",
+    )
+    parser.add_argument(
+        "--stdout",
+        action="store_true",
+        help="write the file to stdout in order instead of saving it, i.e. to pipe it into tar (no console output)",
+    )
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        metavar="another url of the same file, can be given more than once",
+    )
     args = parser.parse_args()
-    url = args.url[0]
+    rate_limit = None
+    if args.limit_rate:
+        from dl.bandwidth import parse_rate
+
+        rate_limit = parse_rate(args.limit_rate)
+    if args.cache_dir:
+        from dl import set_cache_dir
+
+        set_cache_dir(args.cache_dir)
+    if args.quiet or args.stdout:
+        # the console output goes to stdout as well
+        from dl.report import set_quiet
+
+        set_quiet()
+    listeners = []
+    if args.events:
+        from dl.metrics import JSONLinesExporter
+
+        listeners.append(JSONLinesExporter(args.events))
+    if args.metrics:
+        from dl.metrics import PrometheusExporter
+
+        listeners.append(PrometheusExporter(args.metrics))
+    cache = None
+    if args.download_cache:
+        from dl import DownloadCache
+        from dl.bandwidth import parse_rate
+
+        cache = DownloadCache(max_size=int(parse_rate(args.download_cache)))
+    urls = list(args.url)
+    if args.input_file:
+        from dl.batch import read_url_file
+
+        urls.extend(read_url_file(args.input_file))
+    if not urls:
+        parser.error("no urls to download")
+    if args.stdout and args.f:
+        parser.error("--stdout does not save the file, -f does not apply")
+    if len(urls) > 1:
+        if args.stdout:
+            parser.error("--stdout takes a single url")
+        for given, flag in (
+            (args.f, "-f"),
+            (args.digest, "--digest"),
+            (args.mirror, "--mirror"),
+        ):
+            if given:
+                parser.error(f"{flag} applies to a single url, not to a batch")
+        from dl.batch import BatchDownloader
+
+        batch = BatchDownloader(
+            urls,
+            d=args.d,
+            t=args.t,
+            max_connections=args.max_connections,
+            per_host=args.per_host,
+            ua=args.ua,
+            v=args.verbose,
+            write_mode=args.write_mode,
+            rate_limit=rate_limit,
+            listeners=listeners,
+            cache=cache,
+            decompress=args.decompress,
+        )
+        results = batch.start()
+        batch.report_results(results)
+        raise SystemExit(0 if all(i.ok for i in results) else 1)
+    url = urls[0]
     out_dir = args.d
     user_agent = args.ua
     filen = args.f
@@ -24,4 +161,24 @@ if __name__ == "__main__":
 
         filen = tolen_urlsafe()
         del token_urlsafe
-    Downloader(url, ua=user_agent, f=filen, d=out_dir, t=args.t, v=args.verbose).start()
+    downloader = Downloader(
+        url,
+        ua=user_agent,
+        f=filen,
+        d=out_dir,
+        t=args.t,
+        v=args.verbose,
+        write_mode=args.write_mode,
+        digest=args.digest,
+        rate_limit=rate_limit,
+        mirrors=args.mirror,
+        listeners=listeners,
+        cache=cache,
+        decompress=args.decompress,
+    )
+    if args.stdout:
+        import sys
+
+        downloader.stream_to(sys.stdout.buffer)
+    else:
+        downloader.start()
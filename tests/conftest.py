@@ -0,0 +1,215 @@
+"""
+A local HTTP server with range, multi range, If-Range and If-None-Match support, and a cache directory of every test's own
+"""
+
+import re
+import sys
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import dirname, realpath
+from threading import Lock, Thread
+
+import pytest
+
+sys.path.insert(0, dirname(dirname(realpath(__file__))))
+
+import dl._cache
+from dl.report import set_quiet
+from dl.URL import probe_cache
+
+_RANGE_RE = re.compile(r"\s*(\d*)-(\d*)\s*$")
+
+set_quiet()
+
+
+def payload(size: int, seed: int = 0) -> bytes:
+    """`size` bytes that differ at every offset, so a misplaced byte shows"""
+    pattern = bytes((i * 7 + seed) & 0xFF for i in range(251))
+    return (pattern * (size // 251 + 1))[:size]
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _ranges(self, size: int, etag: str):
+        server = self.server
+        h = self.headers.get("range", "")
+        if not server.ranges or not h.startswith("bytes="):
+            return None
+        if_range = self.headers.get("if-range")
+        if (
+            if_range
+            and if_range != etag
+            and if_range != server.last_modified(self.path)
+        ):
+            return None
+        res = []
+        for spec in h[len("bytes=") :].split(","):
+            start, end = _RANGE_RE.match(spec).groups()
+            if not start:
+                res.append((max(0, size - int(end)), size - 1))
+            else:
+                res.append((int(start), min(int(end), size - 1) if end else size - 1))
+        # a server without multipart answers only the first range
+        return res if server.ranges == "multi" else res[:1]
+
+    def _respond(self, body: bool):
+        server = self.server
+        with server.lock:
+            data = server.files.get(self.path)
+            location = server.redirects.get(self.path)
+            rng = self.headers.get("range")
+            server.log.append((self.command, self.path, rng))
+            # the probe always gets through
+            fail = server.fail and rng and not rng.startswith("bytes=0-")
+            if fail:
+                server.fail -= 1
+        if fail:
+            self.send_response(503)
+            self.send_header("content-length", "0")
+            self.end_headers()
+            return
+        if location:
+            self.send_response(302)
+            self.send_header("location", location)
+            self.send_header("content-length", "0")
+            self.end_headers()
+            return
+        if data is None:
+            self.send_response(404)
+            self.send_header("content-length", "0")
+            self.end_headers()
+            return
+        size = len(data)
+        etag = server.etag(self.path)
+        if self.headers.get("if-none-match") == etag:
+            self.send_response(304)
+            self.send_header("etag", etag)
+            self.end_headers()
+            return
+        ranges = self._ranges(size, etag)
+        chunks = []
+        if not ranges:
+            self.send_response(200)
+            chunks.append(data)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.send_response(206)
+            self.send_header("content-range", f"bytes {start}-{end}/{size}")
+            chunks.append(data[start : end + 1])
+        else:
+            self.send_response(206)
+            for start, end in ranges:
+                chunks.append(
+                    f"\r\n--BOUNDARY\r\ncontent-type: application/octet-stream\r\n"
+                    f"content-range: bytes {start}-{end}/{size}\r\n\r\n".encode()
+                )
+                chunks.append(data[start : end + 1])
+            chunks.append(b"\r\n--BOUNDARY--\r\n")
+        if ranges and len(ranges) > 1:
+            self.send_header("content-type", "multipart/byteranges; boundary=BOUNDARY")
+        else:
+            self.send_header("content-type", "application/octet-stream")
+        if server.ranges:
+            self.send_header("accept-ranges", "bytes")
+        if server.validators:
+            self.send_header("etag", etag)
+            self.send_header("last-modified", server.last_modified(self.path))
+        self.send_header("content-length", str(sum(len(i) for i in chunks)))
+        self.end_headers()
+        if body:
+            for i in chunks:
+                for j in range(0, len(i), server.block):
+                    self.wfile.write(i[j : j + server.block])
+                    if server.delay:
+                        time.sleep(server.delay)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+
+class FileServer(ThreadingHTTPServer):
+    """serves `files` (path -> bytes), every `set_file` is a new version with a new ETag and Last-Modified
+
+    Args:
+        ranges (optional): "multi" for multipart/byteranges, "single" for the first range only, None for no ranges
+    """
+
+    daemon_threads = True
+
+    def __init__(self, ranges="multi"):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.ranges = ranges
+        self.files = {}
+        self.versions = {}
+        # path -> path to redirect to
+        self.redirects = {}
+        # False for a server that sends neither ETag nor Last-Modified
+        self.validators = True
+        # seconds to wait after every `block` bytes of a body, a slow link for every connection
+        self.delay = 0
+        self.block = 64 * 1024
+        # (method, path, range header) of every request
+        self.log = []
+        # range requests to answer with 503, the probe excepted
+        self.fail = 0
+        self.lock = Lock()
+
+    def set_file(self, path: str, data: bytes) -> str:
+        with self.lock:
+            self.files[path] = data
+            self.versions[path] = self.versions.get(path, 0) + 1
+        return self.url(path)
+
+    def etag(self, path: str) -> str:
+        return f'"v{self.versions[path]}"'
+
+    def last_modified(self, path: str) -> str:
+        return formatdate(1_000_000_000 + self.versions.get(path, 0), usegmt=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+    def handle_error(self, request, client_address):
+        # clients close connections they have read enough of
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(ranges="multi") -> FileServer:
+        server = FileServer(ranges)
+        Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def server(make_server) -> FileServer:
+    return make_server()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """run in a directory of the test's own, with its own cache directory and no cached probes"""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "cache"
+    monkeypatch.setattr(dl._cache, "cached_dir", str(path))
+    monkeypatch.setattr(probe_cache, "path", None)
+    monkeypatch.setattr(probe_cache, "_entries", None)
+    return path
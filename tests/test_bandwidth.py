@@ -0,0 +1,47 @@
+from time import time
+
+import pytest
+
+from dl import Downloader
+from dl.bandwidth import Bandwidth, TokenBucket, parse_rate
+
+from conftest import payload
+
+
+def test_parse_rate():
+    assert parse_rate("500K") == 500 * 1024
+    assert parse_rate("2.5mb") == 2.5 * 1024**2
+    assert parse_rate("100") == 100
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_token_bucket_debt():
+    b = TokenBucket(1000, burst=0)
+    assert b.take(500) == pytest.approx(0.5, abs=0.01)
+    assert TokenBucket().take(10**9) == 0
+
+
+def test_bandwidth_shares():
+    bw = Bandwidth(300)
+    slow = bw.join(limit=50)
+    a, b = bw.join(), bw.join()
+    # what the slow download does not use goes to the others
+    assert (slow.rate, a.rate, b.rate) == (50, 125, 125)
+    bw.leave(slow)
+    assert (a.rate, b.rate) == (150, 150)
+    bw.set_limit(a, 100)
+    assert (a.rate, b.rate) == (100, 200)
+    bw.rate = None
+    assert (a.rate, b.rate) == (100, None)
+
+
+def test_download_rate_limit(server, tmp_path):
+    size = 1024 * 1024
+    url = server.set_file("/file.bin", payload(size))
+    start = time()
+    Downloader(url, f=str(tmp_path / "out.bin"), t=3, rate_limit=size).start()
+    elapsed = time() - start
+    # the burst of a quarter of a second and the probe come for free
+    assert 0.5 < elapsed < 3
+    assert (tmp_path / "out.bin").stat().st_size == size
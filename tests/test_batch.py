@@ -0,0 +1,48 @@
+import subprocess
+import sys
+from os.path import basename, dirname, join, realpath
+
+import pytest
+
+from dl.batch import BatchDownloader
+
+from conftest import payload
+
+DOWNLOAD_PY = join(dirname(dirname(realpath(__file__))), "download.py")
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_batch_downloads_every_url(server, tmp_path, write_mode):
+    files = {f"/{i}.bin": payload(200_000 + i, seed=i) for i in range(5)}
+    urls = [server.set_file(k, v) for k, v in files.items()]
+    batch = BatchDownloader(urls, d=str(tmp_path), write_mode=write_mode)
+    batch.report = False
+    results = batch.start()
+    assert [i.url for i in results] == urls
+    for (path, data), res in zip(files.items(), results):
+        assert res.ok, res.error
+        assert open(res.save_path, "rb").read() == data
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_batch_files_with_the_same_name(server, tmp_path, write_mode):
+    a, b = payload(300_000, seed=1), payload(200_000, seed=2)
+    urls = [server.set_file("/a/file.bin", a), server.set_file("/b/file.bin", b)]
+    batch = BatchDownloader(urls, d=str(tmp_path), write_mode=write_mode)
+    batch.report = False
+    results = batch.start()
+    assert all(i.ok for i in results), results
+    paths = [i.save_path for i in results]
+    assert sorted(basename(i) for i in paths) == ["file.1.bin", "file.bin"]
+    assert [open(i, "rb").read() for i in paths] == [a, b]
+
+
+def test_batch_rejects_single_file_options(tmp_path):
+    for flag in (["-f", "x.bin"], ["--digest", "sha256:00"], ["--mirror", "http://m/"]):
+        p = subprocess.run(
+            [sys.executable, DOWNLOAD_PY, "http://h/a", "http://h/b", *flag],
+            capture_output=True,
+            text=True,
+        )
+        assert p.returncode == 2
+        assert "not to a batch" in p.stderr
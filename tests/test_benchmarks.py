@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+from http.client import IncompleteRead
+from os.path import dirname, join, realpath
+from urllib.request import Request, urlopen
+
+import pytest
+
+BENCHMARKS = join(dirname(dirname(realpath(__file__))), "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+from bench_download import parse_strace_summary
+from server import serve
+
+STRACE = """\
+% time     seconds  usecs/call     calls    errors syscall
+------ ----------- ----------- --------- --------- ----------------
+ 60.00    0.000600          12        50           read
+ 40.00    0.000400          20        20         2 openat
+------ ----------- ----------- --------- --------- ----------------
+100.00    0.001000          14        70         2 total
+"""
+
+
+def test_parse_strace_summary():
+    assert parse_strace_summary(STRACE) == {"read": 50, "openat": 20, "total": 70}
+
+
+def test_server_ranges_and_drops():
+    payload = bytes(range(256)) * 4096
+    server = serve(payload, drop=1)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/file.bin"
+        with urlopen(Request(url, headers={"range": "bytes=10-19"})) as r:
+            assert r.status == 206
+            assert r.read() == payload[10:20]
+        # every response bigger than a probe is cut off
+        with urlopen(url) as r:
+            with pytest.raises(IncompleteRead):
+                r.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bench_download(tmp_path, cache_dir):
+    out = tmp_path / "results.json"
+    cmd = [sys.executable, join(BENCHMARKS, "bench_download.py"), "--size", "1"]
+    cmd += ["--threads", "2", "--scenario", "fast", "drops", "no-ranges"]
+    cmd += ["--out", str(out)]
+    env = {**os.environ, "DL_CACHE_DIR": str(cache_dir)}
+    p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=120)
+    assert p.returncode == 0, p.stdout + p.stderr
+    results = json.loads(out.read_text())["results"]
+    # both engines in every scenario
+    assert len(results) == 6
+    assert all(i["ok"] and i["throughput"] > 0 for i in results)
@@ -0,0 +1,69 @@
+import gzip
+import lzma
+
+import pytest
+
+import dl.decompress
+from dl import Downloader
+from dl.decompress import OUT_BLOCK, StreamDecompressor
+from dl.util import DecompressionError
+
+from conftest import payload
+
+COMPRESS = {"gzip": gzip.compress, "xz": lzma.compress}
+
+
+class _Recorder(object):
+    """the output file, noting the largest write"""
+
+    def __init__(self, f):
+        self.f = f
+        self.largest = 0
+
+    def write(self, b):
+        self.largest = max(self.largest, len(b))
+        return self.f.write(b)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+def _decompress(tmp_path, method, data):
+    source = tmp_path / "in"
+    source.write_bytes(data)
+    d = StreamDecompressor(method, str(tmp_path / "out"))
+    d._out = _Recorder(d._out)
+    d.finish(str(source))
+    return (tmp_path / "out").read_bytes(), d._out.largest
+
+
+@pytest.mark.parametrize("method", ["gzip", "xz"])
+def test_members_and_padding(tmp_path, monkeypatch, method):
+    # the padding spans several blocks of the file
+    monkeypatch.setattr(dl.decompress, "READ_BLOCK", 4096)
+    first, second = payload(50_000), payload(70_000, seed=5)
+    compress = COMPRESS[method]
+    data = compress(first) + b"\0" * 10_000 + compress(second) + b"\0" * 9_000
+    assert _decompress(tmp_path, method, data)[0] == first + second
+
+
+@pytest.mark.parametrize("method", ["gzip", "xz"])
+def test_output_is_bounded(tmp_path, method):
+    plain = b"\0" * (20 * OUT_BLOCK + 3)
+    out, largest = _decompress(tmp_path, method, COMPRESS[method](plain))
+    assert out == plain
+    assert largest <= OUT_BLOCK
+
+
+def test_garbage_after_a_member(tmp_path):
+    with pytest.raises(DecompressionError):
+        _decompress(tmp_path, "gzip", gzip.compress(b"data") + b"\0\0garbage")
+    assert not (tmp_path / "out").exists()
+
+
+def test_download_decompressed(server, tmp_path):
+    plain = payload(3 * 1024 * 1024)
+    url = server.set_file("/file.bin.gz", gzip.compress(plain, 1) + b"\0" * 512)
+    d = Downloader(url, f=str(tmp_path / "file.bin.gz"), t=4, decompress="auto")
+    d.start()
+    assert (tmp_path / "file.bin").read_bytes() == plain
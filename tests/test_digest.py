@@ -0,0 +1,52 @@
+import hashlib
+
+import pytest
+
+from dl import Downloader
+from dl.digest import StreamHasher, parse_digest
+from dl.util import DigestMismatchError
+
+from conftest import payload
+
+SIZE = 3 * 1024 * 1024 + 7
+
+
+def test_parse_digest():
+    assert parse_digest("MD5:ABC") == ("md5", "abc")
+    assert parse_digest("abc") == ("sha256", "abc")
+    with pytest.raises(ValueError):
+        parse_digest("nohash:abc")
+
+
+def test_hasher_takes_the_bytes_in_order():
+    data = payload(10_000)
+    h = StreamHasher("sha256")
+    # bytes that are not at the position are left for `catch_up` to read back
+    assert not h.feed(6000, data[6000:])
+    assert h.position == 0
+    assert h.feed(0, data[:6000])
+    assert h.feed(6000, data[6000:])
+    assert h.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_digest_checked_while_downloading(server, tmp_path, write_mode):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    path = tmp_path / "out.bin"
+    digest = "sha256:" + hashlib.sha256(data).hexdigest()
+    d = Downloader(url, f=str(path), t=4, write_mode=write_mode, digest=digest)
+    d.start()
+    assert d.file_digest == digest[7:]
+    assert path.read_bytes() == data
+
+
+def test_digest_mismatch_discards_the_download(server, tmp_path):
+    url = server.set_file("/file.bin", payload(SIZE))
+    path = tmp_path / "out.bin"
+    d = Downloader(url, f=str(path), t=4, digest="sha256:" + "0" * 64)
+    with pytest.raises(DigestMismatchError):
+        d.start()
+    assert not path.exists()
+    # nothing is left to resume either
+    assert Downloader(url, f=str(path), t=4)._journal.load() is None
@@ -0,0 +1,65 @@
+import hashlib
+
+from dl import DownloadCache, Downloader
+
+from conftest import payload
+
+SIZE = 2 * 1024 * 1024
+
+
+def _segment_requests(server):
+    return [r for m, p, r in server.log if m == "GET" and r and r != "bytes=0-65535"]
+
+
+def test_lru_eviction(tmp_path):
+    cache = DownloadCache(str(tmp_path / "store"), max_size=250)
+    files = []
+    for i in range(3):
+        f = tmp_path / f"{i}.bin"
+        f.write_bytes(payload(100, i))
+        files.append(f)
+    a = cache.put("http://a", str(files[0]), etag='"a"')
+    cache.put("http://b", str(files[1]))
+    # a is used after b, so b goes when c comes in
+    assert cache.get(cache.lookup("http://a"), str(tmp_path / "copy.bin"))
+    cache.put("http://c", str(files[2]))
+    assert cache.lookup("http://b") is None
+    assert cache.lookup("http://a") == a
+    assert cache.lookup_digest(hashlib.sha256(payload(100, 2)).hexdigest())
+    assert (tmp_path / "copy.bin").read_bytes() == files[0].read_bytes()
+    cache.close()
+
+
+def test_cached_download_is_revalidated(server, tmp_path):
+    cache = DownloadCache(str(tmp_path / "store"))
+    url = server.set_file("/file.bin", payload(SIZE))
+    Downloader(url, f=str(tmp_path / "1.bin"), t=3, cache=cache).start()
+    server.log.clear()
+    Downloader(url, f=str(tmp_path / "2.bin"), t=3, cache=cache).start()
+    # a conditional GET answered with 304 instead of the segments
+    assert not _segment_requests(server)
+    assert any(r is None and m == "GET" for m, p, r in server.log)
+    assert (tmp_path / "2.bin").read_bytes() == payload(SIZE)
+    new = server.set_file("/file.bin", payload(SIZE, seed=4))
+    Downloader(new, f=str(tmp_path / "3.bin"), t=3, cache=cache).start()
+    assert (tmp_path / "3.bin").read_bytes() == payload(SIZE, seed=4)
+    cache.close()
+
+
+def test_cached_by_digest(server, tmp_path):
+    cache = DownloadCache(str(tmp_path / "store"))
+    data = payload(SIZE)
+    digest = "sha256:" + hashlib.sha256(data).hexdigest()
+    first = server.set_file("/a.bin", data)
+    second = server.set_file("/b.bin", data)
+    Downloader(
+        first, f=str(tmp_path / "a.bin"), t=3, cache=cache, digest=digest
+    ).start()
+    server.log.clear()
+    d = Downloader(second, f=str(tmp_path / "b.bin"), t=3, cache=cache, digest=digest)
+    d.start()
+    # the digest vouches for the file of another url
+    assert not _segment_requests(server)
+    assert d.file_digest == digest[7:]
+    assert (tmp_path / "b.bin").read_bytes() == data
+    cache.close()
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import pytest
+
+from dl import AsyncDownloader, Downloader
+
+from conftest import payload
+
+SIZE = 3 * 1024 * 1024 + 123
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_download_write_modes(server, tmp_path, write_mode):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=4, write_mode=write_mode)
+    d.start()
+    assert (tmp_path / "out.bin").read_bytes() == data
+    # the segments were downloaded with ranges
+    assert sum(1 for m, p, r in server.log if r and m == "GET") >= 4
+
+
+@pytest.mark.parametrize("size", [1, 2, 3])
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+@pytest.mark.parametrize("engine", [Downloader, AsyncDownloader])
+def test_file_smaller_than_the_thread_count(server, tmp_path, engine, write_mode, size):
+    data = payload(size)
+    url = server.set_file("/file.bin", data)
+    d = engine(url, f=str(tmp_path / "out.bin"), t=3, write_mode=write_mode)
+    if engine is AsyncDownloader:
+        asyncio.run(d.start())
+    else:
+        d.start()
+    assert (tmp_path / "out.bin").read_bytes() == data
+
+
+class _RecordingDownloader(AsyncDownloader):
+    """notes the threads the disk io runs in"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.io_threads = {}
+
+    def _note(self, name):
+        self.io_threads.setdefault(name, set()).add(threading.get_ident())
+
+    def _load_headers(self):
+        self._note("load_headers")
+        return super()._load_headers()
+
+    def _checkpoint(self, force=False):
+        self._note("checkpoint")
+        return super()._checkpoint(force)
+
+    def _segment_callbacks(self, req, f):
+        write, *rest = super()._segment_callbacks(req, f)
+
+        def noting_write(b):
+            self._note("write")
+            write(b)
+
+        return (noting_write, *rest)
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_async_disk_io_off_the_event_loop(server, tmp_path, write_mode):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    d = _RecordingDownloader(
+        url, f=str(tmp_path / "out.bin"), t=4, write_mode=write_mode
+    )
+    asyncio.run(d.start())
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert set(d.io_threads) == {"load_headers", "checkpoint", "write"}
+    for threads in d.io_threads.values():
+        assert threading.get_ident() not in threads
@@ -0,0 +1,57 @@
+import pytest
+
+from dl import Downloader
+from dl.events import (
+    COMPLETE,
+    DOWNLOAD_FAILED,
+    MERGE,
+    PROBED,
+    PROGRESS,
+    SEGMENT_DONE,
+    SEGMENT_STARTED,
+    Throughput,
+    event_to_dict,
+)
+
+from conftest import payload
+
+
+def test_download_events(server, tmp_path):
+    data = payload(3 * 1024 * 1024)
+    url = server.set_file("/file.bin", data)
+    events = []
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=3, listeners=[events.append])
+    d.progress_interval = 0.01
+    d.start()
+    types = [i.type for i in events]
+    assert types[0] == PROBED and types[-1] == COMPLETE
+    assert types.index(MERGE) > max(i for i, t in enumerate(types) if t == SEGMENT_DONE)
+    started = {i.segment for i in events if i.type == SEGMENT_STARTED}
+    done = {i.segment for i in events if i.type == SEGMENT_DONE}
+    assert started == done and len(done) >= 3
+    progress = [i.completed for i in events if i.type == PROGRESS]
+    assert progress == sorted(progress)
+    assert all(i.url == url for i in events)
+    assert events[-1].completed == events[-1].total == len(data)
+
+
+def test_failed_download_event(server, tmp_path):
+    url = server.set_file("/file.bin", payload(3 * 1024 * 1024))
+    server.fail = 1000
+    events = []
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=3, listeners=[events.append])
+    d.segment_retries = 0
+    with pytest.raises(Exception):
+        d.start()
+    assert events[-1].type == DOWNLOAD_FAILED
+    assert "error" in event_to_dict(events[-1])
+    assert isinstance(event_to_dict(events[-1])["error"], str)
+
+
+def test_throughput():
+    t = Throughput(smoothing=0.5)
+    assert t.update(0, 0) == (0, 0)
+    assert t.update(1, 100) == (100, 100)
+    assert t.update(2, 400) == (300, 200)
+    assert t.eta(400) == 2
+    assert t.eta(0) == 0
@@ -0,0 +1,71 @@
+from dl.journal import MetaJournal
+
+
+def _meta():
+    return {
+        "filename": "f",
+        "reqs": [
+            {"file_index": 0, "from": 0, "to": 99, "completed": 0},
+            {"file_index": 1, "from": 100, "to": 199, "completed": 0},
+        ],
+    }
+
+
+def test_replay(cache_dir):
+    j = MetaJournal("name")
+    j.save(_meta())
+    j.append([{"file_index": 0, "completed": 10}])
+    j.append([{"file_index": 0, "completed": 50}, {"file_index": 1, "completed": 5}])
+    # a segment split off by work stealing
+    j.append([{"file_index": 2, "from": 150, "to": 199, "completed": 0}])
+    data = MetaJournal("name").load()
+    assert [i["completed"] for i in data["reqs"]] == [50, 5, 0]
+    assert data["seq"] == 3
+
+
+def test_torn_line_is_ignored(cache_dir):
+    j = MetaJournal("name")
+    j.save(_meta())
+    j.append([{"file_index": 0, "completed": 10}])
+    with open(j.path, "ab") as f:
+        f.write(b'{"seq": 2, "reqs": [{"file_index": 0, "comp')
+    j2 = MetaJournal("name")
+    assert j2.load()["reqs"][0]["completed"] == 10
+    assert j2.records == 1
+
+
+def test_compaction(cache_dir):
+    j = MetaJournal("name")
+    j.compact_after = 3
+    meta = _meta()
+    j.save(meta)
+    for i in range(3):
+        meta["reqs"][0]["completed"] = i + 1
+        j.append([{"file_index": 0, "completed": i + 1}])
+    assert j.needs_compaction
+    j.save(meta)
+    assert not j.needs_compaction
+    assert open(j.path, "rb").read() == b""
+    assert MetaJournal("name").load()["reqs"][0]["completed"] == 3
+
+
+def test_lines_in_the_snapshot_are_skipped(cache_dir):
+    j = MetaJournal("name")
+    meta = _meta()
+    j.save(meta)
+    j.append([{"file_index": 0, "completed": 10}])
+    lines = open(j.path, "rb").read()
+    meta["reqs"][0]["completed"] = 20
+    j.save(meta)
+    # a crash between the snapshot and emptying the journal
+    with open(j.path, "wb") as f:
+        f.write(lines)
+    assert MetaJournal("name").load()["reqs"][0]["completed"] == 20
+
+
+def test_remove(cache_dir):
+    j = MetaJournal("name")
+    j.save(_meta())
+    j.append([{"file_index": 0, "completed": 10}])
+    j.remove()
+    assert MetaJournal("name").load() is None
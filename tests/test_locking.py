@@ -0,0 +1,64 @@
+import json
+import os
+from time import time
+
+from dl import Downloader
+from dl.locking import FileLock, prune_locks
+
+from conftest import payload
+
+
+def _age(path, seconds):
+    t = time() - seconds
+    os.utime(path, (t, t))
+
+
+def test_prune_locks(cache_dir):
+    cache_dir.mkdir()
+    for name in ("old", "new", "held"):
+        (cache_dir / f"{name}.lock").write_text("{}")
+    _age(cache_dir / "old.lock", 7200)
+    _age(cache_dir / "held.lock", 7200)
+    held = FileLock(str(cache_dir / "held.lock"))
+    assert held.try_acquire()
+    try:
+        assert prune_locks(3600) == 1
+    finally:
+        held.release()
+    assert sorted(os.listdir(cache_dir)) == ["held.lock", "new.lock"]
+
+
+def test_lock_of_a_removed_file_is_not_taken(tmp_path, monkeypatch):
+    path = str(tmp_path / "url.lock")
+    stale = FileLock(path)
+    opened = []
+    real_open = os.open
+
+    def open_then_prune(*args):
+        fd = real_open(*args)
+        if not opened:
+            # another process prunes the file between the open and the flock
+            os.unlink(path)
+        opened.append(fd)
+        return fd
+
+    monkeypatch.setattr(os, "open", open_then_prune)
+    assert stale.try_acquire()
+    # the first descriptor was of the removed file, the lock is on the new one
+    assert len(opened) == 2
+    assert os.fstat(opened[1]).st_ino == os.stat(path).st_ino
+    stale.release()
+
+
+def test_download_prunes_old_locks(server, tmp_path, cache_dir):
+    cache_dir.mkdir()
+    old = cache_dir / "old.lock"
+    old.write_text("{}")
+    _age(old, 2 * Downloader.lock_max_age)
+    url = server.set_file("/file.bin", payload(100_000))
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=2)
+    d.start()
+    assert not old.exists()
+    # the fresh record is kept for the processes that waited for it
+    record = json.loads((cache_dir / f"{d._meta_file_name}.lock").read_text())
+    assert record["complete"]
@@ -0,0 +1,32 @@
+import json
+
+from dl import Downloader
+from dl.events import COMPLETE, PROBED
+from dl.metrics import JSONLinesExporter, PrometheusExporter
+
+from conftest import payload
+
+
+def test_exporters(server, tmp_path):
+    data = payload(2 * 1024 * 1024)
+    url = server.set_file("/file.bin", data)
+    prometheus = PrometheusExporter(str(tmp_path / "dl.prom"))
+    lines = JSONLinesExporter(str(tmp_path / "events.jsonl"))
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=3, listeners=[prometheus, lines])
+    d.start()
+    lines.close()
+    events = [json.loads(i) for i in open(tmp_path / "events.jsonl")]
+    assert events[0]["type"] == PROBED
+    assert events[-1]["type"] == COMPLETE
+    assert events[-1]["completed"] == len(data)
+    samples = {}
+    for line in (tmp_path / "dl.prom").read_text().splitlines():
+        if not line.startswith("#"):
+            name, value = line.split(" ")
+            samples[name.split("{")[0]] = float(value)
+    assert samples["dl_downloaded_bytes"] == len(data)
+    assert samples["dl_size_bytes"] == len(data)
+    assert samples["dl_done"] == 1
+    # the unit of a rate is in its name
+    assert "dl_speed_bytes_per_second" in samples
+    assert "dl_avg_speed_bytes_per_second" in samples
@@ -0,0 +1,39 @@
+from dl import Downloader
+
+from conftest import payload
+
+SIZE = 8 * 1024 * 1024
+
+
+def _segment_requests(server):
+    return [r for m, p, r in server.log if m == "GET" and r and r != "bytes=0-65535"]
+
+
+def test_segments_spread_over_mirrors(make_server, tmp_path):
+    data = payload(SIZE)
+    servers = [make_server() for _ in range(3)]
+    urls = [s.set_file("/file.bin", data) for s in servers[:2]]
+    # same size, other content (and ETag)
+    servers[2].set_file("/file.bin", data)
+    other = servers[2].set_file("/file.bin", payload(SIZE, seed=1))
+    d = Downloader(urls[0], f=str(tmp_path / "out.bin"), t=4, mirrors=[urls[1], other])
+    d.min_segment_size = 256 * 1024
+    d.start()
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert len(d.mirrors.mirrors) == 2
+    assert _segment_requests(servers[0]) and _segment_requests(servers[1])
+    assert not _segment_requests(servers[2])
+
+
+def test_failing_mirror(make_server, tmp_path):
+    data = payload(SIZE)
+    good, bad = make_server(), make_server()
+    url = good.set_file("/file.bin", data)
+    mirror = bad.set_file("/file.bin", data)
+    bad.fail = 1000
+    d = Downloader(url, f=str(tmp_path / "out.bin"), t=4, mirrors=[mirror])
+    d.retry_backoff = 0.01
+    d.start()
+    # the segments that failed on the mirror were downloaded from the url
+    assert _segment_requests(bad)
+    assert (tmp_path / "out.bin").read_bytes() == data
@@ -0,0 +1,31 @@
+from dl import Downloader
+from dl.URL import SessionPool, get_session, pool_stats
+
+from conftest import payload
+
+
+def test_downloads_share_connections(server, tmp_path):
+    urls = [server.set_file(f"/{i}.bin", payload(2 * 1024 * 1024, i)) for i in range(2)]
+    pool_stats.reset()
+    Downloader(urls[0], f=str(tmp_path / "0.bin"), t=3).start()
+    first = pool_stats.as_dict()
+    assert first["reused"] > 0
+    pool_stats.reset()
+    Downloader(urls[1], f=str(tmp_path / "1.bin"), t=3).start()
+    second = pool_stats.as_dict()
+    # the kept alive connections of the first download serve the second one
+    assert second["new_connections"] < first["new_connections"]
+    assert second["reused"] >= second["requests"] - 1
+
+
+def test_session_pool():
+    assert get_session() is get_session()
+    pool = SessionPool(pool_maxsize=4)
+    session = pool.session
+    pool.ensure_pool_size(2)
+    assert pool.pool_maxsize == 4
+    pool.ensure_pool_size(16)
+    assert pool.pool_maxsize == 16
+    # the same session with bigger pools
+    assert pool.session is session
+    assert session.get_adapter("http://example.com")._pool_maxsize == 16
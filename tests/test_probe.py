@@ -0,0 +1,91 @@
+import asyncio
+from multiprocessing import get_context
+
+import pytest
+
+from dl import AsyncDownloader, Downloader
+from dl.URL import URL, probe_cache
+from dl.URL.probe import ProbeCache
+
+from conftest import payload
+
+
+def test_probe_is_a_single_range_get(server):
+    url = server.set_file("/file.bin", payload(100_000))
+    u = URL(url)
+    assert u.file_size == 100_000
+    assert server.log == [("GET", "/file.bin", "bytes=0-65535")]
+    assert u.probe_data == payload(100_000)[:65536]
+
+
+def _fill(path: str, i: int) -> None:
+    cache = ProbeCache(path=path)
+    for j in range(200):
+        cache.set(f"http://host/{i}/{j}", f"http://final/{j}")
+
+
+def test_probe_cache_saved_by_several_processes(tmp_path):
+    path = str(tmp_path / "probes.json")
+    ctx = get_context("spawn")
+    procs = [ctx.Process(target=_fill, args=(path, i)) for i in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    # every save used a temp file of its own and replaced the cache with a whole one
+    assert [i.name for i in tmp_path.iterdir()] == ["probes.json"]
+    entries = ProbeCache(path=path)._load()
+    assert len(entries) >= 200
+
+
+def test_probe_skips_a_known_redirect(server):
+    data = payload(1000)
+    server.set_file("/file.bin", data)
+    server.redirects["/latest"] = "/file.bin"
+    url = server.url("/latest")
+    assert URL(url).file_size == 1000
+    server.log.clear()
+    u = URL(url)
+    assert u.file_size == 1000 and u.probe_data == data
+    assert [p for m, p, r in server.log] == ["/file.bin"]
+    # the redirect leads elsewhere now, it is followed again
+    server.set_file("/file2.bin", payload(500))
+    server.redirects["/latest"] = "/file2.bin"
+    del server.files["/file.bin"]
+    server.log.clear()
+    assert URL(url).file_size == 500
+    assert [p for m, p, r in server.log] == ["/file.bin", "/latest", "/file2.bin"]
+
+
+def _run(d) -> None:
+    if isinstance(d, AsyncDownloader):
+        asyncio.run(d.start())
+    else:
+        d.start()
+
+
+@pytest.mark.parametrize("validators", [True, False])
+@pytest.mark.parametrize("engine", [Downloader, AsyncDownloader])
+def test_download_of_a_file_changed_since_the_last_probe(
+    server, tmp_path, validators, engine
+):
+    server.validators = validators
+    server.redirects["/latest"] = "/file.bin"
+    url = server.url("/latest")
+    server.set_file("/file.bin", payload(300_000))
+    d = engine(url, f=str(tmp_path / "a.bin"), t=3)
+    _run(d)
+    # a new version within the ttl, the size and validators are not taken from before
+    data = payload(200_000, seed=1)
+    server.set_file("/file.bin", data)
+    d = engine(url, f=str(tmp_path / "b.bin"), t=3)
+    _run(d)
+    assert (tmp_path / "b.bin").read_bytes() == data
+
+
+def test_probe_cache_kept_in_memory_by_default(server, tmp_path):
+    url = server.set_file("/file.bin", payload(1000))
+    Downloader(url, f=str(tmp_path / "out.bin")).start()
+    assert probe_cache.path is None
+    assert not list(tmp_path.rglob("probes.json"))
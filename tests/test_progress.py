@@ -0,0 +1,38 @@
+import pytest
+
+import dl.downloader
+from dl import Downloader
+
+from conftest import payload
+
+
+class _RecordingDownloader(Downloader):
+    progress_interval = 0.01
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def _progress_callback(self, size, speed, perc):
+        self.calls.append((size, perc))
+
+
+@pytest.mark.parametrize("ranges", ["multi", None])
+def test_progress(make_server, tmp_path, monkeypatch, ranges):
+    server = make_server(ranges)
+    data = payload(3 * 1024 * 1024)
+    url = server.set_file("/file.bin", data)
+
+    def no_stat(path):
+        raise AssertionError(f"the progress looked at {path}")
+
+    # the downloaded bytes are counted in memory, not read off the part files
+    monkeypatch.setattr(dl.downloader, "getsize", no_stat)
+    monkeypatch.setattr(dl.downloader, "safe_getsize", no_stat)
+    d = _RecordingDownloader(url, f=str(tmp_path / "out.bin"), t=3)
+    d.start()
+    sizes = [size for size, perc in d.calls]
+    assert sizes == sorted(sizes)
+    size, perc = d.calls[-1]
+    assert size == len(data)
+    assert float(perc) == 100
@@ -0,0 +1,65 @@
+import io
+import zipfile
+
+import pytest
+
+from dl import RemoteFile
+
+from conftest import payload
+
+BLOCK = 64 * 1024
+
+
+def _zip(names):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        for i, name in enumerate(names):
+            z.writestr(name, payload(300_000, i))
+    return buf.getvalue()
+
+
+def _segment_requests(server):
+    return [r for m, p, r in server.log if m == "GET" and r and r != "bytes=0-65535"]
+
+
+def test_zipfile_reads_only_what_it_needs(server):
+    names = [f"{i}.bin" for i in range(20)]
+    data = _zip(names)
+    url = server.set_file("/a.zip", data)
+    with RemoteFile(url, block_size=BLOCK, readahead=0) as f:
+        with zipfile.ZipFile(f) as z:
+            assert z.namelist() == names
+            assert z.read("7.bin") == payload(300_000, 7)
+    fetched = 0
+    for r in _segment_requests(server):
+        for spec in r[len("bytes=") :].split(","):
+            start, end = spec.split("-")
+            fetched += int(end) - int(start) + 1
+    assert fetched < len(data) // 4
+
+
+@pytest.mark.parametrize("ranges", ["multi", "single", None])
+def test_seek_and_read(make_server, ranges):
+    server = make_server(ranges)
+    data = payload(1_000_000)
+    url = server.set_file("/file.bin", data)
+    with RemoteFile(url, block_size=BLOCK) as f:
+        assert f.seekable() and f.readable()
+        assert f.size == len(data)
+        f.seek(123_456)
+        assert f.read(200_000) == data[123_456:323_456]
+        assert f.tell() == 323_456
+        f.seek(-10, io.SEEK_END)
+        assert f.read() == data[-10:]
+        f.seek(0)
+        assert f.read() == data
+
+
+def test_sequential_reads_fetch_ahead(server):
+    data = payload(2 * 1024 * 1024)
+    url = server.set_file("/file.bin", data)
+    with RemoteFile(url, block_size=BLOCK, readahead=4) as f:
+        chunks = [f.read(BLOCK) for _ in range(len(data) // BLOCK)]
+    assert b"".join(chunks) == data
+    # the blocks ahead are fetched together
+    assert len(_segment_requests(server)) < len(data) // BLOCK
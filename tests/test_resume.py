@@ -0,0 +1,78 @@
+import pytest
+
+from dl import Downloader
+from dl.util import IncompleteDownloadError
+
+from conftest import payload
+
+SIZE = 3 * 1024 * 1024 + 11
+
+
+def _fail_once(url, path, write_mode):
+    d = Downloader(url, f=path, t=3, write_mode=write_mode)
+    d.segment_retries = 0
+    with pytest.raises(IncompleteDownloadError):
+        d.start()
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc", "mmap"])
+def test_resume_sends_if_range(server, tmp_path, write_mode):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    path = str(tmp_path / "out.bin")
+    server.fail = 1
+    _fail_once(url, path, write_mode)
+    server.log.clear()
+    Downloader(url, f=path, t=3, write_mode=write_mode).start()
+    assert open(path, "rb").read() == data
+    ranges = [r for m, p, r in server.log if r and not r.startswith("bytes=0-65535")]
+    # only the segment that failed was downloaded again
+    assert len(ranges) == 1
+
+
+@pytest.mark.parametrize("write_mode", ["parts", "prealloc"])
+def test_resume_after_the_file_changed(server, tmp_path, write_mode):
+    url = server.set_file("/file.bin", payload(SIZE))
+    path = str(tmp_path / "out.bin")
+    server.fail = 1
+    _fail_once(url, path, write_mode)
+    # a new version while the probe of the first run is still cached
+    new = payload(SIZE + 5, seed=3)
+    server.set_file("/file.bin", new)
+    Downloader(url, f=path, t=3, write_mode=write_mode).start()
+    assert open(path, "rb").read() == new
+
+
+def test_resume_drops_a_corrupt_segment(server, tmp_path, cache_dir):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    path = str(tmp_path / "out.bin")
+    server.fail = 1
+    _fail_once(url, path, "parts")
+    parts = sorted(cache_dir.glob("*.part.*"), key=lambda p: p.stat().st_size)
+    # flip the last byte of the biggest part file, what was written since the last checkpoint is always checked
+    with open(parts[-1], "r+b") as f:
+        f.seek(-1, 2)
+        b = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([b[0] ^ 0xFF]))
+    Downloader(url, f=path, t=3).start()
+    assert open(path, "rb").read() == data
+
+
+def test_async_resume_after_the_file_changed(server, tmp_path):
+    import asyncio
+
+    from dl import AsyncDownloader
+
+    url = server.set_file("/file.bin", payload(SIZE))
+    path = str(tmp_path / "out.bin")
+    server.fail = 1
+    d = AsyncDownloader(url, f=path, t=3)
+    d.segment_retries = 0
+    with pytest.raises(IncompleteDownloadError):
+        asyncio.run(d.start())
+    new = payload(SIZE, seed=4)
+    server.set_file("/file.bin", new)
+    asyncio.run(AsyncDownloader(url, f=path, t=3).start())
+    assert open(path, "rb").read() == new
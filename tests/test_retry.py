@@ -0,0 +1,45 @@
+import pytest
+
+from dl import Downloader
+from dl.events import SEGMENT_RETRY
+from dl.segments import DONE, FAILED
+from dl.util import IncompleteDownloadError, TransientHTTPError
+
+from conftest import payload
+
+SIZE = 3 * 1024 * 1024
+
+
+def _downloader(url, path):
+    d = Downloader(url, f=path, t=3)
+    d.retry_backoff = 0.01
+    return d
+
+
+def test_segments_are_retried(server, tmp_path):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    server.fail = 2
+    events = []
+    d = _downloader(url, str(tmp_path / "out.bin"))
+    d.add_listener(events.append)
+    d.start()
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert all(i.status == DONE for i in d.segment_status)
+    assert sum(i.retries for i in d.segment_status) == 2
+    retries = [i for i in events if i.type == SEGMENT_RETRY]
+    assert len(retries) == 2
+    assert all(isinstance(i.error, TransientHTTPError) for i in retries)
+
+
+def test_segment_given_up(server, tmp_path):
+    url = server.set_file("/file.bin", payload(SIZE))
+    server.fail = 1000
+    d = _downloader(url, str(tmp_path / "out.bin"))
+    d.segment_retries = 2
+    with pytest.raises(IncompleteDownloadError):
+        d.start()
+    failed = [i for i in d.segment_status if i.status == FAILED]
+    assert failed
+    assert all(i.retries == 2 for i in failed)
+    assert all(i.error.status_code == 503 for i in failed)
@@ -0,0 +1,52 @@
+from dl.segments import SegmentScheduler, remaining
+
+MB = 1024 * 1024
+
+
+def _segments(*sizes):
+    res, start = [], 0
+    for i, size in enumerate(sizes):
+        seg = {"file_index": i, "completed": 0, "crc": 0}
+        SegmentScheduler._resize(seg, start, start + size - 1)
+        res.append(seg)
+        start += size
+    return res
+
+
+def test_idle_thread_steals_half_of_the_largest():
+    segs = _segments(4 * MB, 8 * MB)
+    s = SegmentScheduler(segs, min_size=MB)
+    a, b = s.next(), s.next()
+    assert (a["file_index"], b["file_index"]) == (0, 1)
+    assert s.reserve(b, b["from"], 2 * MB) == 2 * MB
+    stolen = s.next()
+    # the 6MB b has left are split in two
+    assert (stolen["from"], stolen["to"]) == (b["from"] + 5 * MB, 12 * MB - 1)
+    assert b["to"] == b["from"] + 5 * MB - 1
+    # b's reads stop at its new end
+    assert s.reserve(b, b["from"] + 2 * MB, 4 * MB) == 3 * MB
+    assert sum(i["file_size"] for i in s.segments) == 12 * MB
+
+
+def test_small_segments_are_not_split():
+    segs = _segments(MB, MB)
+    s = SegmentScheduler(segs, min_size=MB)
+    s.next(), s.next()
+    assert s.next() is None
+    assert not s.has_work()
+
+
+def test_released_and_failed_segments():
+    segs = _segments(MB, MB)
+    s = SegmentScheduler(segs, min_size=MB)
+    a, b = s.next(), s.next()
+    a["completed"] = 1000
+    s.release(a)
+    s.give_up(b)
+    s.release(b)
+    # what is left of a is handed out again, b is not
+    assert s.next() is a
+    assert remaining(a) == MB - 1000
+    s.release(a)
+    a["completed"] = MB
+    assert s.next() is None
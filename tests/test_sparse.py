@@ -0,0 +1,91 @@
+import pytest
+
+from dl.sparse import (
+    BlockMap,
+    RangeFetcher,
+    SparseFile,
+    merge_ranges,
+    read_ranges,
+    resolve_ranges,
+)
+from dl.URL import URL
+
+from conftest import payload
+
+SIZE = 300 * 1024 + 17
+
+
+def test_resolve_and_merge_ranges():
+    assert resolve_ranges([(-10, None), (5, None), (0, 10**9)], 100) == [
+        (90, 99),
+        (5, 99),
+        (0, 99),
+    ]
+    with pytest.raises(ValueError):
+        resolve_ranges([(100, None)], 100)
+    assert merge_ranges([(10, 19), (0, 4), (22, 30)], gap=2) == [(0, 4), (10, 30)]
+
+
+@pytest.mark.parametrize("ranges", ["multi", "single", None])
+def test_read_ranges(make_server, ranges):
+    server = make_server(ranges)
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    wanted = [(0, 29), (-1000, None), (100_000, 100_099), (100_200, 100_300)]
+    got = read_ranges(RangeFetcher(URL(url)), wanted)
+    assert got == [
+        data[0:30],
+        data[-1000:],
+        data[100_000:100_100],
+        data[100_200:100_301],
+    ]
+
+
+def test_multirange_is_learned(make_server):
+    server = make_server("single")
+    url = server.set_file("/file.bin", payload(SIZE))
+    fetcher = RangeFetcher(URL(url), threads=1)
+    fetcher.merge_gap = 0
+    read_ranges(fetcher, [(0, 9), (200_000, 200_009)])
+    assert fetcher.multirange is False
+
+
+@pytest.mark.parametrize("ranges", ["multi", None])
+def test_sparse_file_gap_between_reads(make_server, tmp_path, ranges):
+    server = make_server(ranges)
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    path = str(tmp_path / "sparse.bin")
+    f = SparseFile(RangeFetcher(URL(url)), path, block_size=1024)
+    # less than merge_gap apart, requested as one if the server does ranges
+    f.fetch([(0, 1023), (10 * 1024, 11 * 1024 - 1)])
+    assert f.read(4096, 5000) == data[4096:5001]
+    assert f.read(-100) == data[-100:]
+
+
+def test_sparse_file_reuses_blocks(server, tmp_path):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    path = str(tmp_path / "sparse.bin")
+    SparseFile(RangeFetcher(URL(url)), path).fetch([(70_000, 80_000)])
+    server.log.clear()
+    f = SparseFile(RangeFetcher(URL(url)), path)
+    assert f.fetch([(70_000, 80_000)]) == []
+    assert f.read(65536, 131071) == data[65536:131072]
+    assert not [i for i in server.log if i[2] and i[2] != "bytes=0-65535"]
+    # a new version of the file starts the sparse file over
+    data2 = payload(SIZE, seed=1)
+    server.set_file("/file.bin", data2)
+    f = SparseFile(RangeFetcher(URL(url)), path)
+    assert f.read(70_000, 70_100) == data2[70_000:70_101]
+
+
+def test_block_map():
+    blocks = BlockMap(10_000, 1000)
+    blocks.add((500, 2999))
+    # only whole blocks count
+    assert blocks.missing([(0, 3999)]) == [(0, 999), (3000, 3999)]
+    blocks.add((9000, 9999))
+    assert 9 in blocks
+    restored = BlockMap.from_dict(blocks.to_dict())
+    assert restored.missing([(0, 9999)]) == blocks.missing([(0, 9999)])
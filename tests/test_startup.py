@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+from os.path import dirname, realpath
+
+import pytest
+
+import dl
+
+ROOT = dirname(dirname(realpath(__file__)))
+HEAVY = ["requests", "urllib3", "asyncio", "ssl", "sqlite3", "http.client"]
+
+
+def _imported_after(code: str) -> list:
+    script = f"import sys\n{code}\nprint(__import__('json').dumps(sorted(sys.modules)))"
+    p = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(p.stdout.splitlines()[-1])
+
+
+def test_import_is_light():
+    modules = _imported_after("import dl")
+    assert [i for i in HEAVY if i in modules] == []
+
+
+def test_lazy_attributes():
+    modules = _imported_after("import dl\ndl.AsyncDownloader")
+    assert "asyncio" in modules
+    assert "requests" not in modules
+    with pytest.raises(AttributeError):
+        dl.NoSuchThing
+
+
+def test_mime_types_read_on_demand():
+    modules = _imported_after(
+        "import dl.URL.util as u\nassert u._mime_types is None\nassert u.mime_types\nassert u._mime_types"
+    )
+    assert "dl.URL.util" in modules
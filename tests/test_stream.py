@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import subprocess
+import sys
+from io import BytesIO
+from os.path import dirname, join, realpath
+
+import pytest
+
+from dl import AsyncDownloader, Downloader
+from dl.stream import MAX_CHUNK, MIN_CHUNK, ChunkSizer, stream_response
+
+from conftest import payload
+
+DOWNLOAD_PY = join(dirname(dirname(realpath(__file__))), "download.py")
+SIZE = 6 * 1024 * 1024 + 5
+
+
+def _small_buffer(d):
+    # several segments have to wait for the consumer
+    d.stream_buffer_size = 1024 * 1024
+    d.min_segment_size = 128 * 1024
+    d.buffer_size = 64 * 1024
+    return d
+
+
+@pytest.mark.parametrize("ranges", ["multi", None])
+def test_iter_bytes_in_order(make_server, ranges):
+    server = make_server(ranges)
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    digest = "sha256:" + hashlib.sha256(data).hexdigest()
+    d = _small_buffer(Downloader(url, t=4, digest=digest))
+    assert b"".join(d.iter_bytes()) == data
+    assert d.file_digest == digest[7:]
+
+
+def test_stream_when_the_file_name_exists(server, tmp_path):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    (tmp_path / "file.bin").write_bytes(b"old")
+    out = BytesIO()
+    assert Downloader(url, t=3).stream_to(out) == SIZE
+    assert out.getvalue() == data
+    assert (tmp_path / "file.bin").read_bytes() == b"old"
+    # saving it still refuses to overwrite it
+    with pytest.raises(FileExistsError):
+        Downloader(url, t=3).start()
+
+
+def test_stdout_when_the_file_name_exists(server, tmp_path):
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    (tmp_path / "file.bin").write_bytes(b"old")
+    p = subprocess.run(
+        [sys.executable, DOWNLOAD_PY, url, "--stdout", "--cache-dir", "cache"],
+        capture_output=True,
+    )
+    assert p.returncode == 0, p.stderr
+    assert p.stdout == data
+
+
+@pytest.mark.parametrize("ranges", ["multi", None])
+def test_async_iter_bytes(make_server, tmp_path, ranges):
+    server = make_server(ranges)
+    data = payload(SIZE)
+    url = server.set_file("/file.bin", data)
+    (tmp_path / "file.bin").write_bytes(b"old")
+
+    async def consume():
+        d = _small_buffer(AsyncDownloader(url, t=4))
+        chunks = []
+        async for chunk in d.iter_bytes():
+            # a slow consumer
+            await asyncio.sleep(0)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    assert asyncio.run(consume()) == data
+
+
+def test_async_stream_stopped_early(server):
+    url = server.set_file("/file.bin", payload(SIZE))
+
+    async def consume():
+        d = _small_buffer(AsyncDownloader(url, t=4))
+        stream = d.iter_bytes()
+        async for chunk in stream:
+            break
+        await stream.aclose()
+        return d
+
+    d = asyncio.run(asyncio.wait_for(consume(), 30))
+    assert d._reorder is None
+
+
+class _Raw(BytesIO):
+    headers = {}
+
+
+class _Response(object):
+    def __init__(self, data):
+        self.raw = _Raw(data)
+
+
+def test_stream_response_writes_whole_buffers():
+    data = payload(5 * 1024 * 1024 + 17)
+    writes = []
+    n = stream_response(
+        _Response(data),
+        lambda b: writes.append(bytes(b)),
+        chunk_size=64 * 1024,
+        buffer_size=1024 * 1024,
+    )
+    assert n == len(data)
+    assert b"".join(writes) == data
+    # the reads are gathered into buffer sized writes
+    assert [len(i) for i in writes[:-1]] == [1024 * 1024] * 5
+
+
+def test_chunk_size_follows_the_throughput():
+    sizer = ChunkSizer(target=0.05)
+    for _ in range(20):
+        size = sizer.update(sizer.size, sizer.size / 1e9)
+    assert size == MAX_CHUNK
+    for _ in range(20):
+        size = sizer.update(sizer.size, sizer.size / 1e5)
+    assert size == MIN_CHUNK
@@ -0,0 +1,78 @@
+from dl import Downloader
+from dl.tuning import ConnectionTuner, learned_connections, save_connections
+
+from conftest import payload
+
+MB = 1024 * 1024
+
+
+def _run(tuner, seconds, throughput, throttled=lambda n: 0):
+    """drive `tuner` with a host that serves `throughput(n)` bytes per second over n connections"""
+    now, total, n = 0.0, 0.0, tuner.connections
+    while now < seconds:
+        now += 0.05
+        total += throughput(n) * 0.05
+        n = tuner.update(now, int(total), throttled(n))
+    return n
+
+
+def test_grows_until_the_throughput_levels_off():
+    tuner = ConnectionTuner(2, max_connections=16)
+    n = _run(tuner, 30, lambda n: min(n, 6) * MB)
+    assert n == tuner.best == 6
+    assert tuner.learned and not tuner.growing
+
+
+def test_backs_off_when_throttled():
+    tuner = ConnectionTuner(4, max_connections=16)
+    # the server answers 429 once more than 8 connections are open
+    throttles = []
+
+    def throttled(n):
+        if n > 8 and not throttles:
+            throttles.append(n)
+        return len(throttles)
+
+    n = _run(tuner, 30, lambda n: n * MB, throttled)
+    # 4, 6, 9 and a quarter of them dropped, never to grow past that again
+    assert n == tuner.best == 7
+
+
+def test_learned_connections(cache_dir):
+    assert learned_connections("example.com") is None
+    save_connections("example.com", 5)
+    assert learned_connections("example.com") == 5
+
+
+class _TunedDownloader(Downloader):
+    """notes the workers `_retune` starts and retires, and throttles the server once it has grown"""
+
+    tune_interval = 0.02
+
+    def __init__(self, *args, server=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server
+        self.started, self.retired = 0, 0
+
+    def _retune(self, alive):
+        start = super()._retune(alive)
+        self.started += start
+        if self.threads >= 4 and not self.retired:
+            # the server starts answering 503
+            self.server.fail = 2
+        self.retired = max(self.retired, self._retire)
+        return start
+
+
+def test_auto_connections_download(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(ConnectionTuner, "settle_time", 0.05)
+    monkeypatch.setattr(ConnectionTuner, "sample_time", 0.1)
+    # about 1.6 MB/s a connection, more connections are faster
+    server.delay, server.block = 0.01, 16 * 1024
+    data = payload(6 * MB)
+    url = server.set_file("/file.bin", data)
+    d = _TunedDownloader(url, f=str(tmp_path / "out.bin"), t="auto", server=server)
+    d.start()
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert d.started > 0
+    assert d.retired > 0